@@ -3,7 +3,7 @@ Assessment frame for health questionnaire
 """
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models import get_db, Assessment
+from models import get_db, Assessment, record_assessment
 from utils import get_assessment_questions, calculate_risk_score, generate_recommendations
 
 
@@ -293,7 +293,8 @@ class AssessmentFrame:
                 recommendations=recommendations
             )
             
-            db.add(assessment)
+            # Counters are updated in the same transaction as the insert
+            record_assessment(db, assessment, location=self.user.get('location'))
             db.commit()
             
             # Show result
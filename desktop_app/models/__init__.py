@@ -1,6 +1,12 @@
 """Database models for desktop application"""
-from .database import init_database, get_db, User, Assessment, Alert
+from .database import (
+    init_database, get_db, User, Assessment, Alert, UserRiskSummary, RiskCounter,
+    record_assessment, get_risk_analytics, get_location_risk_distribution
+)
 
-__all__ = ['init_database', 'get_db', 'User', 'Assessment', 'Alert']
+__all__ = [
+    'init_database', 'get_db', 'User', 'Assessment', 'Alert', 'UserRiskSummary', 'RiskCounter',
+    'record_assessment', 'get_risk_analytics', 'get_location_risk_distribution'
+]
 
 
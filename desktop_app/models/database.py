@@ -2,9 +2,14 @@
 Database models using SQLAlchemy for desktop application
 """
 import os
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Float, Text, DateTime, ForeignKey, JSON
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import create_engine, and_, case, literal, Column, Integer, String, Boolean, Float, Text, DateTime, ForeignKey, JSON
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, relationship
 import bcrypt
 
@@ -92,6 +97,206 @@ class Alert(Base):
         return f'<Alert {self.title}>'
 
 
+class UserRiskSummary(Base):
+    """Latest risk per user, maintained alongside assessment inserts"""
+    __tablename__ = 'user_risk_summaries'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    risk_level = Column(String(20), nullable=False)
+    risk_score = Column(Float, nullable=False)
+    assessed_at = Column(DateTime, nullable=False)
+    assessment_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<UserRiskSummary {self.user_id} - {self.risk_level}>'
+
+
+class RiskCounter(Base):
+    """Running assessment counts per risk level
+
+    One row per (scope, key): scope 'global' has a single '' key, scope
+    'location' is keyed by the user's location and scope 'day' by the
+    ISO date of the assessment.
+    """
+    __tablename__ = 'risk_counters'
+
+    scope = Column(String(20), primary_key=True)
+    key = Column(String(200), primary_key=True)
+    low = Column(Integer, default=0, nullable=False)
+    moderate = Column(Integer, default=0, nullable=False)
+    high = Column(Integer, default=0, nullable=False)
+
+    @property
+    def total(self):
+        return self.low + self.moderate + self.high
+
+    def __repr__(self):
+        return f'<RiskCounter {self.scope}:{self.key}>'
+
+
+# Maps Assessment.risk_level values onto RiskCounter columns
+RISK_COUNTER_COLUMNS = {'Low': 'low', 'Moderate': 'moderate', 'High': 'high'}
+
+
+def _upsert(session, table, keys, values, update):
+    """INSERT values, or UPDATE the existing row with the same keys
+
+    update(new) returns {column: expression}, where new refers to the
+    values that failed to insert. One statement, so concurrent first
+    inserts of the same row cannot fail on the unique key.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if dialect == 'sqlite' else postgresql_insert)(table).values(**values)
+        session.execute(stmt.on_conflict_do_update(index_elements=keys, set_=update(stmt.excluded)))
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(table).values(**values)
+        session.execute(stmt.on_duplicate_key_update(**update(stmt.inserted)))
+    else:
+        # No upsert syntax: insert in a savepoint and update if another writer got there first
+        try:
+            with session.begin_nested():
+                session.execute(table.insert().values(**values))
+        except IntegrityError:
+            new = SimpleNamespace(**{name: literal(value, table.c[name].type) for name, value in values.items()})
+            condition = and_(*(table.c[key] == values[key] for key in keys))
+            session.execute(table.update().where(condition).values(**update(new)))
+
+
+def _risk_counter_update(new):
+    table = RiskCounter.__table__
+    return {column: table.c[column] + getattr(new, column) for column in ('low', 'moderate', 'high')}
+
+
+def _risk_summary_update(new):
+    table = UserRiskSummary.__table__
+    newer = new.assessed_at >= table.c.assessed_at
+    # assessed_at last: MySQL applies the assignments in order
+    return {
+        'assessment_count': table.c.assessment_count + new.assessment_count,
+        'risk_level': case((newer, new.risk_level), else_=table.c.risk_level),
+        'risk_score': case((newer, new.risk_score), else_=table.c.risk_score),
+        'assessed_at': case((newer, new.assessed_at), else_=table.c.assessed_at),
+    }
+
+
+def update_risk_stats(session, entries):
+    """Fold newly inserted assessments into the materialized counters
+
+    Runs inside the caller's transaction, so the counters commit or roll
+    back together with the assessment rows. Each entry is a dict with
+    user_id, location, risk_level, risk_score and created_at.
+    """
+    deltas = {}
+    latest = {}
+    for entry in entries:
+        column = RISK_COUNTER_COLUMNS.get(entry['risk_level'])
+        if column is None:
+            continue
+        created_at = entry.get('created_at') or datetime.utcnow()
+        location = (entry.get('location') or '').strip()
+        for scope, key in (('global', ''), ('location', location), ('day', created_at.date().isoformat())):
+            counts = deltas.setdefault((scope, key), {'low': 0, 'moderate': 0, 'high': 0})
+            counts[column] += 1
+
+        summary = latest.get(entry['user_id'])
+        if summary is None:
+            summary = latest[entry['user_id']] = {'count': 0, 'created_at': None}
+        summary['count'] += 1
+        if summary['created_at'] is None or created_at >= summary['created_at']:
+            summary.update(created_at=created_at, risk_level=entry['risk_level'], risk_score=entry['risk_score'])
+
+    for (scope, key), counts in deltas.items():
+        # Increment in SQL so concurrent writers never lose updates
+        _upsert(session, RiskCounter.__table__, ['scope', 'key'], dict(counts, scope=scope, key=key),
+                _risk_counter_update)
+
+    # Flush pending ORM rows first; the upserts below are plain SQL statements
+    session.flush()
+    for user_id, summary in latest.items():
+        _upsert(session, UserRiskSummary.__table__, ['user_id'], {
+            'user_id': user_id,
+            'risk_level': summary['risk_level'],
+            'risk_score': summary['risk_score'],
+            'assessed_at': summary['created_at'],
+            'assessment_count': summary['count'],
+        }, _risk_summary_update)
+
+
+def record_assessment(session, assessment, location=None):
+    """Add an assessment and update the risk counters in the same transaction"""
+    if assessment.created_at is None:
+        assessment.created_at = datetime.utcnow()
+    session.add(assessment)
+    update_risk_stats(session, [{
+        'user_id': assessment.user_id,
+        'location': location,
+        'risk_level': assessment.risk_level,
+        'risk_score': assessment.risk_score,
+        'created_at': assessment.created_at,
+    }])
+
+
+def get_risk_analytics(session, days=None, location=None):
+    """Read assessment counts from the materialized counters
+
+    Without arguments this is a single primary-key lookup; with days it
+    sums at most one row per day.
+    """
+    if days:
+        start = (datetime.utcnow() - timedelta(days=days - 1)).date().isoformat()
+        rows = session.query(RiskCounter).filter(RiskCounter.scope == 'day', RiskCounter.key >= start).all()
+    elif location is not None:
+        rows = session.query(RiskCounter).filter_by(scope='location', key=location.strip()).all()
+    else:
+        rows = session.query(RiskCounter).filter_by(scope='global', key='').all()
+
+    analytics = {'low': 0, 'moderate': 0, 'high': 0}
+    for row in rows:
+        analytics['low'] += row.low
+        analytics['moderate'] += row.moderate
+        analytics['high'] += row.high
+    analytics['total'] = analytics['low'] + analytics['moderate'] + analytics['high']
+    analytics['days'] = days
+    return analytics
+
+
+def get_location_risk_distribution(session):
+    """Return {location: {'low', 'moderate', 'high', 'total'}} from the counters"""
+    return {
+        row.key: {'low': row.low, 'moderate': row.moderate, 'high': row.high, 'total': row.total}
+        for row in session.query(RiskCounter).filter_by(scope='location').all()
+    }
+
+
+def rebuild_risk_counters(session):
+    """Recompute all counters from the assessments table
+
+    Only needed once for databases created before the counters existed,
+    or after rows were changed outside the application.
+    """
+    session.query(RiskCounter).delete(synchronize_session=False)
+    session.query(UserRiskSummary).delete(synchronize_session=False)
+    rows = session.query(
+        Assessment.user_id, User.location, Assessment.risk_level,
+        Assessment.risk_score, Assessment.created_at
+    ).join(User, User.id == Assessment.user_id).yield_per(1000)
+    batch = []
+    for user_id, location, risk_level, risk_score, created_at in rows:
+        batch.append({
+            'user_id': user_id,
+            'location': location,
+            'risk_level': risk_level,
+            'risk_score': risk_score,
+            'created_at': created_at,
+        })
+        if len(batch) >= 1000:
+            update_risk_stats(session, batch)
+            batch = []
+    if batch:
+        update_risk_stats(session, batch)
+
+
 def init_database():
     """Initialize database and create tables"""
     Base.metadata.create_all(engine)
@@ -114,6 +319,11 @@ def init_database():
             session.add(admin)
             session.commit()
             print(f"Created default admin user: {admin_email} / {admin_password}")
+
+        # Backfill counters for databases that predate them
+        if session.query(RiskCounter).first() is None and session.query(Assessment).first() is not None:
+            rebuild_risk_counters(session)
+            session.commit()
     except Exception as e:
         session.rollback()
         print(f"Error initializing database: {e}")
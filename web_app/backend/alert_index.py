@@ -0,0 +1,248 @@
+"""
+In-memory index of active alerts by target location
+
+Maps canonical state names (see covid_data.canonical_state) to the IDs of
+active alerts targeted at them, so per-user alert lookups are a dictionary
+hit instead of a query. The index follows committed changes to Alert rows
+through session events, so every code path that creates, deactivates or
+deletes an alert keeps it current.
+"""
+import json
+import secrets
+import threading
+
+from sqlalchemy import event
+
+from models import SessionLocal, get_db, Alert, encode_cursor, decode_cursor
+from covid_data import location_key
+
+
+def alert_summary(alert):
+    """Detached snapshot of the Alert columns the index serves"""
+    return {
+        'id': alert.id,
+        'title': alert.title,
+        'message': alert.message,
+        'target_location': alert.target_location,
+        'is_active': alert.is_active,
+        'created_at': alert.created_at,
+    }
+
+
+def alert_api_dict(summary):
+    """JSON representation of an alert served by /api/alerts"""
+    return {
+        'id': summary['id'],
+        'title': summary['title'],
+        'message': summary['message'],
+        'target_location': summary['target_location'],
+        'created_at': summary['created_at'].isoformat() if summary['created_at'] else None,
+    }
+
+
+class AlertIndex:
+    """Active alerts keyed by location, updated incrementally"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._alerts = {}        # alert id -> summary
+        self._by_location = {}   # location key -> set of alert ids
+        self._untargeted = set() # alerts shown to every location
+        self._sorted = {}        # cache key (see _cache_key) -> newest-first summaries
+        self._json = {}          # alert id -> pre-encoded API JSON
+        self._bodies = {}        # cache key -> (version, pre-encoded unpaginated API body)
+        self.loaded = False
+        self.version = 0
+        # Distinguishes ETags across restarts, when version starts over
+        self.boot_id = secrets.token_hex(4)
+
+    def load(self, session=None):
+        """(Re)build the index from the active alerts in the database"""
+        db = session or get_db()
+        try:
+            alerts = [alert_summary(alert) for alert in db.query(Alert).filter_by(is_active=True)]
+        finally:
+            if session is None:
+                db.close()
+        with self._lock:
+            self._alerts.clear()
+            self._by_location.clear()
+            self._untargeted.clear()
+            self._json.clear()
+            for summary in alerts:
+                self._insert(summary)
+            self._changed()
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def apply(self, summary):
+        """Add, update or drop an alert according to its is_active flag"""
+        with self._lock:
+            self._remove(summary['id'])
+            if summary['is_active']:
+                self._insert(summary)
+            self._changed()
+
+    def discard(self, alert_id):
+        """Remove an alert (e.g. after it was deleted)"""
+        with self._lock:
+            self._remove(alert_id)
+            self._changed()
+
+    def for_location(self, location, limit=None):
+        """Active alerts for a location (plus untargeted ones), newest first"""
+        self.ensure_loaded()
+        alerts = self._sorted.get(self._cache_key(location_key(location)))
+        if alerts is None:
+            with self._lock:
+                key = self._cache_key(location_key(location))
+                if key is _UNTARGETED_ONLY:
+                    ids = self._untargeted
+                elif key:
+                    ids = self._untargeted | self._by_location[key]
+                else:
+                    ids = self._alerts
+                alerts = sorted((self._alerts[i] for i in ids), key=_newest_first)
+                self._sorted[key] = alerts
+        return alerts[:limit] if limit else alerts
+
+    def _cache_key(self, key):
+        """Cache key for a location key
+
+        Locations that no alert targets all see just the untargeted alerts,
+        so they share one entry. The caches then grow with the alerts, not
+        with every location string a client asks about.
+        """
+        return key if not key or key in self._by_location else _UNTARGETED_ONLY
+
+    def all_active(self, limit=None):
+        """Every active alert, newest first"""
+        return self.for_location(None, limit)
+
+    @property
+    def etag(self):
+        return f'"{self.boot_id}-{self.version}"'
+
+    def api_page(self, location=None, since=None, cursor=None, limit=None):
+        """Pre-encoded /api/alerts body for a location
+
+        since keeps only alerts with a higher id (new since the last poll),
+        cursor continues after the last alert of a previous page. Returns
+        (etag, body bytes, next cursor or None). The etag is taken before
+        the alerts are read, so it can only be older than the body.
+        Raises ValueError for a malformed cursor.
+        """
+        version = self.version
+        etag = f'"{self.boot_id}-{version}"'
+        alerts = self.for_location(location)
+        key = self._cache_key(location_key(location))
+        if since is None and cursor is None and limit is None:
+            cached = self._bodies.get(key)
+            if cached is not None and cached[0] == version:
+                return etag, cached[1], None
+            body = self._encode(alerts)
+            self._bodies[key] = (version, body)
+            return etag, body, None
+
+        if since is not None:
+            alerts = [alert for alert in alerts if alert['id'] > since]
+        if cursor:
+            created_at, alert_id = decode_cursor(cursor)
+            position = _newest_first({'created_at': created_at, 'id': alert_id})
+            alerts = [alert for alert in alerts if _newest_first(alert) > position]
+        next_cursor = None
+        if limit is not None and len(alerts) > limit:
+            alerts = alerts[:limit]
+            next_cursor = encode_cursor(alerts[-1]['created_at'], alerts[-1]['id'])
+        return etag, self._encode(alerts), next_cursor
+
+    def _encode(self, alerts):
+        fragments = []
+        for alert in alerts:
+            fragment = self._json.get(alert['id'])
+            if fragment is None:
+                fragment = json.dumps(alert_api_dict(alert)).encode('utf-8')
+            fragments.append(fragment)
+        return b'[' + b', '.join(fragments) + b']'
+
+    def _insert(self, summary):
+        self._alerts[summary['id']] = summary
+        self._json[summary['id']] = json.dumps(alert_api_dict(summary)).encode('utf-8')
+        key = location_key(summary['target_location'])
+        if key:
+            self._by_location.setdefault(key, set()).add(summary['id'])
+        else:
+            self._untargeted.add(summary['id'])
+
+    def _remove(self, alert_id):
+        summary = self._alerts.pop(alert_id, None)
+        if summary is None:
+            return
+        self._json.pop(alert_id, None)
+        key = location_key(summary['target_location'])
+        ids = self._by_location.get(key)
+        if ids is not None:
+            ids.discard(alert_id)
+            if not ids:
+                del self._by_location[key]
+        self._untargeted.discard(alert_id)
+
+    def _changed(self):
+        # Callers hold the lock
+        self._sorted = {}
+        self._bodies = {}
+        self.version += 1
+
+
+# Cache key shared by the locations no alert targets
+_UNTARGETED_ONLY = None
+
+
+def _newest_first(summary):
+    return (-summary['created_at'].timestamp() if summary['created_at'] else 0, -summary['id'])
+
+
+alert_index = AlertIndex()
+
+# Callables notified with (kind, summary) after every committed alert change;
+# kind is 'created', 'updated' or 'deleted'
+_change_listeners = []
+
+
+def add_change_listener(listener):
+    """Call listener(kind, summary) after each committed Alert change"""
+    _change_listeners.append(listener)
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _collect_alert_changes(session, flush_context):
+    """Remember flushed Alert changes until the transaction commits"""
+    changes = session.info.setdefault('alert_changes', [])
+    for kind, objects in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            if isinstance(obj, Alert):
+                changes.append((kind, alert_summary(obj)))
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _apply_alert_changes(session):
+    changes = session.info.pop('alert_changes', None)
+    if not changes:
+        return
+    for kind, summary in changes:
+        # An unloaded index picks the rows up when it first loads
+        if alert_index.loaded:
+            if kind == 'deleted':
+                alert_index.discard(summary['id'])
+            else:
+                alert_index.apply(summary)
+        for listener in _change_listeners:
+            listener(kind, summary)
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _drop_alert_changes(session):
+    session.info.pop('alert_changes', None)
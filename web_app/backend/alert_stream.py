@@ -0,0 +1,126 @@
+"""
+In-process pub/sub for pushing alert changes to Server-Sent Events clients
+
+Each committed alert change is encoded into an SSE frame once and the same
+bytes are handed to every matching subscriber. Subscribers buffer at most
+MAX_PENDING frames; a client that falls further behind is disconnected and
+resumes from the replay history with Last-Event-ID when it reconnects.
+"""
+import os
+import json
+import threading
+from collections import deque
+
+from alert_index import add_change_listener, alert_api_dict
+from covid_data import location_key
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+# Frames buffered per connection before it is dropped as too slow
+MAX_PENDING = int(os.environ.get('SSE_MAX_PENDING', 100))
+# Concurrent stream connections (each one holds a server thread)
+MAX_SUBSCRIBERS = int(os.environ.get('SSE_MAX_SUBSCRIBERS', 200))
+# Recent frames kept for Last-Event-ID resume
+HISTORY_SIZE = int(os.environ.get('SSE_HISTORY_SIZE', 500))
+
+EVENT_TYPES = {
+    'created': 'alert.created',
+    'updated': 'alert.updated',
+    'deactivated': 'alert.deactivated',
+    'deleted': 'alert.deleted',
+}
+
+
+class Subscription:
+    """One connected client: a bounded queue of frames for its location"""
+
+    def __init__(self, location=None):
+        self.location = location_key(location) if location else None
+        self.overflowed = False
+        self._frames = deque()
+        self._ready = threading.Condition()
+
+    def wants(self, event_location):
+        # Untargeted alerts go to everyone; no location means every alert
+        return self.location is None or not event_location or event_location == self.location
+
+    def offer(self, frame):
+        with self._ready:
+            if len(self._frames) >= MAX_PENDING:
+                self.overflowed = True
+                self._frames.clear()
+            else:
+                self._frames.append(frame)
+            self._ready.notify()
+
+    def wait(self, timeout):
+        """Return the pending frames, waiting up to timeout seconds for one"""
+        with self._ready:
+            if not self._frames and not self.overflowed:
+                self._ready.wait(timeout)
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+
+class AlertBroker:
+    """Fans alert change events out to subscriptions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=HISTORY_SIZE)  # (event id, location key, frame)
+        self._last_id = 0
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, location=None, last_event_id=None):
+        """Register a client; returns None when the server is at capacity
+
+        With last_event_id, frames the client missed are queued right away.
+        If they have already left the history, or there are more of them
+        than a subscription buffers, a 'reset' event tells the client to
+        refetch /api/alerts instead.
+        """
+        subscription = Subscription(location)
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                return None
+            self._subscribers.add(subscription)
+            if last_event_id is not None:
+                oldest = self._history[0][0] if self._history else self._last_id + 1
+                missed = None
+                if oldest - 1 <= last_event_id <= self._last_id:
+                    missed = [frame for event_id, event_location, frame in self._history
+                              if event_id > last_event_id and subscription.wants(event_location)]
+                # Replaying more than MAX_PENDING would overflow before the client
+                # got anything, and it would resume from the same id forever
+                if missed is None or len(missed) > MAX_PENDING:
+                    missed = [f'id: {self._last_id}\nevent: reset\ndata: {{}}\n\n'.encode('utf-8')]
+                for frame in missed:
+                    subscription.offer(frame)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, kind, summary):
+        """Encode one alert change and queue it for matching subscribers"""
+        if kind == 'updated' and not summary['is_active']:
+            kind = 'deactivated'
+        data = json.dumps(alert_api_dict(summary), separators=(',', ':'))
+        event_location = location_key(summary['target_location'])
+        with self._lock:
+            self._last_id += 1
+            frame = f'id: {self._last_id}\nevent: {EVENT_TYPES[kind]}\ndata: {data}\n\n'.encode('utf-8')
+            self._history.append((self._last_id, event_location, frame))
+            subscribers = [s for s in self._subscribers if s.wants(event_location)]
+        for subscription in subscribers:
+            subscription.offer(frame)
+
+
+alert_broker = AlertBroker()
+add_change_listener(alert_broker.publish)
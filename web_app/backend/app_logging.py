@@ -0,0 +1,171 @@
+"""
+Structured, non-blocking logging
+
+Request threads never write log output themselves. setup_logging() puts a
+handler on the root logger that only drops each record on a bounded
+queue; one listener thread formats the records and writes them out:
+
+- application messages go to the console and, as JSON lines, to
+  LOG_DIR/app.log
+- the access log (one JSON line per request, see the access_log
+  middleware) goes to LOG_DIR/access.log
+
+Both files rotate at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files.
+If the queue is full, records are dropped (and counted in /metrics) rather
+than making a request wait for the disk.
+
+High-volume routes can be sampled with ACCESS_LOG_SAMPLE, e.g.
+"serve_static=0.05,serve_api_alerts=0.25" (route name = fraction
+logged; routes registered without a name use their handler's name).
+Errors and slow requests are always logged.
+"""
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from pathlib import Path
+
+from metrics import metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_DIR = Path(os.environ.get('LOG_DIR', Path(__file__).parent / 'logs'))
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+# Records waiting for the listener before new ones are dropped
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+# Also print access log lines on the console (they always go to access.log)
+ACCESS_LOG_CONSOLE = os.environ.get('ACCESS_LOG_CONSOLE', '').lower() in ('1', 'true', 'yes')
+
+ACCESS_LOGGER = 'access'
+access_logger = logging.getLogger(ACCESS_LOGGER)
+
+# Attributes every LogRecord has; anything else was passed in extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+metrics.counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+
+def parse_sample_rates(value):
+    """Parse "route=fraction,..." into a dict; bad entries are ignored"""
+    rates = {}
+    for item in value.split(','):
+        name, _, rate = item.partition('=')
+        try:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+ACCESS_LOG_SAMPLE = parse_sample_rates(os.environ.get('ACCESS_LOG_SAMPLE', ''))
+
+
+def should_log_access(route, status, slow):
+    """Decide whether a request goes into the access log"""
+    if status >= 400 or slow:
+        return True
+    rate = ACCESS_LOG_SAMPLE.get(route, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        message = record.getMessage()
+        if message:
+            entry['msg'] = message
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge the arguments and render any traceback now, while they are
+        # still valid; formatting is left to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('log_records_dropped_total')
+
+
+_listener = None
+_queue_handler = None
+
+
+def _is_access(record):
+    return record.name == ACCESS_LOGGER
+
+
+def _not_access(record):
+    return record.name != ACCESS_LOGGER
+
+
+def setup_logging():
+    """Route all logging through the queue; safe to call more than once"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+    if not ACCESS_LOG_CONSOLE:
+        console.addFilter(_not_access)
+
+    app_file = logging.handlers.RotatingFileHandler(
+        LOG_DIR / 'app.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    app_file.setFormatter(JsonFormatter())
+    app_file.addFilter(_not_access)
+
+    access_file = logging.handlers.RotatingFileHandler(
+        LOG_DIR / 'access.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    access_file.setFormatter(JsonFormatter())
+    access_file.addFilter(_is_access)
+
+    records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    _queue_handler = _QueueHandler(records)
+    root.addHandler(_queue_handler)
+    # Access lines are written whatever LOG_LEVEL is; sampling controls volume
+    access_logger.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(records, console, app_file, access_file)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out everything still queued and stop the listener thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = _queue_handler = None
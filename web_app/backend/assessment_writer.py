@@ -0,0 +1,180 @@
+"""
+Write-behind batching for assessment inserts
+
+With ASSESSMENT_WRITE_BEHIND=1, request threads hand validated assessments
+to a single writer thread instead of committing them one by one. The writer
+collects whatever arrives within ASSESSMENT_FLUSH_MS (up to
+ASSESSMENT_BATCH_SIZE rows) and commits it, counters included, as one
+transaction. Each request waits for the commit of its own batch before it
+redirects, so an acknowledged assessment is always durable.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from models import get_db, update_risk_stats, Assessment
+
+WRITE_BEHIND_ENABLED = os.environ.get('ASSESSMENT_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+# Longest a submitted row waits for more rows to join its batch
+FLUSH_INTERVAL = int(os.environ.get('ASSESSMENT_FLUSH_MS', 20)) / 1000
+MAX_BATCH_SIZE = int(os.environ.get('ASSESSMENT_BATCH_SIZE', 200))
+# Rows waiting for the writer before new submissions are turned away
+MAX_QUEUED = int(os.environ.get('ASSESSMENT_QUEUE_SIZE', 5000))
+# Seconds a request waits for its batch to commit
+ACK_TIMEOUT = float(os.environ.get('ASSESSMENT_ACK_TIMEOUT', 10))
+
+
+class WriterBusy(Exception):
+    """The write queue is full or the commit was not acknowledged in time"""
+
+
+class WriteTimeout(WriterBusy):
+    """The assessment was queued, but its commit was not acknowledged in time
+
+    The writer still commits (or fails) it later and then calls the
+    on_resolved callback given to write().
+    """
+
+
+class PendingWrite:
+    """One submitted assessment waiting for its batch to commit"""
+
+    def __init__(self, values, location, on_resolved=None):
+        self.values = values
+        self.location = location
+        self.on_resolved = on_resolved
+        self.assessment_id = None
+        self.error = None
+        self._done = threading.Event()
+
+    def resolve(self, assessment_id=None, error=None):
+        self.assessment_id = assessment_id
+        self.error = error
+        self._done.set()
+        if self.on_resolved is not None:
+            self.on_resolved(assessment_id, error)
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+
+class AssessmentWriter:
+    """Single writer thread that group-commits queued assessments"""
+
+    def __init__(self, enabled=WRITE_BEHIND_ENABLED):
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=MAX_QUEUED)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def write(self, values, location=None, timeout=ACK_TIMEOUT, on_resolved=None):
+        """Queue an assessment and block until it is committed; returns its id
+
+        values are Assessment column values. timeout covers both waiting for
+        room in the queue and waiting for the commit. Raises WriterBusy when
+        the queue stays full (nothing was queued), WriteTimeout when the
+        commit is not acknowledged in time, and re-raises the error if the row
+        could not be written. on_resolved(assessment_id, error) is called
+        from the writer thread once the row is committed or has failed,
+        including after a WriteTimeout.
+        """
+        deadline = time.monotonic() + timeout
+        pending = PendingWrite(values, location, on_resolved)
+        self._ensure_started()
+        try:
+            self._queue.put(pending, timeout=timeout)
+        except queue.Full:
+            raise WriterBusy('assessment write queue is full')
+        if not pending.wait(max(deadline - time.monotonic(), 0)):
+            raise WriteTimeout('assessment write was not acknowledged in time')
+        if pending.error is not None:
+            raise pending.error
+        return pending.assessment_id
+
+    def stop(self, timeout=None):
+        """Commit everything still queued, then stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(None)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='assessment-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            stopping = False
+            while len(batch) < MAX_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        try:
+            ids = self._insert(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].resolve(error=e)
+            else:
+                # Don't fail the whole batch for one bad row: retry them one by one
+                for pending in batch:
+                    self._commit([pending])
+            return
+        for pending, assessment_id in zip(batch, ids):
+            pending.resolve(assessment_id)
+        self.batches += 1
+        self.rows += len(batch)
+
+    def _insert(self, batch):
+        db = get_db()
+        try:
+            assessments = []
+            for pending in batch:
+                values = dict(pending.values)
+                values.setdefault('created_at', datetime.utcnow())
+                assessments.append(Assessment(**values))
+            db.add_all(assessments)
+            update_risk_stats(db, [{
+                'user_id': assessment.user_id,
+                'location': pending.location,
+                'risk_level': assessment.risk_level,
+                'risk_score': assessment.risk_score,
+                'created_at': assessment.created_at,
+            } for assessment, pending in zip(assessments, batch)])
+            db.commit()
+            return [assessment.id for assessment in assessments]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+assessment_writer = AssessmentWriter()
@@ -0,0 +1,109 @@
+"""
+COVID case data and state names from statw.txt
+"""
+import os
+import re
+import logging
+import threading
+from pathlib import Path
+
+# State case counts; statw.txt at the project root by default
+COVID_DATA_FILE = Path(os.environ.get('COVID_DATA_FILE', Path(__file__).parent.parent / 'statw.txt'))
+
+log = logging.getLogger(__name__)
+
+
+def load_covid_data():
+    """Load COVID case data from statw.txt file"""
+    covid_data = {}
+    try:
+        with open(COVID_DATA_FILE, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+            # Skip header lines (first 2 lines)
+            for line in lines[2:]:
+                line = line.strip()
+                # Skip empty lines and separator lines
+                if not line or '---' in line:
+                    continue
+                # Parse the markdown table format
+                # Format: | State/UT | Cases |
+                parts = [p.strip() for p in line.split('|')]
+                # Filter out empty parts (markdown tables have empty first/last parts)
+                parts = [p for p in parts if p]
+                if len(parts) >= 2:
+                    state = parts[0].strip()
+                    # Remove commas from numbers and convert to int
+                    cases_str = parts[1].strip().replace(',', '').replace(' ', '')
+                    try:
+                        cases = int(cases_str)
+                        covid_data[state] = cases
+                    except ValueError:
+                        continue
+    except Exception as e:
+        log.warning(f"Error loading COVID data: {e}")
+    return covid_data
+
+
+_covid_data = None
+_state_lookup = None
+_cache_lock = threading.Lock()
+
+
+def get_covid_data():
+    """Case counts by state, read from statw.txt once and then cached
+    
+    The returned dict is shared; callers must not modify it.
+    """
+    global _covid_data
+    if _covid_data is None:
+        with _cache_lock:
+            if _covid_data is None:
+                _covid_data = load_covid_data()
+    return _covid_data
+
+
+def _normalize(text):
+    """Lower-case, drop parentheticals and punctuation, and collapse whitespace"""
+    text = re.sub(r'\(.*?\)', ' ', text.casefold()).replace('&', ' and ')
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+def _get_state_lookup():
+    """Map normalized spellings onto the state names used in statw.txt"""
+    global _state_lookup
+    if _state_lookup is None:
+        covid_data = get_covid_data()
+        with _cache_lock:
+            if _state_lookup is None:
+                lookup = {}
+                for state in covid_data:
+                    lookup[_normalize(state)] = state
+                    lookup[state.casefold()] = state
+                _state_lookup = lookup
+    return _state_lookup
+
+
+def canonical_state(location):
+    """Return the statw.txt state name for a free-text location, or None
+
+    Matching ignores case, punctuation and parentheticals, so "delhi",
+    "Delhi (NCT)" and "Mumbai, Maharashtra" all resolve to a state name.
+    """
+    if not location:
+        return None
+    lookup = _get_state_lookup()
+    state = lookup.get(location.strip().casefold()) or lookup.get(_normalize(location))
+    if state:
+        return state
+    # "City, State" - try the parts from the most general one
+    for part in reversed(location.split(',')):
+        state = lookup.get(_normalize(part))
+        if state:
+            return state
+    return None
+
+
+def location_key(location):
+    """Stable key for grouping by location: the canonical state name when
+    recognized, otherwise the normalized text ('' for no location)"""
+    return canonical_state(location) or _normalize(location or '')
@@ -0,0 +1,168 @@
+"""
+Opt-in SQL profiling: slow-query log, queries per request and N+1 detection
+
+Turned on with DB_PROFILE=1. Every statement run on the engine is timed;
+statements slower than SLOW_QUERY_MS are logged with their parameter
+shape (never the values). Statements run by a request are grouped by
+their SQL text, so each request gets a query count, its DB time and a
+list of its statements with the code that first issued them. A SELECT
+repeated N_PLUS_ONE_THRESHOLD or more times in one request is flagged as
+a likely N+1 pattern (typically a lazy-loaded relationship or a query
+inside a loop).
+
+Results are logged and kept in memory for /admin/debug/queries. With
+DB_PROFILE unset nothing is attached to the engine.
+"""
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+
+ENABLED = os.environ.get('DB_PROFILE', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+# Profiles of this many recent requests are kept for the debug endpoint
+RECENT_REQUESTS = 100
+MAX_SQL_LENGTH = 500
+
+_BACKEND_DIR = str(Path(__file__).parent)
+_WHITESPACE = re.compile(r'\s+')
+# An expanded IN list: (?, ?, ?) -> (?...), so lists of any length group together
+_IN_LIST = re.compile(r'\(\?(?:, \?)+\)')
+
+log = logging.getLogger(__name__)
+
+
+def normalize_sql(statement):
+    return _IN_LIST.sub('(?...)', _WHITESPACE.sub(' ', statement).strip())[:MAX_SQL_LENGTH]
+
+
+def parameter_shape(parameters, executemany):
+    """Describe the bound parameters without their values"""
+    if executemany:
+        rows = list(parameters)
+        return f'{len(rows)} rows x {len(rows[0]) if rows else 0} params'
+    return f'{len(parameters or ())} params'
+
+
+def _caller():
+    """The innermost application frame outside this module and the libraries"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_BACKEND_DIR) and filename != __file__:
+            return f'{Path(filename).name}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryProfiler:
+    """Collects per-request SQL statistics from engine events"""
+
+    def __init__(self, enabled=ENABLED, slow_ms=SLOW_QUERY_MS, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=RECENT_REQUESTS)
+        self.slow_queries = deque(maxlen=RECENT_REQUESTS)
+        self.n_plus_one = deque(maxlen=RECENT_REQUESTS)
+        self.routes = {}  # route -> {'requests', 'queries', 'max_queries', 'db_ms'}
+
+    def install(self, engine):
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def start_request(self):
+        self._local.statements = {}  # normalized SQL -> statement stats
+
+    def finish_request(self, route, request_id=None, path=None):
+        """Summarize the statements run since start_request; returns the summary"""
+        statements = getattr(self._local, 'statements', None) or {}
+        self._local.statements = None
+        queries = sum(stats['count'] for stats in statements.values())
+        db_ms = sum(stats['ms'] for stats in statements.values())
+        top = sorted(statements.items(), key=lambda item: (item[1]['count'], item[1]['ms']), reverse=True)
+        summary = {
+            'request_id': request_id,
+            'route': route,
+            'path': path,
+            'queries': queries,
+            'db_ms': round(db_ms, 2),
+            'statements': [dict(stats, sql=sql, ms=round(stats['ms'], 2)) for sql, stats in top[:10]],
+        }
+        suspects = [
+            {'request_id': request_id, 'route': route, 'sql': sql, 'count': stats['count'], 'origin': stats['origin']}
+            for sql, stats in top
+            if stats['count'] >= self.n_plus_one_threshold and sql.upper().startswith('SELECT')
+        ]
+        for suspect in suspects:
+            log.warning(f"Possible N+1 in {route}: {suspect['count']} x {suspect['sql'][:120]} "
+                        f"(from {suspect['origin']})", extra={'request_id': request_id})
+        with self._lock:
+            self.recent.append(summary)
+            self.n_plus_one.extend(suspects)
+            totals = self.routes.setdefault(route, {'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0})
+            totals['requests'] += 1
+            totals['queries'] += queries
+            totals['max_queries'] = max(totals['max_queries'], queries)
+            totals['db_ms'] += db_ms
+        return summary
+
+    def report(self):
+        """Everything collected so far, for the debug endpoint"""
+        with self._lock:
+            routes = {
+                route: dict(totals, db_ms=round(totals['db_ms'], 2),
+                            avg_queries=round(totals['queries'] / totals['requests'], 2))
+                for route, totals in self.routes.items()
+            }
+            return {
+                'enabled': self.enabled,
+                'slow_query_ms': self.slow_ms,
+                'n_plus_one_threshold': self.n_plus_one_threshold,
+                'routes': dict(sorted(routes.items(), key=lambda item: item[1]['avg_queries'], reverse=True)),
+                'recent_requests': list(self.recent)[::-1],
+                'slow_queries': list(self.slow_queries)[::-1],
+                'n_plus_one': list(self.n_plus_one)[::-1],
+            }
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['profile_started'].pop()) * 1000
+        statements = getattr(self._local, 'statements', None)
+        sql = normalize_sql(statement)
+        if elapsed_ms >= self.slow_ms:
+            entry = {'sql': sql, 'params': parameter_shape(parameters, executemany),
+                     'ms': round(elapsed_ms, 2), 'origin': _caller()}
+            log.warning(f"Slow query ({elapsed_ms:.0f}ms, {entry['params']}): {sql[:200]}")
+            with self._lock:
+                self.slow_queries.append(entry)
+        if statements is None:
+            # Not inside a request (background job or writer thread)
+            return
+        stats = statements.get(sql)
+        if stats is None:
+            stats = statements[sql] = {'count': 0, 'ms': 0.0, 'params': parameter_shape(parameters, executemany),
+                                       'origin': _caller()}
+        stats['count'] += 1
+        stats['ms'] += elapsed_ms
+
+    def _handle_error(self, context):
+        started = context.connection.info.get('profile_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+query_profiler = QueryProfiler()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Streaming CSV/NDJSON export of assessments for health authorities
+
+Rows are read through a server-side cursor and encoded chunk by chunk,
+so memory use stays flat no matter how many assessments are exported.
+
+Usage:
+    python export_assessments.py --format csv --gzip -o assessments.csv.gz
+    python export_assessments.py --format ndjson --from 2024-01-01 --risk-level High
+"""
+import io
+import csv
+import sys
+import json
+import zlib
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from models import get_db, User, Assessment
+
+EXPORT_FIELDS = ['id', 'user_id', 'location', 'created_at', 'risk_level', 'risk_score', 'answers']
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched per cursor round-trip and rows encoded per output chunk
+BATCH_SIZE = 1000
+
+
+def parse_date(value, end=False):
+    """Parse a YYYY-MM-DD (or full ISO) date; end dates include the whole day"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def iter_assessment_rows(session, start=None, end=None, risk_level=None, location=None,
+                         batch_size=BATCH_SIZE):
+    """Yield assessment rows joined with the user's location, oldest first
+
+    start is inclusive and end exclusive. The query runs with yield_per,
+    so rows are fetched from the cursor in batches instead of all at once.
+    """
+    stmt = select(
+        Assessment.id, Assessment.user_id, User.location, Assessment.created_at,
+        Assessment.risk_level, Assessment.risk_score, Assessment.answers
+    ).join(User, User.id == Assessment.user_id)
+
+    if start:
+        stmt = stmt.where(Assessment.created_at >= start)
+    if end:
+        stmt = stmt.where(Assessment.created_at < end)
+    if risk_level:
+        stmt = stmt.where(Assessment.risk_level == risk_level)
+    if location:
+        stmt = stmt.where(func.lower(User.location) == location.strip().lower())
+
+    result = session.execute(stmt.order_by(Assessment.id).execution_options(yield_per=batch_size))
+    for row in result:
+        yield {
+            'id': row.id,
+            'user_id': row.user_id,
+            'location': row.location or '',
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'risk_level': row.risk_level,
+            'risk_score': row.risk_score,
+            'answers': row.answers,
+        }
+
+
+def encode_csv(rows, chunk_rows=BATCH_SIZE):
+    """Encode rows as CSV, yielding one bytes chunk per chunk_rows rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    pending = 0
+    for row in rows:
+        row = dict(row, answers=json.dumps(row['answers'], separators=(',', ':')))
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(rows, chunk_rows=BATCH_SIZE):
+    """Encode rows as newline-delimited JSON, one bytes chunk per chunk_rows rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, separators=(',', ':')))
+        if len(lines) >= chunk_rows:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of bytes chunks into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(session, fmt='csv', compress=False, **filters):
+    """Return a generator of bytes chunks for the requested export"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {fmt}')
+    rows = iter_assessment_rows(session, **filters)
+    chunks = encode_csv(rows) if fmt == 'csv' else encode_ndjson(rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(fmt, compress=False):
+    """Suggested download name, e.g. assessments-20240101.csv.gz"""
+    name = f"assessments-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}"
+    return name + '.gz' if compress else name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export assessments as CSV or NDJSON')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--gzip', action='store_true', help='gzip-compress the output')
+    parser.add_argument('--from', dest='start', help='first day to include (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='end', help='last day to include (YYYY-MM-DD)')
+    parser.add_argument('--risk-level', choices=['Low', 'Moderate', 'High'])
+    parser.add_argument('--location', help="user's state, case-insensitive")
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    try:
+        chunks = stream_export(
+            db, args.format, args.gzip,
+            start=parse_date(args.start),
+            end=parse_date(args.end, end=True),
+            risk_level=args.risk_level,
+            location=args.location
+        )
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Synthetic users, assessments and alerts for benchmarking
+
+Fills the database with realistic-looking data at any scale:
+
+- users are spread over the states in statw.txt, weighted by their case
+  counts by default (--states zipf gives a few very hot states instead)
+- a small share of power users (--power-users) submits a large share of
+  the assessments (--power-share)
+- assessments are spread over the last --days days with morning and
+  evening peaks in the time of day
+- alerts target the same hot states, with some nationwide ones; alerts
+  older than ACTIVE_ALERT_DAYS are inactive
+
+Every user gets the same password (--password), hashed once. Rows are
+written with bulk INSERTs, one transaction per batch, and the risk
+counters are updated once at the end, so ten million rows take minutes.
+New rows are added to whatever is already in the database.
+
+Usage:
+    python generate_data.py --users 100000 --assessments 1000000
+    python generate_data.py --users 2000000 --assessments 8000000 --alerts 5000 --states zipf --seed 7
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from array import array
+from datetime import datetime, timedelta
+
+from sqlalchemy import Text, bindparam, func, insert, select
+
+from models import (
+    init_database, get_db, hash_password, add_risk_counts, RISK_COUNTER_COLUMNS,
+    User, Assessment, Alert, UserRiskSummary
+)
+from covid_data import load_covid_data
+from scoring import calculate_risk_score, generate_recommendations, get_risk_level
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_PASSWORD = 'password123'
+ACTIVE_ALERT_DAYS = 30
+
+# Relative number of assessments started in each hour of the day
+HOURLY_WEIGHTS = (
+    1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 12, 9,
+    8, 7, 6, 6, 7, 9, 12, 14, 12, 8, 4, 2,
+)
+# Probability of a "yes" to each question
+YES_RATES = {
+    'fever': 0.12, 'cough': 0.18, 'shortness_breath': 0.05, 'fatigue': 0.15, 'loss_taste_smell': 0.04,
+    'travel_history': 0.10, 'contact_positive': 0.08, 'public_transport': 0.35, 'chronic_disease': 0.12,
+    'mask_usage': 0.70, 'vaccinated': 0.80,
+}
+FIRST_NAMES = ('Aarav', 'Aditi', 'Arjun', 'Divya', 'Farhan', 'Ishaan', 'Kavya', 'Meera', 'Nikhil', 'Priya',
+               'Rahul', 'Sana', 'Tanvi', 'Vikram', 'Zoya', 'Anil', 'Deepa', 'Gaurav', 'Lakshmi', 'Rohan')
+LAST_NAMES = ('Sharma', 'Iyer', 'Khan', 'Reddy', 'Patel', 'Das', 'Nair', 'Singh', 'Gupta', 'Menon',
+              'Joshi', 'Bose', 'Kulkarni', 'Fernandes', 'Chatterjee')
+# Distinct answer sets drawn up front; each assessment picks one of them
+ANSWER_POOL_SIZE = 20000
+ALERT_TITLES = ('Containment zone update', 'Vaccination drive', 'Testing camp', 'Night curfew',
+                'Hospital bed availability', 'Travel advisory', 'Mask mandate')
+
+
+class Progress:
+    """Counts rows written and reports throughput"""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.written = 0
+        self.started = time.perf_counter()
+
+    def add(self, count):
+        self.written += count
+        elapsed = time.perf_counter() - self.started
+        rate = self.written / elapsed if elapsed > 0 else 0.0
+        print(f"  {self.label}: {self.written:,}/{self.total:,} ({rate:,.0f} rows/s)", file=sys.stderr)
+
+
+def state_weights(states, distribution, skew, rng):
+    """Cumulative weights for picking a state"""
+    if distribution == 'cases':
+        weights = [max(states[state], 1) for state in states]
+    elif distribution == 'zipf':
+        # Random order of hotness, so the hot states differ between seeds
+        ranks = list(range(len(states)))
+        rng.shuffle(ranks)
+        weights = [1 / (rank + 1) ** skew for rank in ranks]
+    else:
+        weights = [1] * len(states)
+    return cumulative(weights)
+
+
+def cumulative(weights):
+    """Running totals, for random.choices(cum_weights=...)"""
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+def timestamps(rng, count, days, now):
+    """count datetimes in the last days days, following HOURLY_WEIGHTS"""
+    start = datetime(now.year, now.month, now.day) - timedelta(days=days - 1)
+    hours = rng.choices(range(24), cum_weights=cumulative(HOURLY_WEIGHTS), k=count)
+    result = []
+    for hour in hours:
+        created_at = start + timedelta(days=rng.randrange(days), hours=hour, seconds=rng.randrange(3600))
+        # Today's later hours haven't happened yet
+        result.append(min(created_at, now))
+    return result
+
+
+class AnswerPool:
+    """Pre-drawn answer sets with their score, level and recommendations
+
+    Each distinct set is scored and JSON-encoded only once.
+    """
+
+    def __init__(self, rng, size=ANSWER_POOL_SIZE):
+        scored = {}
+        self.entries = []
+        for _ in range(size):
+            key = tuple(rng.random() < rate for rate in YES_RATES.values()) + (rng.choice((1, 2, 3, 4, 4, 5, 6, 8)),)
+            entry = scored.get(key)
+            if entry is None:
+                answers = {question: 'yes' if yes else 'no' for question, yes in zip(YES_RATES, key)}
+                answers['household_size'] = str(key[-1])
+                risk_score = calculate_risk_score(answers)
+                risk_level = get_risk_level(risk_score)
+                entry = scored[key] = (json.dumps(answers), risk_score, risk_level,
+                                       generate_recommendations(risk_level, answers))
+            self.entries.append(entry)
+
+    def draw(self, rng):
+        return self.entries[rng.randrange(len(self.entries))]
+
+
+def user_email(user_id):
+    """Email address of a generated user"""
+    return f'user{user_id}@example.com'
+
+
+def generate_users(db, count, states, cum_weights, password_hash, rng, batch_size, days, now):
+    """Insert count users; returns (first id, location of each new user)"""
+    first_id = (db.scalar(select(func.max(User.id))) or 0) + 1
+    names = list(states)
+    locations = []
+    progress = Progress('users', count)
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        batch_locations = rng.choices(names, cum_weights=cum_weights, k=size)
+        rows = []
+        for i, location in enumerate(batch_locations):
+            number = first_id + offset + i
+            # Users signed up before the assessment window
+            created_at = now - timedelta(days=days, seconds=rng.randrange(365 * 86400))
+            rows.append({
+                'id': number,
+                'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'email': user_email(number),
+                'mobile': f'9{rng.randrange(10 ** 9):09d}',
+                'password_hash': password_hash,
+                'age': rng.randint(18, 85),
+                'gender': rng.choice(('Male', 'Female', 'Other')),
+                'location': location,
+                'is_admin': False,
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+        db.execute(insert(User.__table__), rows)
+        db.commit()
+        locations.extend(batch_locations)
+        progress.add(size)
+    return first_id, locations
+
+
+def generate_assessments(db, count, first_id, locations, power_users, power_share, rng, batch_size, days, now):
+    """Insert count assessments for the new users and update the risk counters"""
+    users = len(locations)
+    power = max(1, int(users * power_users))
+    pool = AnswerPool(rng)
+    # Answers arrive already JSON-encoded from the pool
+    statement = insert(Assessment.__table__).values(answers=bindparam('answers_json', type_=Text))
+    deltas = {}
+    # Per new user: assessment count and the latest assessment
+    counts = array('q', [0]) * users
+    latest = [None] * users
+    progress = Progress('assessments', count)
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        rows = []
+        for created_at in timestamps(rng, size, days, now):
+            # The first `power` users are the power users
+            index = rng.randrange(power) if rng.random() < power_share else rng.randrange(users)
+            answers_json, risk_score, risk_level, recommendations = pool.draw(rng)
+            rows.append({
+                'user_id': first_id + index,
+                'answers_json': answers_json,
+                'risk_score': risk_score,
+                'risk_level': risk_level,
+                'recommendations': recommendations,
+                'created_at': created_at,
+            })
+            column = RISK_COUNTER_COLUMNS[risk_level]
+            for key in (('global', ''), ('location', locations[index]), ('day', created_at.date().isoformat())):
+                counter = deltas.get(key)
+                if counter is None:
+                    counter = deltas[key] = {'low': 0, 'moderate': 0, 'high': 0}
+                counter[column] += 1
+            counts[index] += 1
+            if latest[index] is None or created_at >= latest[index][0]:
+                latest[index] = (created_at, risk_level, risk_score)
+        db.execute(statement, rows)
+        db.commit()
+        progress.add(size)
+
+    # The users are new, so their summaries are too
+    summaries = [
+        {'user_id': first_id + index, 'risk_level': latest[index][1], 'risk_score': latest[index][2],
+         'assessed_at': latest[index][0], 'assessment_count': counts[index]}
+        for index in range(users) if counts[index]
+    ]
+    for start in range(0, len(summaries), batch_size):
+        db.execute(insert(UserRiskSummary.__table__), summaries[start:start + batch_size])
+    add_risk_counts(db, deltas)
+    db.commit()
+
+
+def generate_alerts(db, count, states, cum_weights, rng, batch_size, days, now):
+    """Insert count alerts from the first admin, mostly targeted at hot states"""
+    admin_id = db.scalar(select(User.id).where(User.is_admin.is_(True)).order_by(User.id).limit(1))
+    if admin_id is None:
+        raise SystemExit('error: alerts need an admin user; run init_database first')
+    names = list(states)
+    progress = Progress('alerts', count)
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        rows = []
+        targets = rng.choices(names, cum_weights=cum_weights, k=size)
+        for created_at, target in zip(timestamps(rng, size, days, now), targets):
+            title = rng.choice(ALERT_TITLES)
+            target = None if rng.random() < 0.2 else target
+            rows.append({
+                'title': f'{title} - {target or "All states"}',
+                'message': f'{title} for {target or "all states"}. Follow the guidance from local health authorities.',
+                'target_location': target,
+                'created_by': admin_id,
+                'is_active': created_at >= now - timedelta(days=ACTIVE_ALERT_DAYS),
+                'created_at': created_at,
+            })
+        db.execute(insert(Alert.__table__), rows)
+        db.commit()
+        progress.add(size)
+
+
+def generate(users, assessments, alerts, seed=1, states='cases', skew=1.2, power_users=0.01, power_share=0.3,
+             days=90, password=DEFAULT_PASSWORD, batch_size=DEFAULT_BATCH_SIZE):
+    """Add synthetic rows to the database
+
+    Returns the id of the first new user and the location of each new
+    user; their ids are consecutive.
+    """
+    if assessments and not users:
+        raise ValueError('assessments need new users to belong to')
+    rng = random.Random(seed)
+    covid_data = load_covid_data() or {'Kerala': 1}
+    cum_weights = state_weights(covid_data, states, skew, rng)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    init_database()
+    db = get_db()
+    try:
+        first_id, locations = generate_users(db, users, covid_data, cum_weights, hash_password(password),
+                                             rng, batch_size, days, now)
+        if assessments:
+            generate_assessments(db, assessments, first_id, locations, power_users, power_share,
+                                 rng, batch_size, days, now)
+        if alerts:
+            generate_alerts(db, alerts, covid_data, cum_weights, rng, batch_size, days, now)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    print(f"Generated {users:,} users, {assessments:,} assessments and {alerts:,} alerts "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return first_id, locations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill the database with synthetic users, assessments and alerts')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--assessments', type=int, default=50000)
+    parser.add_argument('--alerts', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1, help='random seed; the same seed gives the same data')
+    parser.add_argument('--states', choices=['cases', 'zipf', 'uniform'], default='cases',
+                        help='how users and alerts are spread over states (default: by case count)')
+    parser.add_argument('--skew', type=float, default=1.2, help='Zipf exponent for --states zipf (default: 1.2)')
+    parser.add_argument('--power-users', type=float, default=0.01,
+                        help='fraction of users who are power users (default: 0.01)')
+    parser.add_argument('--power-share', type=float, default=0.3,
+                        help='fraction of assessments submitted by power users (default: 0.3)')
+    parser.add_argument('--days', type=int, default=90, help='days of history (default: 90)')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD, help=f'password of every user (default: {DEFAULT_PASSWORD})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    if args.days < 1 or args.batch_size < 1 or min(args.users, args.assessments, args.alerts) < 0:
+        parser.error('sizes must not be negative, and --days and --batch-size must be positive')
+    if args.assessments and not args.users:
+        parser.error('--assessments needs --users: assessments are only added for new users')
+
+    generate(args.users, args.assessments, args.alerts, args.seed, args.states, args.skew,
+             args.power_users, args.power_share, args.days, args.password, args.batch_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
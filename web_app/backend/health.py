@@ -0,0 +1,68 @@
+"""
+Readiness checks behind /readyz
+
+Each check is a function returning (ok, details). A round of checks is
+cached for READY_CACHE_SECONDS, so probes every second from several load
+balancers cost at most one round per interval. A probe that arrives while
+a round is running gets the previous result instead of waiting for it.
+"""
+import os
+import time
+import logging
+import threading
+
+CACHE_SECONDS = float(os.environ.get('READY_CACHE_SECONDS', 1.0))
+
+log = logging.getLogger(__name__)
+
+
+class ReadinessChecks:
+    """Named checks that must all pass for the server to take traffic"""
+
+    def __init__(self, ttl=CACHE_SECONDS):
+        self.ttl = ttl
+        self._checks = {}  # name -> callable returning (ok, details dict)
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    def register(self, name, check):
+        self._checks[name] = check
+
+    @property
+    def last_ready(self):
+        """Whether the last round passed (False before the first one)"""
+        return self._result is not None and self._result[0]
+
+    def run(self):
+        """(ready, {name: details}) from the last round, or a new one once it is stale"""
+        result = self._result
+        if result is not None and time.monotonic() - self._checked_at < self.ttl:
+            return result
+        # Only one round at a time; the first one is waited for
+        if not self._lock.acquire(blocking=result is None):
+            return result
+        try:
+            if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+                self._result = self._run_checks()
+                self._checked_at = time.monotonic()
+            return self._result
+        finally:
+            self._lock.release()
+
+    def _run_checks(self):
+        ready = True
+        results = {}
+        for name, check in self._checks.items():
+            started = time.perf_counter()
+            try:
+                ok, details = check()
+            except Exception as e:
+                log.warning(f"Readiness check {name} failed: {e}")
+                ok, details = False, {'error': str(e)}
+            results[name] = dict(details, ok=ok, ms=round((time.perf_counter() - started) * 1000, 2))
+            ready = ready and ok
+        return ready, results
+
+
+readiness = ReadinessChecks()
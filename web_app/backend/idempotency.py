@@ -0,0 +1,111 @@
+"""
+Short-lived cache of idempotency keys for form submissions
+
+Forms carry a one-time token (see serve_assessment). The first request
+with a given (user_id, token) key does the work; repeats of it, whether
+they arrive while the first is still running or after it finished, get the
+first request's result instead of doing the work again. A key stays
+claimed for as long as its first request is running, however long that
+takes; repeats that give up waiting are told to try again later. Finished
+keys expire IDEMPOTENCY_TTL seconds after they were claimed. The cache
+lives in process memory, so duplicates are only caught when they reach the
+same server process.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+TTL = float(os.environ.get('IDEMPOTENCY_TTL', 600))
+MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000))
+# Longest a repeat waits for the original request to finish
+IN_FLIGHT_TIMEOUT = 15
+# claim() result for a repeat whose first request is still running
+IN_PROGRESS = object()
+
+
+class _Entry:
+    __slots__ = ('expires', 'result', 'done')
+
+    def __init__(self, expires):
+        self.expires = expires
+        self.result = None
+        self.done = threading.Event()
+
+
+class IdempotencyCache:
+    """Maps idempotency keys to the result of their first request"""
+
+    def __init__(self, ttl=TTL, max_keys=MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> _Entry, oldest first
+        self.hits = 0
+
+    def claim(self, key, timeout=IN_FLIGHT_TIMEOUT):
+        """Return (True, None) if the caller should do the work for key
+
+        Otherwise return (False, result) with the result of the request that
+        claimed it first, waiting for that request if it is still running.
+        If it fails (see release) the caller gets to do the work itself; if
+        it is still running after timeout, result is IN_PROGRESS and the
+        caller must not do the work.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._expire(now)
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = _Entry(now + self.ttl)
+                    if len(self._entries) > self.max_keys:
+                        self._evict_finished()
+                    return True, None
+            if not entry.done.wait(max(deadline - now, 0)):
+                return False, IN_PROGRESS
+            if entry.result is not None:
+                with self._lock:
+                    self.hits += 1
+                return False, entry.result
+            # The first request failed and released the key; try to claim it
+
+    def complete(self, key, result):
+        """Store the result for a claimed key and wake any waiting repeats"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            entry.result = result
+            entry.done.set()
+
+    def release(self, key):
+        """Forget a claimed key whose request failed, so a retry can run"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+    def _expire(self, now):
+        # Callers hold the lock; entries are in expiry order
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires > now:
+                break
+            if entry.done.is_set():
+                del self._entries[key]
+            else:
+                # Still running: keep it claimed for another ttl
+                entry.expires = now + self.ttl
+                self._entries.move_to_end(key)
+
+    def _evict_finished(self):
+        # Callers hold the lock. Drop the oldest finished key; keys still
+        # running are never dropped, so the cache may briefly exceed max_keys
+        for key, entry in self._entries.items():
+            if entry.done.is_set():
+                del self._entries[key]
+                return
+
+
+submission_cache = IdempotencyCache()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Bulk CSV import of users and assessments from partner clinics
+
+Rows are validated, passwords are hashed in a process pool and each batch
+is written with a single bulk INSERT inside its own transaction.
+
+Usage:
+    python import_data.py users users.csv
+    python import_data.py assessments assessments.csv --batch-size 2000
+
+Users CSV columns: name, email, mobile, password, age, gender, location
+Assessments CSV columns: email, created_at (optional ISO timestamp) and
+one column per question id (fever, cough, ..., vaccinated)
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import event, insert, select
+
+from models import engine, init_database, get_db, hash_password, update_risk_stats, User, Assessment
+from scoring import calculate_risk_score, generate_recommendations, get_risk_level
+
+DEFAULT_BATCH_SIZE = 1000
+
+USER_REQUIRED_FIELDS = ('name', 'email', 'mobile', 'password')
+QUESTION_IDS = (
+    'fever', 'cough', 'shortness_breath', 'fatigue', 'loss_taste_smell', 'travel_history',
+    'contact_positive', 'public_transport', 'chronic_disease', 'household_size',
+    'mask_usage', 'vaccinated',
+)
+
+
+class ImportStats:
+    """Counts imported and rejected rows and reports throughput"""
+
+    def __init__(self, label):
+        self.label = label
+        self.imported = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.imported / elapsed if elapsed > 0 else 0.0
+
+    def report(self, final=False):
+        prefix = 'Imported' if final else '  ...'
+        print(f"{prefix} {self.imported} {self.label}, rejected {self.rejected} "
+              f"({self.rate:,.0f} rows/s)", file=sys.stderr)
+
+
+def relax_sqlite_sync():
+    """Commit import batches with synchronous=NORMAL on SQLite
+
+    In WAL mode this skips the fsync on each commit; a power loss can undo
+    the last few batches but never corrupts the database. Only this
+    process's connections are affected, the server keeps the default FULL.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_synchronous(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+def read_batches(path, batch_size):
+    """Yield lists of (line_number, row) tuples from a CSV file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        batch = []
+        # Line 1 is the header
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            batch.append((line_number, {k.strip(): (v or '').strip() for k, v in row.items() if k}))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def reject(stats, line_number, reason):
+    stats.rejected += 1
+    print(f"line {line_number}: {reason}", file=sys.stderr)
+
+
+def validate_user(row):
+    """Return (user_values, password) for a users CSV row, or raise ValueError"""
+    missing = [field for field in USER_REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    email = row['email'].lower()
+    if '@' not in email or len(email) > 120:
+        raise ValueError(f"invalid email {row['email']!r}")
+    age = row.get('age', '')
+    if age and not age.isdigit():
+        raise ValueError(f"invalid age {age!r}")
+    return {
+        'name': row['name'][:100],
+        'email': email,
+        'mobile': row['mobile'][:20],
+        'age': int(age) if age else None,
+        'gender': row.get('gender') or None,
+        'location': row.get('location') or None,
+    }, row['password']
+
+
+def validate_assessment(row):
+    """Return (email, answers, created_at) for an assessments CSV row, or raise ValueError"""
+    email = row.get('email', '').lower()
+    if not email:
+        raise ValueError('missing email')
+    answers = {qid: row[qid] for qid in QUESTION_IDS if row.get(qid)}
+    if not answers:
+        raise ValueError('no answers')
+    created_at = row.get('created_at')
+    try:
+        created_at = datetime.fromisoformat(created_at) if created_at else datetime.utcnow()
+    except ValueError:
+        raise ValueError(f"invalid created_at {created_at!r}")
+    return email, answers, created_at
+
+
+def import_users(path, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """Import users from a CSV file, skipping emails that already exist"""
+    stats = ImportStats('users')
+    seen_emails = set()
+    db = get_db()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in read_batches(path, batch_size):
+                valid = []
+                for line_number, row in batch:
+                    try:
+                        values, password = validate_user(row)
+                    except ValueError as e:
+                        reject(stats, line_number, e)
+                        continue
+                    if values['email'] in seen_emails:
+                        reject(stats, line_number, f"duplicate email {values['email']}")
+                        continue
+                    seen_emails.add(values['email'])
+                    valid.append((line_number, values, password))
+
+                existing = set(db.scalars(
+                    select(User.email).where(User.email.in_([values['email'] for _, values, _ in valid]))
+                )) if valid else set()
+                rows = []
+                passwords = []
+                for line_number, values, password in valid:
+                    if values['email'] in existing:
+                        reject(stats, line_number, f"email already registered {values['email']}")
+                        continue
+                    rows.append(values)
+                    passwords.append(password)
+                if not rows:
+                    db.rollback()
+                    continue
+
+                # bcrypt dominates the import; spread it over all cores
+                chunksize = max(1, len(passwords) // (4 * (workers or os.cpu_count() or 1)))
+                for values, password_hash in zip(rows, pool.map(hash_password, passwords, chunksize=chunksize)):
+                    values['password_hash'] = password_hash
+
+                # One transaction per batch (the session began it with the lookup above)
+                try:
+                    db.execute(insert(User), rows)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                stats.imported += len(rows)
+                stats.report()
+    finally:
+        db.close()
+    stats.report(final=True)
+    return stats
+
+
+def import_assessments(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Import assessments for existing users, scoring each row"""
+    stats = ImportStats('assessments')
+    db = get_db()
+    try:
+        for batch in read_batches(path, batch_size):
+            valid = []
+            for line_number, row in batch:
+                try:
+                    valid.append((line_number,) + validate_assessment(row))
+                except ValueError as e:
+                    reject(stats, line_number, e)
+
+            emails = {email for _, email, _, _ in valid}
+            users = {
+                email: (user_id, location)
+                for user_id, email, location in db.execute(
+                    select(User.id, User.email, User.location).where(User.email.in_(emails))
+                )
+            } if emails else {}
+
+            rows = []
+            locations = []
+            for line_number, email, answers, created_at in valid:
+                if email not in users:
+                    reject(stats, line_number, f"unknown user {email}")
+                    continue
+                user_id, location = users[email]
+                risk_score = calculate_risk_score(answers)
+                risk_level = get_risk_level(risk_score)
+                rows.append({
+                    'user_id': user_id,
+                    'answers': answers,
+                    'risk_score': risk_score,
+                    'risk_level': risk_level,
+                    'recommendations': generate_recommendations(risk_level, answers),
+                    'created_at': created_at,
+                })
+                locations.append(location)
+            if not rows:
+                db.rollback()
+                continue
+
+            # Rows and their counter updates commit together in one transaction
+            try:
+                db.execute(insert(Assessment), rows)
+                update_risk_stats(db, [dict(row, location=location) for row, location in zip(rows, locations)])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            stats.imported += len(rows)
+            stats.report()
+    finally:
+        db.close()
+    stats.report(final=True)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import users or assessments from CSV')
+    parser.add_argument('kind', choices=['users', 'assessments'])
+    parser.add_argument('path', help='CSV file with a header row')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='password hashing processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    relax_sqlite_sync()
+    init_database()
+    if args.kind == 'users':
+        stats = import_users(args.path, args.batch_size, args.workers)
+    else:
+        stats = import_assessments(args.path, args.batch_size)
+    return 1 if stats.rejected and not stats.imported else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
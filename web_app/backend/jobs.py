@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Persistent background job queue
+
+Jobs are rows in the jobs table, so queued work survives a restart. Worker
+threads claim the highest-priority due job with a conditional UPDATE, which
+also keeps claiming safe between processes sharing the database. A claimed
+job is leased to its worker until the visibility timeout passes, and the
+lease is renewed while the handler runs; if the worker dies, the job is
+queued again once the lease runs out. Failing jobs are retried
+with exponential backoff until they run out of attempts.
+
+Handlers are registered with @job_handler (see tasks.py) and called with
+the job's payload dict; whatever JSON-serializable value they return is
+stored as the job's result.
+
+Usage:
+    python jobs.py work                       # run workers without the web server
+    python jobs.py enqueue rescore_assessments
+    python jobs.py stats
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, update, func
+
+from models import SessionLocal, get_db, init_database, Job
+from app_logging import setup_logging
+
+log = logging.getLogger(__name__)
+
+# Worker threads started with the web server
+WORKER_COUNT = int(os.environ.get('JOB_WORKERS', 2))
+# Seconds an idle worker waits before looking for due jobs again
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_SECONDS', 1.0))
+# Seconds a claimed job stays invisible to other workers
+VISIBILITY_TIMEOUT = float(os.environ.get('JOB_VISIBILITY_TIMEOUT', 300))
+# Seconds between lease renewals of a running job
+HEARTBEAT_INTERVAL = VISIBILITY_TIMEOUT / 3
+# Delay before the first retry; doubles with every further attempt
+RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 5))
+MAX_RETRY_DELAY = 3600
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+_handlers = {}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler for a job kind"""
+    def register(handler):
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def enqueue(kind, payload=None, priority=PRIORITY_NORMAL, max_attempts=3, delay=0, session=None):
+    """Queue a job and return its id
+
+    With a session, the job is added to the caller's transaction and only
+    becomes visible to workers if that transaction commits. Otherwise it
+    is committed on its own.
+    """
+    now = datetime.utcnow()
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        run_after=now + timedelta(seconds=delay),
+        created_at=now,
+    )
+    db = session or get_db()
+    try:
+        db.add(job)
+        db.flush()
+        if session is None:
+            db.commit()
+        return job.id
+    except Exception:
+        if session is None:
+            db.rollback()
+        raise
+    finally:
+        if session is None:
+            db.close()
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _note_enqueued_jobs(session, flush_context):
+    if any(isinstance(obj, Job) for obj in session.new):
+        session.info['jobs_enqueued'] = True
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        job_workers.wake()
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _drop_enqueued_jobs(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def job_dict(job):
+    """JSON-serializable view of a Job row"""
+    def iso(value):
+        return value.isoformat() if value else None
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'payload': job.payload,
+        'priority': job.priority,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_after': iso(job.run_after),
+        'locked_by': job.locked_by,
+        'locked_until': iso(job.locked_until),
+        'last_error': job.last_error,
+        'result': job.result,
+        'created_at': iso(job.created_at),
+        'started_at': iso(job.started_at),
+        'finished_at': iso(job.finished_at),
+    }
+
+
+def claim_job(session, worker_id):
+    """Lease the next due job to worker_id; returns its job_dict or None"""
+    now = datetime.utcnow()
+    candidates = session.scalars(
+        select(Job.id)
+        .where(Job.status == 'queued', Job.run_after <= now)
+        .order_by(Job.priority.desc(), Job.run_after, Job.id)
+        .limit(5)
+    ).all()
+    session.rollback()
+    for job_id in candidates:
+        # Only one claimer can flip the row from queued to running
+        claimed = session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(
+                status='running',
+                attempts=Job.attempts + 1,
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=VISIBILITY_TIMEOUT),
+                started_at=now,
+            )
+        ).rowcount
+        session.commit()
+        if claimed:
+            job = job_dict(session.get(Job, job_id, populate_existing=True))
+            session.rollback()
+            return job
+    return None
+
+
+def _holds_lease(job, worker_id):
+    """Conditions that are true while this claim of the job is still current"""
+    return (Job.id == job['id'], Job.status == 'running', Job.locked_by == worker_id,
+            Job.attempts == job['attempts'])
+
+
+def extend_lease(session, job, worker_id):
+    """Push the lease of a running job forward; False if it was already lost"""
+    extended = session.execute(
+        update(Job)
+        .where(*_holds_lease(job, worker_id))
+        .values(locked_until=datetime.utcnow() + timedelta(seconds=VISIBILITY_TIMEOUT))
+    ).rowcount
+    session.commit()
+    return bool(extended)
+
+
+def finish_job(session, job, worker_id, result=None, error=None):
+    """Record a job's outcome, scheduling a retry if it failed with attempts left
+
+    Returns the job's new status, or None (and changes nothing) if the lease
+    was lost, i.e. the job was requeued after its lease expired.
+    """
+    now = datetime.utcnow()
+    if error is None:
+        values = {'status': 'done', 'result': result, 'last_error': None}
+    elif job['attempts'] < job['max_attempts']:
+        delay = min(RETRY_BACKOFF * 2 ** (job['attempts'] - 1), MAX_RETRY_DELAY)
+        values = {'status': 'queued', 'last_error': error, 'run_after': now + timedelta(seconds=delay)}
+    else:
+        values = {'status': 'failed', 'last_error': error}
+    if values['status'] != 'queued':
+        values['finished_at'] = now
+    updated = session.execute(
+        update(Job)
+        .where(*_holds_lease(job, worker_id))
+        .values(locked_by=None, locked_until=None, **values)
+    ).rowcount
+    session.commit()
+    return values['status'] if updated else None
+
+
+def requeue_expired(session):
+    """Return jobs whose lease ran out to the queue, or fail them if out of attempts"""
+    now = datetime.utcnow()
+    expired = (Job.status == 'running', Job.locked_until < now)
+    # Idle workers call this every poll; only take the write lock when needed
+    found = session.scalar(select(Job.id).where(*expired).limit(1))
+    session.rollback()
+    if found is None:
+        return 0, 0
+    failed = session.execute(
+        update(Job)
+        .where(*expired, Job.attempts >= Job.max_attempts)
+        .values(status='failed', locked_by=None, locked_until=None, finished_at=now,
+                last_error='visibility timeout expired')
+    ).rowcount
+    requeued = session.execute(
+        update(Job)
+        .where(*expired)
+        .values(status='queued', locked_by=None, locked_until=None, run_after=now,
+                last_error='visibility timeout expired')
+    ).rowcount
+    session.commit()
+    return requeued, failed
+
+
+class JobStats:
+    """Throughput, queue latency and run time of jobs finished in this process"""
+
+    WINDOW = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=1000)  # (finished at, queue latency, run time)
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def record(self, status, queue_latency, run_time):
+        with self._lock:
+            if status == 'done':
+                self.completed += 1
+            elif status == 'failed':
+                self.failed += 1
+            elif status == 'queued':
+                self.retried += 1
+            self._recent.append((time.monotonic(), queue_latency, run_time))
+
+    def snapshot(self):
+        with self._lock:
+            recent = list(self._recent)
+            counts = {'completed': self.completed, 'failed': self.failed, 'retried': self.retried}
+        cutoff = time.monotonic() - self.WINDOW
+        latencies = sorted(latency for _, latency, _ in recent)
+        run_times = sorted(run_time for _, _, run_time in recent)
+        return dict(
+            counts,
+            jobs_per_minute=sum(1 for finished, _, _ in recent if finished >= cutoff) * 60 / self.WINDOW,
+            queue_latency_p50=_percentile(latencies, 50),
+            queue_latency_p95=_percentile(latencies, 95),
+            run_time_p50=_percentile(run_times, 50),
+            run_time_p95=_percentile(run_times, 95),
+        )
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, len(ordered) * pct // 100)], 3)
+
+
+class JobWorkers:
+    """Pool of threads that claim and run jobs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = threading.Event()
+        self.stats = JobStats()
+        self.worker_prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self, count=WORKER_COUNT):
+        with self._lock:
+            if self.running or count <= 0:
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, args=(f'{self.worker_prefix}:{n}',),
+                                 name=f'job-worker-{n}', daemon=True)
+                for n in range(count)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wake(self):
+        """Tell idle workers a job was queued instead of waiting for the next poll"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _run(self, worker_id):
+        db = get_db()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    job = claim_job(db, worker_id)
+                    if job is None:
+                        requeue_expired(db)
+                        with self._wakeup:
+                            self._wakeup.wait(POLL_INTERVAL)
+                        continue
+                    self._execute(db, job, worker_id)
+                except Exception as e:
+                    # Typically "database is locked"; back off and try again
+                    db.rollback()
+                    log.warning(f"Job worker {worker_id} error: {e}")
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            db.close()
+
+    def _execute(self, db, job, worker_id):
+        started = time.perf_counter()
+        result = error = None
+        handler = _handlers.get(job['kind'])
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, worker_id, done),
+                                     name=f"job-heartbeat-{job['id']}", daemon=True)
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise LookupError(f"no handler registered for job kind {job['kind']!r}")
+            result = handler(job['payload'])
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            done.set()
+            heartbeat.join()
+        run_time = time.perf_counter() - started
+        status = finish_job(db, job, worker_id, result, error)
+        queue_latency = (datetime.fromisoformat(job['started_at']) -
+                         datetime.fromisoformat(job['run_after'])).total_seconds()
+        self.stats.record(status, max(queue_latency, 0.0), run_time)
+        log.info(f"Job {job['id']} ({job['kind']}) {status or 'lease lost'} "
+                 f"after {run_time:.2f}s" + (f": {error}" if error else ''))
+
+    def _heartbeat(self, job, worker_id, done):
+        """Renew the job's lease until done is set, so long jobs are not handed out twice"""
+        db = get_db()
+        try:
+            while not done.wait(HEARTBEAT_INTERVAL):
+                try:
+                    if not extend_lease(db, job, worker_id):
+                        log.warning(f"Job {job['id']} lost its lease while running")
+                        return
+                except Exception as e:
+                    db.rollback()
+                    log.warning(f"Could not extend the lease of job {job['id']}: {e}")
+        finally:
+            db.close()
+
+
+job_workers = JobWorkers()
+
+
+def queue_status(session):
+    """Queue counts from the database plus this process's worker stats"""
+    now = datetime.utcnow()
+    counts = dict.fromkeys(JOB_STATUSES, 0)
+    counts.update(session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+    oldest_due = session.scalar(
+        select(func.min(Job.run_after)).where(Job.status == 'queued', Job.run_after <= now)
+    )
+    return {
+        'counts': counts,
+        # How long the oldest runnable job has been waiting; grows when workers fall behind
+        'oldest_queued_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0.0,
+        'workers': len([thread for thread in job_workers._threads if thread.is_alive()]),
+        'processed': job_workers.stats.snapshot(),
+    }
+
+
+def queue_depth(session):
+    """Jobs that are due and waiting for a worker"""
+    return session.scalar(
+        select(func.count()).select_from(Job).where(Job.status == 'queued', Job.run_after <= datetime.utcnow())
+    )
+
+
+def list_jobs(session, status=None, kind=None, limit=50):
+    """Most recent jobs, optionally filtered by status and kind"""
+    stmt = select(Job).order_by(Job.id.desc()).limit(limit)
+    if status:
+        stmt = stmt.where(Job.status == status)
+    if kind:
+        stmt = stmt.where(Job.kind == kind)
+    return [job_dict(job) for job in session.scalars(stmt)]
+
+
+def main(argv=None):
+    import tasks  # noqa: F401 -- registers the job handlers
+
+    parser = argparse.ArgumentParser(description='Run or inspect the background job queue')
+    commands = parser.add_subparsers(dest='command', required=True)
+    work = commands.add_parser('work', help='run job workers in the foreground')
+    work.add_argument('--workers', type=int, default=WORKER_COUNT)
+    add = commands.add_parser('enqueue', help='queue a job')
+    add.add_argument('kind', choices=sorted(_handlers))
+    add.add_argument('--payload', default='{}', help='JSON object passed to the handler')
+    add.add_argument('--priority', type=int, default=PRIORITY_NORMAL)
+    commands.add_parser('stats', help='print queue counts')
+    args = parser.parse_args(argv)
+
+    init_database()
+    if args.command == 'work':
+        setup_logging()
+        job_workers.start(args.workers)
+        print(f"Running {args.workers} job workers, press Ctrl+C to stop")
+        try:
+            while job_workers.running:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            job_workers.stop(timeout=5)
+    elif args.command == 'enqueue':
+        print(enqueue(args.kind, json.loads(args.payload), args.priority))
+    else:
+        db = get_db()
+        try:
+            print(json.dumps(queue_status(db), indent=2))
+        finally:
+            db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
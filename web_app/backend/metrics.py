@@ -0,0 +1,225 @@
+"""
+In-process metrics, exposed in Prometheus text format at /metrics
+
+Recording is lock-free: every thread updates its own shard of counters
+and histograms, and a scrape adds the shards up. Shards of threads that
+have finished (the server runs a thread per connection) are folded into
+a retired shard so their counts are kept without the shard list growing.
+
+A request can also be broken down into phases (time spent in the
+database, rendering templates, hashing passwords). Code that does such
+work wraps it in metrics.phase(name) or reports it with add_phase();
+the time is added to the request running on the current thread.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Histogram upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Shard:
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts, sum]
+
+
+class Metrics:
+    """Registry of counters, histograms and gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._meta = {}    # name -> (kind, help, buckets)
+        self._gauges = {}  # name -> (help, callable returning a number or {labels: number})
+
+    def counter(self, name, help):
+        self._meta[name] = ('counter', help, None)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help, tuple(buckets))
+
+    def gauge(self, name, help, read):
+        """Register a gauge whose value is read from read() at scrape time"""
+        self._gauges[name] = (help, read)
+
+    def inc(self, name, labels=(), amount=1):
+        """Add amount to a counter; labels is a tuple of (name, value) pairs"""
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        """Record one value in a histogram"""
+        histograms = self._shard().histograms
+        key = (name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            buckets = self._meta[name][2]
+            entry = histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self._meta[name][2], value)] += 1
+        entry[1] += value
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    # Per-request phases
+
+    def start_request(self):
+        """Begin collecting phase timings for the request on this thread"""
+        self._local.phases = {}
+        return self._local.phases
+
+    def end_request(self):
+        self._local.phases = None
+
+    def add_phase(self, name, seconds):
+        """Add seconds to a phase of the current request, if there is one"""
+        phases = getattr(self._local, 'phases', None)
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    # Collection
+
+    def collect(self):
+        """Return merged (counters, histograms) across all threads"""
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    # The thread is gone, so nothing else writes to this shard
+                    _merge(self._retired, shard.counters, shard.histograms)
+            self._shards = live
+            total = _Shard(None)
+            _merge(total, dict(self._retired.counters), dict(self._retired.histograms))
+        for shard in live:
+            # Copies are taken in one step each, so a concurrent insert
+            # can't break the iteration
+            _merge(total, dict(shard.counters), dict(shard.histograms))
+        return total.counters, total.histograms
+
+    def render(self):
+        """The current values in Prometheus text exposition format"""
+        counters, histograms = self.collect()
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), value in histograms.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help, buckets) in sorted(self._meta.items()):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name.get(name, ()), key=lambda item: item[0]):
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        for name, (help, read) in sorted(self._gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            values = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, number in values:
+                lines.append(f'{name}{_labels(labels)} {_number(number)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(target, counters, histograms):
+    for key, value in counters.items():
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, (counts, total) in histograms.items():
+        entry = target.histograms.get(key)
+        if entry is None:
+            target.histograms[key] = [list(counts), total]
+        else:
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def instrument_engine(engine):
+    """Time every SQL statement run on engine and count it as DB time"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        metrics.observe('db_query_duration_seconds', elapsed)
+        metrics.add_phase('db', elapsed)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # after_cursor_execute doesn't run for failed statements
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    pool = engine.pool
+    if hasattr(pool, 'checkedout'):
+        metrics.gauge('db_pool_checked_out', 'Connections currently checked out of the pool', pool.checkedout)
+    if hasattr(pool, 'size'):
+        metrics.gauge('db_pool_size', 'Configured size of the connection pool', pool.size)
+    if hasattr(pool, 'overflow'):
+        metrics.gauge('db_pool_overflow', 'Connections open beyond the pool size', pool.overflow)
+
+
+metrics = Metrics()
+metrics.counter('http_requests_total', 'Requests handled, by route, method and status')
+metrics.histogram('http_request_duration_seconds', 'Time to handle a request, by route')
+metrics.histogram('http_request_phase_seconds', 'Time spent in each phase of a request (db, render, bcrypt), by route')
+metrics.histogram('db_query_duration_seconds', 'Time to run one SQL statement')
@@ -0,0 +1,269 @@
+"""
+Middleware run once per request around the route handler
+
+dispatch() buffers what a handler writes into a Response, so each
+middleware can inspect and rewrite the complete response before it is
+sent. Routes that stream their body (exports, event streams) write to the
+socket directly; for those, request.response is None and middleware only
+sees the request.
+
+A middleware is a function middleware(request, call_next) that calls
+call_next(request) to run the rest of the chain and the handler.
+"""
+import os
+import gzip
+import time
+import logging
+import functools
+
+from app_logging import access_logger, should_log_access
+from db_profiler import query_profiler
+from metrics import metrics
+from request_body import RequestBodyError
+
+# Requests slower than this are logged
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+# Smaller bodies are sent uncompressed; gzip would not pay for its overhead
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/x-ndjson')
+# Marks the ETag of a gzipped body, which is a different representation
+GZIP_ETAG_SUFFIX = '-gzip'
+
+SECURITY_HEADERS = (
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'DENY'),
+    ('Referrer-Policy', 'same-origin'),
+)
+
+
+class Response:
+    """A buffered response: status, headers and body"""
+
+    __slots__ = ('status', 'message', 'headers', 'body')
+
+    def __init__(self):
+        self.status = None
+        self.message = None
+        self.headers = []
+        self.body = bytearray()
+
+    def get_header(self, name):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def set_header(self, name, value):
+        self.remove_header(name)
+        self.headers.append((name, value))
+
+    def remove_header(self, name):
+        name = name.lower()
+        self.headers = [(key, value) for key, value in self.headers if key.lower() != name]
+
+    def reset(self):
+        self.status = self.message = None
+        self.headers = []
+        self.body = bytearray()
+
+
+def build_pipeline(middlewares, endpoint):
+    """Compose middlewares (outermost first) around endpoint(request)"""
+    handler = endpoint
+    for middleware in reversed(middlewares):
+        handler = functools.partial(middleware, call_next=handler)
+    return handler
+
+
+log = logging.getLogger(__name__)
+
+
+def route_label(request):
+    """Name of the matched route, for logs and metrics"""
+    if request.route is not None:
+        return request.route.name
+    # Unmatched paths share a label, so scanners can't add new series
+    return 'method_not_allowed' if request.route_params else 'not_found'
+
+
+def access_log(request, call_next):
+    """Write one JSON line per request to the access log"""
+    request.default_headers = (('X-Request-ID', request.request_id),)
+    started = time.perf_counter()
+    try:
+        call_next(request)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        route = route_label(request)
+        status = request.status_code or 500
+        if should_log_access(route, status, elapsed_ms >= SLOW_REQUEST_MS):
+            user = request.user
+            path = request.path.split('?', 1)[0]
+            access_logger.info(f'{request.command} {path} {status} {elapsed_ms:.0f}ms', extra={
+                'request_id': request.request_id,
+                'method': request.command,
+                'path': path,
+                'route': route,
+                'status': status,
+                'duration_ms': round(elapsed_ms, 2),
+                'bytes': len(request.response.body) if request.response is not None else None,
+                'client': request.client_address[0],
+                'user_id': user['id'] if user else None,
+            })
+
+
+def error_capture(request, call_next):
+    """Turn an unhandled exception into a 500 instead of a dropped connection
+
+    Request bodies that are too large or too slow get their own status
+    (413, 408) from RequestBodyError.
+    """
+    try:
+        call_next(request)
+    except (BrokenPipeError, ConnectionResetError):
+        request.close_connection = True
+    except RequestBodyError as e:
+        log.info(f"Rejected request body for {request.command} {request.path}: {e}",
+                 extra={'request_id': request.request_id})
+        request.close_connection = True
+        if request.response is not None:
+            request.response.reset()
+            request.send_error(e.status, str(e))
+    except Exception as e:
+        log.exception(f"Unhandled error in {request.command} {request.path}: {e}",
+                      extra={'request_id': request.request_id})
+        if request.response is None:
+            # A streamed body may be half-written; all we can do is hang up
+            request.close_connection = True
+            return
+        request.response.reset()
+        request.send_error(500, "Internal Server Error")
+
+
+def record_metrics(request, call_next):
+    """Count the request and record its latency and phase timings by route"""
+    phases = metrics.start_request()
+    started = time.perf_counter()
+    status = None
+    try:
+        call_next(request)
+    except RequestBodyError as e:
+        status = e.status
+        raise
+    except Exception:
+        status = 500
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.end_request()
+        name = route_label(request)
+        status = status or request.status_code or 500
+        metrics.inc('http_requests_total', (('route', name), ('method', request.command), ('status', str(status))))
+        metrics.observe('http_request_duration_seconds', elapsed, (('route', name),))
+        for phase, seconds in phases.items():
+            metrics.observe('http_request_phase_seconds', seconds, (('route', name), ('phase', phase)))
+
+
+def profile_queries(request, call_next):
+    """Count the SQL each request runs, when DB_PROFILE is on (see db_profiler.py)"""
+    if not query_profiler.enabled:
+        return call_next(request)
+    query_profiler.start_request()
+    try:
+        call_next(request)
+    finally:
+        summary = query_profiler.finish_request(route_label(request), request.request_id,
+                                                request.path.split('?', 1)[0])
+        if request.response is not None:
+            request.response.set_header('X-DB-Queries', str(summary['queries']))
+
+
+def timing(request, call_next):
+    """Measure the handler and report it in a Server-Timing header"""
+    started = time.perf_counter()
+    try:
+        call_next(request)
+    finally:
+        request.elapsed = time.perf_counter() - started
+        elapsed_ms = request.elapsed * 1000
+        if request.response is not None:
+            request.response.set_header('Server-Timing', f'app;dur={elapsed_ms:.1f}')
+        if elapsed_ms >= SLOW_REQUEST_MS:
+            log.warning(f"Slow request: {request.command} {request.path} took {elapsed_ms:.0f}ms",
+                        extra={'request_id': request.request_id})
+
+
+def security_headers(request, call_next):
+    """Add the standard hardening headers to every response"""
+    request.default_headers += SECURITY_HEADERS
+    call_next(request)
+
+
+def gzip_etag(etag):
+    """The ETag of the gzipped form of a body with this (strong) ETag"""
+    if etag.startswith('"') and etag.endswith('"') and not etag.endswith(GZIP_ETAG_SUFFIX + '"'):
+        return etag[:-1] + GZIP_ETAG_SUFFIX + '"'
+    return etag
+
+
+def strip_gzip_etags(if_none_match):
+    """If-None-Match with the gzip suffix removed, as handlers compare identity ETags"""
+    return ', '.join(tag.strip().replace(GZIP_ETAG_SUFFIX + '"', '"') for tag in if_none_match.split(','))
+
+
+def compression(request, call_next):
+    """gzip text responses for clients that accept it
+    
+    A gzipped body gets its own ETag (GZIP_ETAG_SUFFIX inside the quotes), so
+    caches never answer with a body in the wrong encoding; the suffix is
+    removed from If-None-Match before the handler compares it.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    gzip_validator = bool(if_none_match) and GZIP_ETAG_SUFFIX + '"' in if_none_match
+    if gzip_validator:
+        request.headers.replace_header('If-None-Match', strip_gzip_etags(if_none_match))
+    call_next(request)
+    response = request.response
+    if response is None:
+        return
+    if response.status == 304:
+        # Confirms the representation the client validated
+        if gzip_validator and response.get_header('ETag'):
+            response.set_header('ETag', gzip_etag(response.get_header('ETag')))
+        return
+    if len(response.body) < MIN_COMPRESS_SIZE:
+        return
+    if 'gzip' not in request.headers.get('Accept-Encoding', '') or response.get_header('Content-Encoding'):
+        return
+    content_type = (response.get_header('Content-Type') or '').lower()
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        return
+    response.body = bytearray(gzip.compress(bytes(response.body), compresslevel=5))
+    response.set_header('Content-Encoding', 'gzip')
+    if response.get_header('ETag'):
+        response.set_header('ETag', gzip_etag(response.get_header('ETag')))
+    response.set_header('Vary', 'Accept-Encoding')
+
+
+def authentication(request, call_next):
+    """Enforce the route's auth level, resolving the session's user once
+
+    Public routes leave request.user unset, so static files, polls and
+    probes carrying a cookie cost no user lookup; their handlers call
+    get_current_user() if they need it.
+    """
+    route = request.route
+    if route is None or route.auth == 'public':
+        return call_next(request)
+    if route.auth == 'admin':
+        request.user = request.require_admin()
+    else:
+        request.user = request.require_auth()
+    if request.user is None:
+        # require_* already answered with a redirect or 403
+        return
+    call_next(request)
+
+
+DEFAULT_MIDDLEWARE = [access_log, error_capture, record_metrics, profile_queries, timing, security_headers, compression, authentication]
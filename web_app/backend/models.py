@@ -2,13 +2,24 @@
 Database models using SQLAlchemy
 """
 import os
+import base64
+import logging
 import sqlite3
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, Float, Text, DateTime, ForeignKey, JSON
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import create_engine, and_, bindparam, case, literal, event, Column, Integer, String, Boolean, Float, Text, DateTime, ForeignKey, JSON, Index, UniqueConstraint, tuple_
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, relationship
 import bcrypt
 
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 # Database setup
@@ -17,6 +28,22 @@ engine = create_engine(DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(bind=engine)
 
 
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so readers don't block the writer"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
+
+def hash_password(password):
+    """Return the bcrypt hash of password as a string"""
+    salt = bcrypt.gensalt()
+    with metrics.phase('bcrypt'):
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
 class User(Base):
     """User model for registration and authentication"""
     __tablename__ = 'users'
@@ -28,7 +55,7 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     age = Column(Integer, nullable=True)
     gender = Column(String(20), nullable=True)
-    location = Column(String(200), nullable=True)
+    location = Column(String(200), nullable=True, index=True)
     is_admin = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -39,13 +66,13 @@ class User(Base):
     
     def set_password(self, password):
         """Hash and set password"""
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
         try:
-            return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+            with metrics.phase('bcrypt'):
+                return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
         except:
             return False
     
@@ -65,6 +92,12 @@ class Assessment(Base):
     recommendations = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     
+    __table_args__ = (
+        # Keyset pagination indexes for the admin listing (newest first)
+        Index('ix_assessments_created_at_id', 'created_at', 'id'),
+        Index('ix_assessments_risk_level_created_at_id', 'risk_level', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Assessment {self.id} - {self.risk_level}>'
 
@@ -85,10 +118,366 @@ class Alert(Base):
         return f'<Alert {self.title}>'
 
 
+class Notification(Base):
+    """Per-user copy of an alert, created by the alert fan-out"""
+    __tablename__ = 'notifications'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    alert_id = Column(Integer, ForeignKey('alerts.id', ondelete='CASCADE'), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    read_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Re-running a fan-out never notifies a user twice
+        UniqueConstraint('user_id', 'alert_id', name='uq_notifications_user_alert'),
+    )
+    
+    def __repr__(self):
+        return f'<Notification {self.alert_id} -> {self.user_id}>'
+
+
+class Job(Base):
+    """Background job persisted in the queue (see jobs.py)
+
+    status is 'queued', 'running', 'done' or 'failed'. A running job is
+    leased to one worker until locked_until; higher priority runs first.
+    """
+    __tablename__ = 'jobs'
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    priority = Column(Integer, default=0, nullable=False)
+    status = Column(String(20), default='queued', nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = Column(String(100), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Claiming picks the next due job by status, priority and run_after
+        Index('ix_jobs_status_priority_run_after', 'status', 'priority', 'run_after'),
+        Index('ix_jobs_status_locked_until', 'status', 'locked_until'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+class UserRiskSummary(Base):
+    """Latest risk per user, maintained alongside assessment inserts"""
+    __tablename__ = 'user_risk_summaries'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    risk_level = Column(String(20), nullable=False)
+    risk_score = Column(Float, nullable=False)
+    assessed_at = Column(DateTime, nullable=False)
+    assessment_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<UserRiskSummary {self.user_id} - {self.risk_level}>'
+
+
+class RiskCounter(Base):
+    """Running assessment counts per risk level
+
+    One row per (scope, key): scope 'global' has a single '' key, scope
+    'location' is keyed by the user's location and scope 'day' by the
+    ISO date of the assessment.
+    """
+    __tablename__ = 'risk_counters'
+
+    scope = Column(String(20), primary_key=True)
+    key = Column(String(200), primary_key=True)
+    low = Column(Integer, default=0, nullable=False)
+    moderate = Column(Integer, default=0, nullable=False)
+    high = Column(Integer, default=0, nullable=False)
+
+    @property
+    def total(self):
+        return self.low + self.moderate + self.high
+
+    def __repr__(self):
+        return f'<RiskCounter {self.scope}:{self.key}>'
+
+
+# Maps Assessment.risk_level values onto RiskCounter columns
+RISK_COUNTER_COLUMNS = {'Low': 'low', 'Moderate': 'moderate', 'High': 'high'}
+
+
+def _upsert(session, table, keys, values, update):
+    """INSERT values, or UPDATE the existing row with the same keys
+
+    update(new) returns {column: expression}, where new refers to the
+    values that failed to insert. One statement, so concurrent first
+    inserts of the same row cannot fail on the unique key.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if dialect == 'sqlite' else postgresql_insert)(table).values(**values)
+        session.execute(stmt.on_conflict_do_update(index_elements=keys, set_=update(stmt.excluded)))
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(table).values(**values)
+        session.execute(stmt.on_duplicate_key_update(**update(stmt.inserted)))
+    else:
+        # No upsert syntax: insert in a savepoint and update if another writer got there first
+        try:
+            with session.begin_nested():
+                session.execute(table.insert().values(**values))
+        except IntegrityError:
+            new = SimpleNamespace(**{name: literal(value, table.c[name].type) for name, value in values.items()})
+            condition = and_(*(table.c[key] == values[key] for key in keys))
+            session.execute(table.update().where(condition).values(**update(new)))
+
+
+def _risk_counter_update(new):
+    table = RiskCounter.__table__
+    return {column: table.c[column] + getattr(new, column) for column in ('low', 'moderate', 'high')}
+
+
+def _risk_summary_update(new):
+    table = UserRiskSummary.__table__
+    newer = new.assessed_at >= table.c.assessed_at
+    # assessed_at last: MySQL applies the assignments in order
+    return {
+        'assessment_count': table.c.assessment_count + new.assessment_count,
+        'risk_level': case((newer, new.risk_level), else_=table.c.risk_level),
+        'risk_score': case((newer, new.risk_score), else_=table.c.risk_score),
+        'assessed_at': case((newer, new.assessed_at), else_=table.c.assessed_at),
+    }
+
+
+def update_risk_stats(session, entries):
+    """Fold newly inserted assessments into the materialized counters
+
+    Runs inside the caller's transaction, so the counters commit or roll
+    back together with the assessment rows. Each entry is a dict with
+    user_id, location, risk_level, risk_score and created_at.
+    """
+    deltas = {}
+    latest = {}
+    for entry in entries:
+        column = RISK_COUNTER_COLUMNS.get(entry['risk_level'])
+        if column is None:
+            continue
+        created_at = entry.get('created_at') or datetime.utcnow()
+        location = (entry.get('location') or '').strip()
+        for scope, key in (('global', ''), ('location', location), ('day', created_at.date().isoformat())):
+            counts = deltas.setdefault((scope, key), {'low': 0, 'moderate': 0, 'high': 0})
+            counts[column] += 1
+
+        summary = latest.get(entry['user_id'])
+        if summary is None:
+            summary = latest[entry['user_id']] = {'count': 0, 'created_at': None}
+        summary['count'] += 1
+        if summary['created_at'] is None or created_at >= summary['created_at']:
+            summary.update(created_at=created_at, risk_level=entry['risk_level'], risk_score=entry['risk_score'])
+
+    add_risk_counts(session, deltas)
+
+    # Flush pending ORM rows first; the upserts below are plain SQL statements
+    session.flush()
+    for user_id, summary in latest.items():
+        _upsert(session, UserRiskSummary.__table__, ['user_id'], {
+            'user_id': user_id,
+            'risk_level': summary['risk_level'],
+            'risk_score': summary['risk_score'],
+            'assessed_at': summary['created_at'],
+            'assessment_count': summary['count'],
+        }, _risk_summary_update)
+
+
+def add_risk_counts(session, deltas):
+    """Add {(scope, key): {'low': n, 'moderate': n, 'high': n}} to the counters"""
+    for (scope, key), counts in deltas.items():
+        # Increment in SQL so concurrent writers never lose updates
+        _upsert(session, RiskCounter.__table__, ['scope', 'key'], dict(counts, scope=scope, key=key),
+                _risk_counter_update)
+
+
+def move_risk_stats(session, entries):
+    """Move rescored assessments from their old risk level to the new one
+
+    Runs inside the caller's transaction, next to the UPDATE of the rows,
+    so the counters never disagree with the assessments. Each entry is a
+    dict with user_id, location, created_at, old_risk_level, risk_level and
+    risk_score.
+    """
+    deltas = {}
+    for entry in entries:
+        old = RISK_COUNTER_COLUMNS.get(entry['old_risk_level'])
+        new = RISK_COUNTER_COLUMNS.get(entry['risk_level'])
+        if old == new:
+            continue
+        location = (entry.get('location') or '').strip()
+        for scope, key in (('global', ''), ('location', location), ('day', entry['created_at'].date().isoformat())):
+            counts = deltas.setdefault((scope, key), {'low': 0, 'moderate': 0, 'high': 0})
+            if old is not None:
+                counts[old] -= 1
+            if new is not None:
+                counts[new] += 1
+    add_risk_counts(session, deltas)
+
+    # The summary holds each user's latest assessment; update it where that is a rescored row
+    summaries = UserRiskSummary.__table__
+    if entries:
+        session.execute(
+            summaries.update()
+            .where(summaries.c.user_id == bindparam('summary_user_id'),
+                   summaries.c.assessed_at == bindparam('summary_assessed_at'))
+            .values(risk_level=bindparam('summary_risk_level'), risk_score=bindparam('summary_risk_score')),
+            [{
+                'summary_user_id': entry['user_id'],
+                'summary_assessed_at': entry['created_at'],
+                'summary_risk_level': entry['risk_level'],
+                'summary_risk_score': entry['risk_score'],
+            } for entry in entries]
+        )
+
+
+def record_assessment(session, assessment, location=None):
+    """Add an assessment and update the risk counters in the same transaction"""
+    if assessment.created_at is None:
+        assessment.created_at = datetime.utcnow()
+    session.add(assessment)
+    update_risk_stats(session, [{
+        'user_id': assessment.user_id,
+        'location': location,
+        'risk_level': assessment.risk_level,
+        'risk_score': assessment.risk_score,
+        'created_at': assessment.created_at,
+    }])
+
+
+def get_risk_analytics(session, days=None, location=None):
+    """Read assessment counts from the materialized counters
+
+    Without arguments this is a single primary-key lookup; with days it
+    sums at most one row per day.
+    """
+    if days:
+        start = (datetime.utcnow() - timedelta(days=days - 1)).date().isoformat()
+        rows = session.query(RiskCounter).filter(RiskCounter.scope == 'day', RiskCounter.key >= start).all()
+    elif location is not None:
+        rows = session.query(RiskCounter).filter_by(scope='location', key=location.strip()).all()
+    else:
+        rows = session.query(RiskCounter).filter_by(scope='global', key='').all()
+
+    analytics = {'low': 0, 'moderate': 0, 'high': 0}
+    for row in rows:
+        analytics['low'] += row.low
+        analytics['moderate'] += row.moderate
+        analytics['high'] += row.high
+    analytics['total'] = analytics['low'] + analytics['moderate'] + analytics['high']
+    analytics['days'] = days
+    return analytics
+
+
+def get_location_risk_distribution(session):
+    """Return {location: {'low', 'moderate', 'high', 'total'}} from the counters"""
+    return {
+        row.key: {'low': row.low, 'moderate': row.moderate, 'high': row.high, 'total': row.total}
+        for row in session.query(RiskCounter).filter_by(scope='location').all()
+    }
+
+
+def rebuild_risk_counters(session):
+    """Recompute all counters from the assessments table
+
+    Only needed once for databases created before the counters existed,
+    or after rows were changed outside the application.
+    """
+    session.query(RiskCounter).delete(synchronize_session=False)
+    session.query(UserRiskSummary).delete(synchronize_session=False)
+    rows = session.query(
+        Assessment.user_id, User.location, Assessment.risk_level,
+        Assessment.risk_score, Assessment.created_at
+    ).join(User, User.id == Assessment.user_id).yield_per(1000)
+    batch = []
+    for user_id, location, risk_level, risk_score, created_at in rows:
+        batch.append({
+            'user_id': user_id,
+            'location': location,
+            'risk_level': risk_level,
+            'risk_score': risk_score,
+            'created_at': created_at,
+        })
+        if len(batch) >= 1000:
+            update_risk_stats(session, batch)
+            batch = []
+    if batch:
+        update_risk_stats(session, batch)
+
+
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset position as an opaque URL-safe token"""
+    raw = f'{created_at.isoformat()}|{row_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token from encode_cursor, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, row_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+
+
+def list_assessments_page(session, risk_level=None, days=None, cursor=None, limit=25):
+    """Return one page of assessments, newest first, with user name/email
+
+    Uses keyset pagination on (created_at, id) so every page is a single
+    indexed range scan joined to users, however deep the page is.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    query = session.query(
+        Assessment.id, Assessment.created_at, Assessment.risk_level, Assessment.risk_score,
+        User.name, User.email
+    ).join(User, User.id == Assessment.user_id)
+
+    if risk_level:
+        query = query.filter(Assessment.risk_level == risk_level)
+    if days:
+        query = query.filter(Assessment.created_at >= datetime.utcnow() - timedelta(days=days))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Assessment.created_at, Assessment.id) < tuple_(created_at, row_id))
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(Assessment.created_at.desc(), Assessment.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    page = [{
+        'id': row.id,
+        'created_at': row.created_at,
+        'risk_level': row.risk_level,
+        'risk_score': row.risk_score,
+        'user_name': row.name,
+        'user_email': row.email,
+    } for row in rows]
+    return page, next_cursor
+
+
 def init_database():
     """Initialize database and create tables"""
     Base.metadata.create_all(engine)
-    
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
     # Create default admin user if it doesn't exist
     session = SessionLocal()
     try:
@@ -106,10 +495,19 @@ def init_database():
             admin.set_password(admin_password)
             session.add(admin)
             session.commit()
-            print(f"Created default admin user: {admin_email} / {admin_password}")
+            # The password itself is never logged: app.log is kept on disk and may be shipped
+            log.info(f"Created default admin user: {admin_email}")
+            if 'ADMIN_PASSWORD' not in os.environ:
+                log.warning("The admin user has the default password; set ADMIN_PASSWORD or change it")
+
+        # Backfill counters for databases that predate them
+        if session.query(RiskCounter).first() is None and session.query(Assessment).first() is not None:
+            rebuild_risk_counters(session)
+            session.commit()
+            log.info("Rebuilt assessment risk counters")
     except Exception as e:
         session.rollback()
-        print(f"Error initializing database: {e}")
+        log.exception(f"Error initializing database: {e}")
     finally:
         session.close()
 
@@ -0,0 +1,71 @@
+"""
+Alert fan-out: turn a new alert into per-user notification records
+
+Creating an alert only inserts the Alert row and queues an 'alert_fanout'
+job (see tasks.py); the users it targets are resolved and notified here,
+in batches, so the admin's request returns immediately however many
+users are affected.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, insert, distinct
+
+from models import get_db, User, Alert, Notification
+from covid_data import location_key
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def resolve_location_values(session, target_location):
+    """Distinct users.location spellings that resolve to the alert's target
+
+    Scans only the distinct values of the indexed location column, so the
+    batched user queries below can use an IN lookup on the index.
+    """
+    target = location_key(target_location)
+    values = session.scalars(select(distinct(User.location)).where(User.location.isnot(None)))
+    return [value for value in values if location_key(value) == target]
+
+
+def fan_out_alert(alert_id, batch_size=FANOUT_BATCH_SIZE):
+    """Create a notification for every user targeted by an alert
+
+    Walks user ids in keyset order and inserts one batch of notifications
+    per transaction. Returns the number of notifications created.
+    """
+    db = get_db()
+    try:
+        alert = db.get(Alert, alert_id)
+        if alert is None or not alert.is_active:
+            return 0
+
+        user_ids = select(User.id).where(User.is_admin.is_(False))
+        if alert.target_location:
+            locations = resolve_location_values(db, alert.target_location)
+            if not locations:
+                return 0
+            user_ids = user_ids.where(User.location.in_(locations))
+        already_notified = select(Notification.user_id).where(Notification.alert_id == alert_id)
+        user_ids = user_ids.where(User.id.notin_(already_notified))
+
+        created = 0
+        last_id = 0
+        while True:
+            batch = db.scalars(
+                user_ids.where(User.id > last_id).order_by(User.id).limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            now = datetime.utcnow()
+            db.execute(insert(Notification), [
+                {'user_id': user_id, 'alert_id': alert_id, 'created_at': now} for user_id in batch
+            ])
+            db.commit()
+            created += len(batch)
+            last_id = batch[-1]
+        return created
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
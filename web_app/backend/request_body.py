@@ -0,0 +1,166 @@
+"""
+Bounded, streaming reader for request bodies
+
+The body is read from the socket in small pieces, never more than
+MAX_BODY_SIZE bytes in total and never for longer than BODY_READ_TIMEOUT
+seconds, so an oversized or slow-drip POST costs a worker at most that
+much memory and time. Both Content-Length and chunked bodies are
+accepted.
+
+URL-encoded forms are parsed as the bytes arrive: each complete
+name=value pair is decoded and added to the result, and only the
+unfinished tail is kept. The standard library has no incremental JSON
+parser, so JSON bodies are decoded as they arrive and parsed once
+complete; they are held to the same size limit.
+"""
+import os
+import json
+import time
+import codecs
+import urllib.parse
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = int(os.environ.get('MAX_BODY_SIZE', 1024 * 1024))
+# Seconds allowed for the whole body to arrive
+BODY_READ_TIMEOUT = float(os.environ.get('BODY_READ_TIMEOUT', 30))
+# Most name=value pairs accepted in one form
+MAX_FORM_FIELDS = 1000
+READ_SIZE = 16 * 1024
+# Longest chunk-size line accepted in a chunked body
+MAX_CHUNK_LINE = 1024
+
+
+class RequestBodyError(Exception):
+    """The body is too large, too slow or badly framed; status is the HTTP reply"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class BodyReader:
+    """Yields a request body in pieces, enforcing the size and time limits"""
+
+    def __init__(self, rfile, headers, connection=None, max_size=MAX_BODY_SIZE, timeout=BODY_READ_TIMEOUT):
+        self.rfile = rfile
+        self.connection = connection
+        self.max_size = max_size
+        self.deadline = time.monotonic() + timeout
+        self.size = 0
+        self.chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        self.length = 0
+        if not self.chunked:
+            try:
+                self.length = int(headers.get('Content-Length') or 0)
+            except ValueError:
+                raise RequestBodyError(400, 'Invalid Content-Length')
+            if self.length < 0:
+                raise RequestBodyError(400, 'Invalid Content-Length')
+            if self.length > max_size:
+                # Refuse before reading a single byte of it
+                raise RequestBodyError(413, f'Request body exceeds {max_size} bytes')
+
+    def __iter__(self):
+        if self.chunked:
+            return self._read_chunked()
+        return self._read_exactly(self.length)
+
+    def _read_exactly(self, remaining):
+        while remaining > 0:
+            data = self._read(min(remaining, READ_SIZE))
+            remaining -= len(data)
+            yield data
+
+    def _read_chunked(self):
+        while True:
+            line = self._readline()
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise RequestBodyError(400, 'Malformed chunked body')
+            if size == 0:
+                break
+            if self.size + size > self.max_size:
+                raise RequestBodyError(413, f'Request body exceeds {self.max_size} bytes')
+            yield from self._read_exactly(size)
+            if self._readline() != b'\r\n':
+                raise RequestBodyError(400, 'Malformed chunked body')
+        # Skip any trailer fields up to the blank line that ends the body
+        while self._readline() not in (b'\r\n', b'\n'):
+            pass
+
+    def _read(self, size):
+        self._set_timeout()
+        try:
+            # read1 returns whatever one recv delivers, so the deadline is
+            # checked between small reads rather than after a full buffer
+            data = self.rfile.read1(size)
+        except TimeoutError:
+            raise RequestBodyError(408, 'Timed out reading request body')
+        if not data:
+            raise RequestBodyError(400, 'Request body ended early')
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestBodyError(413, f'Request body exceeds {self.max_size} bytes')
+        return data
+
+    def _readline(self):
+        self._set_timeout()
+        try:
+            line = self.rfile.readline(MAX_CHUNK_LINE + 1)
+        except TimeoutError:
+            raise RequestBodyError(408, 'Timed out reading request body')
+        if not line.endswith(b'\n'):
+            raise RequestBodyError(400, 'Malformed chunked body')
+        return line
+
+    def _set_timeout(self):
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise RequestBodyError(408, 'Timed out reading request body')
+        if self.connection is not None:
+            timeout = self.connection.gettimeout()
+            if timeout is None or remaining < timeout:
+                self.connection.settimeout(remaining)
+
+
+def parse_form(chunks, max_fields=MAX_FORM_FIELDS):
+    """Parse an application/x-www-form-urlencoded body from byte chunks
+
+    Returns the same dict of lists as urllib.parse.parse_qs, blank
+    values dropped.
+    """
+    fields = {}
+    count = 0
+    tail = b''
+    for chunk in chunks:
+        pairs = (tail + chunk).split(b'&')
+        tail = pairs.pop()
+        for pair in pairs:
+            count += _add_pair(fields, pair)
+        if count > max_fields:
+            raise RequestBodyError(413, f'Form has more than {max_fields} fields')
+    _add_pair(fields, tail)
+    return fields
+
+
+def _add_pair(fields, pair):
+    if not pair:
+        return 0
+    # '&' never occurs inside a multi-byte UTF-8 sequence, so each pair decodes on its own
+    for name, value in urllib.parse.parse_qsl(pair.decode('utf-8', 'replace')):
+        fields.setdefault(name, []).append(value)
+        return 1
+    return 0
+
+
+def parse_json(chunks):
+    """Parse a JSON body from byte chunks; raises ValueError if it is invalid
+
+    An empty body gives an empty dict.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parts = [decoder.decode(chunk) for chunk in chunks]
+    parts.append(decoder.decode(b'', final=True))
+    text = ''.join(parts)
+    return json.loads(text) if text.strip() else {}
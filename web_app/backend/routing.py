@@ -0,0 +1,173 @@
+"""
+Declarative route table for the HTTP handler
+
+Routes are registered once at import time. Static paths go into a dict keyed
+by path, so most requests are dispatched with a single lookup; paths with
+parameters (/admin/alerts/<int:alert_id>/toggle) or a catch-all tail
+(/static/<path:filename>) go into a trie walked segment by segment.
+
+Each route carries the metadata dispatch needs: the handler, which users
+may call it ('public', 'user' or 'admin'), whether it streams its body
+instead of having it buffered (see middleware.py) and a name used by
+url_for in templates and as the label for per-route statistics.
+"""
+import re
+
+AUTH_LEVELS = ('public', 'user', 'admin')
+
+_PARAM = re.compile(r'^<(?:(int|path):)?(\w+)>$')
+
+
+class Route:
+    """One (method, path pattern) entry in the route table"""
+
+    __slots__ = ('method', 'pattern', 'handler', 'auth', 'name', 'defaults', 'stream')
+
+    def __init__(self, method, pattern, handler, auth, name, defaults, stream):
+        self.method = method
+        self.pattern = pattern
+        self.handler = handler
+        self.auth = auth
+        self.name = name
+        self.defaults = defaults
+        self.stream = stream
+
+    def __repr__(self):
+        return f'<Route {self.method} {self.pattern} -> {self.name}>'
+
+
+class _Node:
+    __slots__ = ('children', 'param', 'tail', 'routes')
+
+    def __init__(self):
+        self.children = {}  # literal segment -> _Node
+        self.param = None   # (name, converter, _Node) for a <param> segment
+        self.tail = None    # (name, {method: Route}) for a trailing <path:name>
+        self.routes = {}    # method -> Route ending at this node
+
+
+class Router:
+    """Maps (method, path) to a Route and its path parameters"""
+
+    def __init__(self):
+        self._exact = {}   # path -> {method: Route}
+        self._root = _Node()
+        self._names = {}   # route name -> Route
+
+    def add(self, method, pattern, handler, auth='public', name=None, defaults=None, stream=False):
+        """Register handler(request_handler, **params) for method and pattern
+
+        defaults are extra keyword arguments passed to the handler, so one
+        handler can serve several routes. stream marks handlers that write
+        their body to the socket as they go.
+        """
+        if auth not in AUTH_LEVELS:
+            raise ValueError(f'auth must be one of {AUTH_LEVELS}, not {auth!r}')
+        route = Route(method, pattern, handler, auth, name or handler.__name__, defaults or {}, stream)
+        if '<' not in pattern:
+            methods = self._exact.setdefault(pattern, {})
+        else:
+            methods = self._insert(pattern)
+        if method in methods:
+            raise ValueError(f'duplicate route {method} {pattern}')
+        methods[method] = route
+        self._names.setdefault(route.name, route)
+        return route
+
+    def _insert(self, pattern):
+        node = self._root
+        segments = pattern.strip('/').split('/')
+        for position, segment in enumerate(segments):
+            match = _PARAM.match(segment)
+            if match is None:
+                node = node.children.setdefault(segment, _Node())
+                continue
+            converter, name = match.groups()
+            if converter == 'path':
+                if position != len(segments) - 1:
+                    raise ValueError(f'<path:{name}> must be the last segment of {pattern}')
+                if node.tail is None:
+                    node.tail = (name, {})
+                return node.tail[1]
+            if node.param is None:
+                node.param = (name, converter, _Node())
+            elif node.param[:2] != (name, converter):
+                raise ValueError(f'conflicting parameter <{segment}> in {pattern}')
+            node = node.param[2]
+        return node.routes
+
+    def match(self, method, path):
+        """Return (route, params), or (None, allowed methods) when nothing matches
+
+        The allowed methods are empty for an unknown path, and list the
+        methods the path does support otherwise (for a 405 response).
+        """
+        methods = self._exact.get(path)
+        params = {}
+        if methods is None:
+            methods, params = self._search(path)
+        if methods is None:
+            return None, ()
+        route = methods.get(method)
+        if route is None:
+            return None, tuple(sorted(methods))
+        if route.defaults:
+            params = dict(route.defaults, **params)
+        return route, params
+
+    def _search(self, path):
+        node = self._root
+        params = {}
+        segments = path.strip('/').split('/')
+        for position, segment in enumerate(segments):
+            child = node.children.get(segment)
+            if child is not None:
+                node = child
+                continue
+            if node.param is not None:
+                name, converter, child = node.param
+                if converter == 'int':
+                    if not segment.isdigit():
+                        return None, None
+                    params[name] = int(segment)
+                elif segment:
+                    params[name] = segment
+                else:
+                    return None, None
+                node = child
+                continue
+            if node.tail is not None:
+                rest = segments[position:]
+                # Never let a catch-all reach outside its directory
+                if '..' in rest or '' in rest:
+                    return None, None
+                name, methods = node.tail
+                params[name] = '/'.join(rest)
+                return methods, params
+            return None, None
+        return (node.routes or None), params
+
+    def url_for(self, name, **params):
+        """Build the path of a named route, or None if there is no such route"""
+        route = self._names.get(name)
+        if route is None:
+            return None
+        segments = []
+        for segment in route.pattern.split('/'):
+            match = _PARAM.match(segment)
+            segments.append(str(params[match.group(2)]) if match else segment)
+        return '/'.join(segments)
+
+    def routes(self):
+        """Every registered route, for listing and per-route statistics"""
+        found = [route for methods in self._exact.values() for route in methods.values()]
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            found.extend(node.routes.values())
+            if node.tail is not None:
+                found.extend(node.tail[1].values())
+            if node.param is not None:
+                stack.append(node.param[2])
+            stack.extend(node.children.values())
+        return found
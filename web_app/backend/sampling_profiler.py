@@ -0,0 +1,140 @@
+"""
+Stack-sampling profiler for a running server
+
+Every interval the profiler takes the current stack of every thread
+(sys._current_frames) and counts identical stacks. The result is in the
+collapsed-stack format read by flamegraph.pl, speedscope and similar
+tools: one "frame;frame;frame count" line per distinct stack, outermost
+frame first and the thread name as the root.
+
+Nothing is traced between samples, so the cost is one stack walk per
+thread per interval, and only while a profile is being taken. Threads
+that are just waiting (for a connection, a lock or a queue) are left out
+unless include_idle is set, so the output shows where CPU time goes.
+
+Start a profile with GET /admin/debug/profile?seconds=N, or send the
+server process SIGUSR2 to write one to LOG_DIR.
+"""
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+DEFAULT_INTERVAL = 0.01
+MAX_SECONDS = 120
+# Seconds profiled after SIGUSR2
+SIGNAL_SECONDS = float(os.environ.get('PROFILE_SIGNAL_SECONDS', 30))
+
+# Innermost frames of threads that are blocked rather than running
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'readinto'),
+    ('socket.py', 'accept'),
+    ('queue.py', 'get'),
+    ('socketserver.py', 'serve_forever'),
+}
+
+_THREAD_NUMBER = re.compile(r'[-_]\d+')
+
+log = logging.getLogger(__name__)
+
+
+class ProfilerBusy(Exception):
+    """A profile is already being taken"""
+
+
+class SamplingProfiler:
+    """Takes one stack-sampling profile at a time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def profile(self, seconds, interval=DEFAULT_INTERVAL, include_idle=False):
+        """Sample all other threads for seconds; returns (stack counts, samples taken)
+
+        Blocks the calling thread for the duration. Raises ProfilerBusy if
+        another profile is running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy('a profile is already running')
+        try:
+            seconds = min(max(seconds, interval), MAX_SECONDS)
+            me = threading.get_ident()
+            counts = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = _stack(frame, include_idle)
+                    if stack:
+                        thread_name = _THREAD_NUMBER.sub('', names.get(ident, 'thread'))
+                        counts[thread_name + ';' + stack] += 1
+                samples += 1
+                time.sleep(interval)
+            return counts, samples
+        finally:
+            self._lock.release()
+
+    def profile_to_file(self, seconds, directory):
+        """Take a profile in a background thread and write it to directory"""
+        def run():
+            try:
+                counts, samples = self.profile(seconds)
+            except ProfilerBusy:
+                log.warning("Profile not started: another profile is running")
+                return
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(collapse(counts))
+            log.info(f"Wrote {samples} samples over {seconds:.0f}s to {path}")
+
+        thread = threading.Thread(target=run, name='sampling-profiler', daemon=True)
+        thread.start()
+        return thread
+
+
+def _stack(frame, include_idle):
+    code = frame.f_code
+    if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+def collapse(counts):
+    """Format stack counts as collapsed-stack lines, most frequent first"""
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+
+def install_signal_handler(directory, seconds=SIGNAL_SECONDS):
+    """Profile for seconds and write the result to directory on SIGUSR2
+
+    Must be called from the main thread; does nothing on platforms
+    without SIGUSR2 (Windows).
+    """
+    import signal
+    if not hasattr(signal, 'SIGUSR2'):
+        return False
+    signal.signal(signal.SIGUSR2, lambda signum, frame: sampling_profiler.profile_to_file(seconds, directory))
+    return True
+
+
+sampling_profiler = SamplingProfiler()
@@ -3,51 +3,231 @@
 Simple HTTP server for Aditya Setu
 Uses Python's built-in http.server for localhost access
 """
+# Imported first, so the startup report includes the time spent on the imports below
+from startup import startup
+
 import os
+import re
+import html
 import json
+import logging
 import secrets
 import urllib.parse
 import socket
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import signal
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from datetime import datetime, timedelta
 from pathlib import Path
-import bcrypt
 
 # Import database models
-from models import init_database, get_db, User, Assessment, Alert
+from models import (
+    engine, init_database, get_db, User, Assessment, Alert, Notification, Job,
+    record_assessment, get_risk_analytics, list_assessments_page
+)
+from covid_data import get_covid_data
+from alert_index import alert_index
+from alert_stream import alert_broker, HEARTBEAT_INTERVAL
+from jobs import enqueue, job_workers, queue_status, queue_depth, list_jobs, job_dict, JOB_STATUSES, PRIORITY_HIGH, PRIORITY_LOW, WORKER_COUNT
+from tasks import ADMIN_JOB_KINDS, validate_export_payload
+from assessment_writer import assessment_writer, WriterBusy, WriteTimeout, MAX_QUEUED as WRITER_MAX_QUEUED
+from idempotency import submission_cache, IN_PROGRESS
+from covid_data import canonical_state
+from routing import Router
+from middleware import DEFAULT_MIDDLEWARE, Response, build_pipeline
+from request_body import BodyReader, RequestBodyError, parse_form, parse_json
+from metrics import metrics, instrument_engine, PROMETHEUS_CONTENT_TYPE
+from app_logging import setup_logging, stop_logging, LOG_DIR
+from db_profiler import query_profiler
+from health import readiness
+from sampling_profiler import sampling_profiler, collapse, install_signal_handler, ProfilerBusy, MAX_SECONDS
+from scoring import calculate_risk_score, generate_recommendations, get_risk_level
 
+# Seconds an idle keep-alive connection is held open for the next request
+KEEPALIVE_TIMEOUT = float(os.environ.get('KEEPALIVE_TIMEOUT', 15))
+# Requests served on one connection before it is closed
+KEEPALIVE_MAX_REQUESTS = int(os.environ.get('KEEPALIVE_MAX_REQUESTS', 100))
+# Largest unread request body skipped to keep a connection usable
+MAX_DISCARD_BODY = 64 * 1024
+# Clients allowed to read /metrics without logging in
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+# Request ids accepted from an X-Request-ID header (e.g. set by a proxy)
+_REQUEST_ID = re.compile(r'^[\w.-]{1,64}$')
+# Look up the public IP for the startup banner (outbound HTTPS, in the background)
+PUBLIC_IP_LOOKUP = os.environ.get('PUBLIC_IP_LOOKUP', '').lower() in ('1', 'true', 'yes')
+
+log = logging.getLogger(__name__)
+
+# Set once the listening socket is bound and warm_up() has finished; reported by /readyz
+server_ready = threading.Event()
+# Connections opened (and returned to the pool) during warm-up
+WARM_UP_CONNECTIONS = int(os.environ.get('WARM_UP_CONNECTIONS', 2))
+
+
+TEMPLATE_DIR = Path(__file__).parent / 'templates'
+
+# Fixed template tags, compiled once; patterns built from context keys or
+# loop variable names are compiled (and cached by re) as they are used
+_EXTENDS = re.compile(r'\{%\s*extends\s+["\'](.+?)["\']\s*%\}')
+_BLOCK = re.compile(r'\{%\s*block\s+(\w+)\s*%\}(.*?)\{%\s*endblock\s*%\}', re.DOTALL)
+_IF_ELSE_ENDIF = re.compile(r'\{%\s*(if|else|endif)\b[^%]*%\}')
+_IF_AUTHENTICATED_ELSE = re.compile(r'\{%\s*if\s+current_user\.is_authenticated\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_NOT_AUTHENTICATED_ELSE = re.compile(r'\{%\s*if\s+not\s+current_user\.is_authenticated\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_AUTHENTICATED = re.compile(r'\{%\s*if\s+current_user\.is_authenticated\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_ADMIN = re.compile(r'\{%\s*if\s+current_user\.is_admin\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_ERROR = re.compile(r'\{%\s*if\s+error\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_SUCCESS = re.compile(r'\{%\s*if\s+success\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_LATEST_ASSESSMENT_ELSE = re.compile(r'\{%\s*if\s+latest_assessment\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_RECENT_ASSESSMENTS = re.compile(r'\{%\s*if\s+recent_assessments\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_IF_EQUALS = re.compile(r'\{%\s*if\s+(\w+)(?:\.(\w+))?\s*==\s*["\']?([^"\'%\s]+)["\']?\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_URL_FOR = re.compile(r'\{\{\s*url_for\(["\']([^"\']+)["\']\)\s*\}\}')
+_CURRENT_USER_ATTR = re.compile(r'\{\{\s*current_user\.(\w+)\s*\}\}')
+_OBJECT_METHOD_FILTER = re.compile(r'\{\{\s*(\w+)\.(\w+)\.(\w+)\(\)(?:\s*\|\s*(\w+)\([^)]+\))?(?:\s*\|\s*(\w+))?\s*\}\}')
+_OBJECT_METHOD = re.compile(r'\{\{\s*(\w+)\.(\w+)\.(\w+)\(\)\s*\}\}')
+_OBJECT_ATTR_FILTER = re.compile(r'\{\{\s*(\w+)\.(\w+)(?:\s*\|\s*(\w+)\([^)]*\))?(?:\s*\|\s*(\w+))?\s*\}\}')
+_OBJECT_ATTR = re.compile(r'\{\{\s*(\w+)\.(\w+)\s*\}\}')
+_FOR_LOOP = re.compile(r'\{%\s*for\s+(\w+)\s+in\s+(\w+)\s*%\}(.*?)\{%\s*endfor\s*%\}', re.DOTALL)
+_IF_ADMIN_ELSE = re.compile(r'\{%\s*if\s+current_user\.is_admin\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}', re.DOTALL)
+_ANY_TAG = re.compile(r'\{%[^%]*%\}')
+_ANY_VARIABLE = re.compile(r'\{\{[^}]*\}\}')
+
+# Template name -> ((file, modification time), ...), source with {% extends %} resolved
+_template_cache = {}
+
+
+def load_template(template_name):
+    """Template source with {% extends %} already applied
+    
+    Cached after the first read; the files are checked for changes on
+    every call, so edited templates are picked up without a restart.
+    """
+    path = TEMPLATE_DIR / template_name
+    cached = _template_cache.get(template_name)
+    if cached is not None and all(file.stat().st_mtime_ns == mtime for file, mtime in cached[0]):
+        return cached[1]
+    
+    files = [(path, path.stat().st_mtime_ns)]
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    # Handle {% extends "base.html" %}
+    extends_match = _EXTENDS.search(content)
+    if extends_match:
+        base_path = TEMPLATE_DIR / extends_match.group(1)
+        if base_path.exists():
+            files.append((base_path, base_path.stat().st_mtime_ns))
+            with open(base_path, 'r', encoding='utf-8') as f:
+                base_content = f.read()
+            
+            # Extract blocks from current template
+            blocks = {}
+            for match in _BLOCK.finditer(content):
+                blocks[match.group(1)] = match.group(2)
+            
+            # Replace blocks in base template
+            for block_name, block_content in blocks.items():
+                block_regex = r'\{%\s*block\s+' + block_name + r'\s*%\}.*?\{%\s*endblock\s*%\}'
+                base_content = re.sub(block_regex, block_content, base_content, flags=re.DOTALL)
+            
+            content = base_content
+    
+    _template_cache[template_name] = (tuple(files), content)
+    return content
+
+
+def preload_templates():
+    """Read every page template into the cache; returns how many"""
+    names = [path.name for path in TEMPLATE_DIR.glob('*.html')]
+    for name in names:
+        load_template(name)
+    return len(names)
 
-def load_covid_data():
-    """Load COVID case data from statw.txt file"""
-    covid_data = {}
-    try:
-        # Path to statw.txt file (relative to project root)
-        file_path = Path(__file__).parent.parent / 'statw.txt'
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            # Skip header lines (first 2 lines)
-            for line in lines[2:]:
-                line = line.strip()
-                # Skip empty lines and separator lines
-                if not line or '---' in line:
-                    continue
-                # Parse the markdown table format
-                # Format: | State/UT | Cases |
-                parts = [p.strip() for p in line.split('|')]
-                # Filter out empty parts (markdown tables have empty first/last parts)
-                parts = [p for p in parts if p]
-                if len(parts) >= 2:
-                    state = parts[0].strip()
-                    # Remove commas from numbers and convert to int
-                    cases_str = parts[1].strip().replace(',', '').replace(' ', '')
-                    try:
-                        cases = int(cases_str)
-                        covid_data[state] = cases
-                    except ValueError:
-                        continue
-    except Exception as e:
-        print(f"Error loading COVID data: {e}")
-    return covid_data
+
+def replace_if_block(content, condition, truthy):
+    """Resolve {% if <condition> %}...{% else %}...{% endif %} blocks
+    
+    Unlike a non-greedy regex this pairs each block with its own endif,
+    so blocks may contain nested {% if %} tags.
+    """
+    open_pattern = re.compile(r'\{%\s*if\s+' + condition + r'\s*%\}')
+    while True:
+        opening = open_pattern.search(content)
+        if not opening:
+            return content
+        depth = 0
+        else_tag = None
+        for tag in _IF_ELSE_ENDIF.finditer(content, opening.end()):
+            kind = tag.group(1)
+            if kind == 'if':
+                depth += 1
+            elif kind == 'endif':
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0 and else_tag is None:
+                else_tag = tag
+        else:
+            # Unbalanced block - leave it for the final tag cleanup
+            return content
+        if else_tag:
+            true_content = content[opening.end():else_tag.start()]
+            false_content = content[else_tag.end():tag.start()]
+        else:
+            true_content = content[opening.end():tag.start()]
+            false_content = ''
+        content = content[:opening.start()] + (true_content if truthy else false_content) + content[tag.end():]
+
+
+# Questions for the assessment form - 12 comprehensive questions
+ASSESSMENT_QUESTIONS = [
+    {'id': 'fever', 'question': 'Do you have a fever (temperature above 38°C or 100.4°F)?', 'type': 'yes_no'},
+    {'id': 'cough', 'question': 'Do you have a cough or sore throat?', 'type': 'yes_no'},
+    {'id': 'shortness_breath', 'question': 'Do you experience shortness of breath or difficulty breathing?', 'type': 'yes_no'},
+    {'id': 'fatigue', 'question': 'Do you have unusual fatigue or body aches?', 'type': 'yes_no'},
+    {'id': 'loss_taste_smell', 'question': 'Have you experienced loss of taste or smell?', 'type': 'yes_no'},
+    {'id': 'travel_history', 'question': 'Have you traveled outside your state in the past 14 days?', 'type': 'yes_no'},
+    {'id': 'contact_positive', 'question': 'Have you been in close contact with someone who tested positive for COVID-19?', 'type': 'yes_no'},
+    {'id': 'public_transport', 'question': 'Do you use public transportation regularly?', 'type': 'yes_no'},
+    {'id': 'chronic_disease', 'question': 'Do you have any chronic medical conditions (diabetes, heart disease, respiratory issues)?', 'type': 'yes_no'},
+    {'id': 'household_size', 'question': 'How many people live in your household?', 'type': 'numeric'},
+    {'id': 'mask_usage', 'question': 'Do you always wear a mask when outside?', 'type': 'yes_no'},
+    {'id': 'vaccinated', 'question': 'Are you fully vaccinated against COVID-19?', 'type': 'yes_no'},
+]
+
+
+def alert_view(alert, preview_length=100):
+    """Flatten an alert summary into the string fields the templates use"""
+    message = alert['message'] or ''
+    preview = message[:preview_length] + ('...' if len(message) > preview_length else '')
+    created_at = alert['created_at']
+    return {
+        'id': alert['id'],
+        'title': html.escape(alert['title'] or ''),
+        'message': html.escape(message),
+        'message_preview': html.escape(preview),
+        'target_location': html.escape(alert['target_location'] or ''),
+        'created_date': created_at.strftime('%b %d, %Y') if created_at else '',
+        'created_display': created_at.strftime('%B %d, %Y at %I:%M %p') if created_at else '',
+    }
+
+
+# Sentinel for "current user not looked up yet in this request"
+_UNRESOLVED = object()
+
+
+class _ResponseWriter:
+    """Stands in for wfile while a handler's response is being buffered"""
+    
+    def __init__(self, response):
+        self.response = response
+    
+    def write(self, data):
+        self.response.body += data
+        return len(data)
+    
+    def flush(self):
+        pass
 
 
 class AdityaSetuHandler(BaseHTTPRequestHandler):
@@ -55,60 +235,225 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
     
     # Store active sessions (in production, use Redis or database)
     sessions = {}
+    _current_user = _UNRESOLVED
+    response = None
+    default_headers = ()
+    
+    # Keep connections open between requests; every response is framed by
+    # Content-Length or chunked encoding so the client knows where it ends
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    requests_handled = 0
+    request_id = None
+    status_code = None
+    chunked = False
+    body_read = False
     
     def do_GET(self):
         """Handle GET requests"""
-        path = urllib.parse.urlparse(self.path).path
-        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        self.dispatch('GET')
+    
+    def do_POST(self):
+        """Handle POST requests"""
+        self.dispatch('POST')
+    
+    def dispatch(self, method):
+        """Run the request through the middleware pipeline to its route handler"""
+        url = urllib.parse.urlsplit(self.path)
+        self.query_params = urllib.parse.parse_qs(url.query)
+        self._current_user = _UNRESOLVED
+        self.user = None
+        self.default_headers = ()
+        self.body_read = False
+        self.status_code = None
+        request_id = self.headers.get('X-Request-ID', '')
+        self.request_id = request_id if _REQUEST_ID.match(request_id) else secrets.token_hex(8)
+        self.chunked = False
+        self.requests_handled += 1
+        if self.requests_handled >= KEEPALIVE_MAX_REQUESTS:
+            self.close_connection = True
+        self.route, self.route_params = ROUTES.match(method, url.path)
         
-        # Serve static files
-        if path.startswith('/static/'):
-            self.serve_static(path)
+        # Streaming routes write straight to the socket; everything else is
+        # buffered so middleware can see and rewrite the whole response
+        if self.route is not None and self.route.stream:
+            self.response = None
+            PIPELINE(self)
+            self.discard_unread_body()
             return
+        self.response = Response()
+        socket_file, self.wfile = self.wfile, _ResponseWriter(self.response)
+        try:
+            PIPELINE(self)
+        finally:
+            self.wfile = socket_file
+        self.discard_unread_body()
+        self._send_buffered_response()
+    
+    def discard_unread_body(self):
+        """Skip a request body the handler did not read
         
-        # Route handling
-        if path == '/':
-            self.serve_index()
-        elif path == '/register':
-            self.serve_register()
-        elif path == '/login':
-            self.serve_login()
-        elif path == '/dashboard':
-            self.serve_dashboard()
-        elif path == '/assessment':
-            self.serve_assessment()
-        elif path == '/alerts':
-            self.serve_alerts()
-        elif path == '/admin':
-            self.serve_admin_dashboard()
-        elif path == '/admin/alerts':
-            self.serve_admin_alerts()
-        elif path == '/logout':
-            self.handle_logout()
-        elif path.startswith('/api/'):
-            self.handle_api_get(path, query_params)
-        else:
-            self.send_error(404, "Not Found")
+        Otherwise the next request on this connection would be parsed from
+        the middle of it. Large or unframed bodies close the connection.
+        """
+        if self.body_read or self.close_connection:
+            return
+        self.body_read = True
+        try:
+            for _ in BodyReader(self.rfile, self.headers, self.connection, max_size=MAX_DISCARD_BODY):
+                pass
+        except RequestBodyError:
+            self.close_connection = True
+        finally:
+            self.connection.settimeout(self.timeout)
     
-    def do_POST(self):
-        """Handle POST requests"""
-        path = urllib.parse.urlparse(self.path).path
+    def connection_headers(self):
+        """Tell the client whether the connection stays open, and for how long"""
+        if self.close_connection:
+            return [('Connection', 'close')]
+        remaining = KEEPALIVE_MAX_REQUESTS - self.requests_handled
+        headers = [('Keep-Alive', f'timeout={int(self.timeout)}, max={remaining}')]
+        if self.request_version < 'HTTP/1.1':
+            # HTTP/1.0 connections only persist when both sides ask for it
+            headers.append(('Connection', 'keep-alive'))
+        return headers
+    
+    def send_response(self, code, message=None):
+        self.status_code = code
+        if self.response is None:
+            super().send_response(code, message)
+            return
+        self.response.status = code
+        self.response.message = message
+    
+    def send_header(self, keyword, value):
+        if self.response is None:
+            super().send_header(keyword, value)
+            return
+        if keyword.lower() == 'connection' and value.lower() == 'close':
+            self.close_connection = True
+        self.response.headers.append((keyword, str(value)))
+    
+    def end_headers(self):
+        if self.response is None:
+            for name, value in self.default_headers:
+                super().send_header(name, value)
+            super().end_headers()
+    
+    def send_error(self, code, message=None, explain=None):
+        keep_alive = self.response is not None and not self.close_connection
+        super().send_error(code, message, explain)
+        if keep_alive:
+            # send_error always asks to close, but the request itself was
+            # well-formed, so the connection can serve the next one
+            self.response.remove_header('Connection')
+            self.close_connection = False
+    
+    def log_error(self, format, *args):
+        if format.startswith('Request timed out'):
+            # An idle keep-alive connection reached KEEPALIVE_TIMEOUT
+            return
+        # send_error's "code 404, message ..." is already in the access log
+        level = logging.DEBUG if format.startswith('code ') else logging.WARNING
+        log.log(level, format, *args, extra=self.log_context())
+    
+    def log_request(self, code='-', size='-'):
+        # Requests are written to the access log by the access_log middleware
+        pass
+    
+    def start_stream(self, content_type, headers=()):
+        """Send a 200 whose body is written in pieces with write_chunk()
         
-        if path == '/register':
-            self.handle_register()
-        elif path == '/login':
-            self.handle_login()
-        elif path == '/assessment':
-            self.handle_assessment()
-        elif path == '/admin/alerts':
-            self.handle_create_alert()
-        elif path.startswith('/api/'):
-            self.handle_api_post(path)
+        HTTP/1.1 clients get chunked encoding and keep the connection;
+        older clients read until the connection closes.
+        """
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.chunked = self.request_version >= 'HTTP/1.1'
+        if self.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
         else:
-            self.send_error(404, "Not Found")
+            self.close_connection = True
+        for name, value in self.connection_headers():
+            self.send_header(name, value)
+        self.end_headers()
+    
+    def write_chunk(self, data):
+        if not data:
+            # An empty chunk would end the body
+            return
+        if self.chunked:
+            data = b'%x\r\n%s\r\n' % (len(data), data)
+        self.wfile.write(data)
+    
+    def end_stream(self):
+        if self.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+            self.chunked = False
+    
+    def _send_buffered_response(self):
+        """Write the buffered response to the socket"""
+        response, self.response = self.response, None
+        if response.status is None:
+            self.log_message(f"No response from handler for {self.command} {self.path}")
+            response.status = 500
+        for name, value in self.default_headers:
+            if response.get_header(name) is None:
+                response.headers.append((name, value))
+        response.remove_header('Content-Length')
+        response.remove_header('Connection')
+        response.headers.extend(self.connection_headers())
+        
+        self.send_response_only(response.status, response.message)
+        self.send_header('Server', self.version_string())
+        self.send_header('Date', self.date_time_string())
+        for name, value in response.headers:
+            self.send_header(name, value)
+        if response.status >= 200 and response.status not in (204, 304):
+            self.send_header('Content-Length', str(len(response.body)))
+        super().end_headers()
+        if self.command != 'HEAD' and response.body:
+            self.wfile.write(response.body)
+    
+    def respond(self, body, status=200, content_type='text/html', headers=()):
+        """Send a complete response"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def redirect(self, location, headers=()):
+        """Send a 302 redirect"""
+        self.send_response(302)
+        self.send_header('Location', location)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def send_json(self, data, status=200, headers=()):
+        """Send a JSON response"""
+        self.respond(json.dumps(data), status, 'application/json', headers)
     
     def get_current_user(self):
-        """Get current logged-in user from session"""
+        """Get current logged-in user from session
+        
+        The user is looked up once per request; later calls (auth checks,
+        then the handler itself) reuse it.
+        """
+        if self._current_user is not _UNRESOLVED:
+            return self._current_user
+        self._current_user = self._load_current_user()
+        return self._current_user
+    
+    def _load_current_user(self):
         session_id = self.get_session_id()
         if session_id and session_id in self.sessions:
             user_id = self.sessions[session_id]
@@ -156,9 +501,7 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
         """Check if user is authenticated"""
         user = self.get_current_user()
         if not user:
-            self.send_response(302)
-            self.send_header('Location', '/login')
-            self.end_headers()
+            self.redirect('/login')
             return None
         return user
     
@@ -166,27 +509,30 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
         """Check if user is admin"""
         user = self.require_auth()
         if user and not user.get('is_admin'):
-            self.send_response(403)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(b'<h1>403 - Admin Access Required</h1>')
+            self.respond(b'<h1>403 - Admin Access Required</h1>', 403)
             return None
         return user
     
     def read_post_data(self):
-        """Read POST data from request"""
-        content_length = int(self.headers.get('Content-Length', 0))
-        if content_length == 0:
-            return {}
+        """Read POST data from request
         
-        post_data = self.rfile.read(content_length).decode('utf-8')
-        content_type = self.headers.get('Content-Type', '')
-        
-        if 'application/json' in content_type:
-            return json.loads(post_data)
-        else:
-            # Form data
-            return urllib.parse.parse_qs(post_data)
+        Raises RequestBodyError if the body is over MAX_BODY_SIZE, takes
+        longer than BODY_READ_TIMEOUT to arrive or is badly framed.
+        """
+        self.body_read = True
+        try:
+            body = BodyReader(self.rfile, self.headers, self.connection)
+            if 'application/json' in self.headers.get('Content-Type', ''):
+                return parse_json(body)
+            else:
+                # Form data
+                return parse_form(body)
+        except RequestBodyError:
+            # Whatever is left of the body can't be skipped safely
+            self.close_connection = True
+            raise
+        finally:
+            self.connection.settimeout(self.timeout)
     
     def serve_file(self, filepath, content_type='text/html'):
         """Serve a file"""
@@ -195,46 +541,23 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
             if template_path.exists():
                 with open(template_path, 'rb') as f:
                     content = f.read()
-                self.send_response(200)
-                self.send_header('Content-type', content_type)
-                self.send_header('Content-length', str(len(content)))
-                self.end_headers()
-                self.wfile.write(content)
+                self.respond(content, content_type=content_type)
             else:
                 self.send_error(404, "File Not Found")
         except Exception as e:
             self.send_error(500, str(e))
     
     def render_template(self, template_name, **context):
-        """Enhanced template rendering with Jinja2-like syntax support"""
-        import re
+        """Enhanced template rendering with Jinja2-like syntax support
+        
+        user and current_user default to the logged-in user, if any.
+        """
+        context.setdefault('user', self.get_current_user())
+        context.setdefault('current_user', context['user'])
+        started = time.perf_counter()
         
-        template_path = Path(__file__).parent / 'templates' / template_name
         try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Handle {% extends "base.html" %}
-            extends_match = re.search(r'\{%\s*extends\s+["\'](.+?)["\']\s*%\}', content)
-            if extends_match:
-                base_template = extends_match.group(1)
-                base_path = Path(__file__).parent / 'templates' / base_template
-                if base_path.exists():
-                    with open(base_path, 'r', encoding='utf-8') as f:
-                        base_content = f.read()
-                    
-                    # Extract blocks from current template
-                    blocks = {}
-                    block_pattern = r'\{%\s*block\s+(\w+)\s*%\}(.*?)\{%\s*endblock\s*%\}'
-                    for match in re.finditer(block_pattern, content, re.DOTALL):
-                        blocks[match.group(1)] = match.group(2)
-                    
-                    # Replace blocks in base template
-                    for block_name, block_content in blocks.items():
-                        block_regex = r'\{%\s*block\s+' + block_name + r'\s*%\}.*?\{%\s*endblock\s*%\}'
-                        base_content = re.sub(block_regex, block_content, base_content, flags=re.DOTALL)
-                    
-                    content = base_content
+            content = load_template(template_name)
             
             # Handle {% if ... %}...{% endif %}
             user = context.get('user') or context.get('current_user')
@@ -242,70 +565,60 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
             is_admin = user is not None and user.get('is_admin', False) if isinstance(user, dict) else (user.is_admin if hasattr(user, 'is_admin') else False)
             
             # Handle {% if current_user.is_authenticated %}...{% else %}...{% endif %}
-            if_else_pattern = r'\{%\s*if\s+current_user\.is_authenticated\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}'
             def replace_if_else(match):
                 true_content = match.group(1)
                 false_content = match.group(2)
                 return true_content if is_authenticated else false_content
-            content = re.sub(if_else_pattern, replace_if_else, content, flags=re.DOTALL)
+            content = _IF_AUTHENTICATED_ELSE.sub(replace_if_else, content)
             
             # Handle {% if not current_user.is_authenticated %}...{% else %}...{% endif %}
-            if_not_else_pattern = r'\{%\s*if\s+not\s+current_user\.is_authenticated\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}'
             def replace_if_not_else(match):
                 true_content = match.group(1)
                 false_content = match.group(2)
                 return true_content if not is_authenticated else false_content
-            content = re.sub(if_not_else_pattern, replace_if_not_else, content, flags=re.DOTALL)
+            content = _IF_NOT_AUTHENTICATED_ELSE.sub(replace_if_not_else, content)
             
             # Handle {% if current_user.is_authenticated %}...{% endif %} (without else)
-            if_pattern2 = r'\{%\s*if\s+current_user\.is_authenticated\s*%\}(.*?)\{%\s*endif\s*%\}'
-            content = re.sub(if_pattern2, r'\1' if is_authenticated else '', content, flags=re.DOTALL)
+            content = _IF_AUTHENTICATED.sub(r'\1' if is_authenticated else '', content)
             
             # Handle {% if current_user.is_admin %}
-            if_pattern3 = r'\{%\s*if\s+current_user\.is_admin\s*%\}(.*?)\{%\s*endif\s*%\}'
-            content = re.sub(if_pattern3, r'\1' if is_admin else '', content, flags=re.DOTALL)
+            content = _IF_ADMIN.sub(r'\1' if is_admin else '', content)
             
             # Handle {% if error %} and {% if success %} blocks
-            if_error_pattern = r'\{%\s*if\s+error\s*%\}(.*?)\{%\s*endif\s*%\}'
             has_error = context.get('error', '') and str(context.get('error', '')).strip()
-            content = re.sub(if_error_pattern, r'\1' if has_error else '', content, flags=re.DOTALL)
+            content = _IF_ERROR.sub(r'\1' if has_error else '', content)
             
-            if_success_pattern = r'\{%\s*if\s+success\s*%\}(.*?)\{%\s*endif\s*%\}'
             has_success = context.get('success', '') and str(context.get('success', '')).strip()
-            content = re.sub(if_success_pattern, r'\1' if has_success else '', content, flags=re.DOTALL)
+            content = _IF_SUCCESS.sub(r'\1' if has_success else '', content)
             
             # Handle {% if latest_assessment %}...{% else %}...{% endif %}
-            if_latest_assessment_pattern = r'\{%\s*if\s+latest_assessment\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}'
             has_latest = context.get('latest_assessment')
-            content = re.sub(if_latest_assessment_pattern, r'\1' if has_latest else r'\2', content, flags=re.DOTALL)
+            content = _IF_LATEST_ASSESSMENT_ELSE.sub(r'\1' if has_latest else r'\2', content)
             
             # Handle {% if recent_assessments %}
-            if_recent_assessments_pattern = r'\{%\s*if\s+recent_assessments\s*%\}(.*?)\{%\s*endif\s*%\}'
             has_recent = context.get('recent_assessments')
-            content = re.sub(if_recent_assessments_pattern, r'\1' if has_recent else '', content, flags=re.DOTALL)
+            content = _IF_RECENT_ASSESSMENTS.sub(r'\1' if has_recent else '', content)
             
-            # Handle {% if alerts %}
-            if_alerts_pattern = r'\{%\s*if\s+alerts\s*%\}(.*?)\{%\s*endif\s*%\}'
-            has_alerts = context.get('alerts')
-            content = re.sub(if_alerts_pattern, r'\1' if has_alerts else '', content, flags=re.DOTALL)
+            # Handle {% if name == value %} and {% if name.key == value %} for context values
+            # (loop variables are not in the context and are left for the loop handler)
+            def replace_if_equals(match):
+                name, attr, expected, body = match.groups()
+                if name not in context:
+                    return match.group(0)
+                value = context[name]
+                if attr:
+                    value = value.get(attr) if isinstance(value, dict) else getattr(value, attr, None)
+                return body if str(value) == expected else ''
+            content = _IF_EQUALS.sub(replace_if_equals, content)
+            
+            # Handle {% if <flag> %}...{% else %}...{% endif %} for simple context flags
+            for flag in ('assessments', 'next_page_url', 'alerts', 'location_filter'):
+                content = replace_if_block(content, flag, bool(context.get(flag)))
             
             # Handle {{ url_for('route') }} - simple URL mapping
-            url_for_pattern = r'\{\{\s*url_for\(["\']([^"\']+)["\']\)\s*\}\}'
-            url_map = {
-                'index': '/',
-                'auth.register': '/register',
-                'auth.login': '/login',
-                'auth.logout': '/logout',
-                'assessment.show_assessment': '/assessment',
-                'dashboard': '/dashboard',
-                'assessment.submit_assessment': '/assessment',
-                'alerts': '/alerts',
-                'admin.dashboard': '/admin',
-            }
             def replace_url_for(match):
-                route = match.group(1)
-                return url_map.get(route, '/')
-            content = re.sub(url_for_pattern, replace_url_for, content)
+                return ROUTES.url_for(match.group(1)) or '/'
+            content = _URL_FOR.sub(replace_url_for, content)
             
             # Handle {{ variable }} and {{ object.attribute }} substitutions
             # First handle simple variables
@@ -321,7 +634,6 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                 
                 # Also handle current_user as alias for user
                 if key == 'user' and value:
-                    user_pattern = r'\{\{\s*current_user\.(\w+)\s*\}\}'
                     def replace_user_attr(match):
                         attr = match.group(1)
                         if isinstance(value, dict):
@@ -329,12 +641,11 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                         elif hasattr(value, attr):
                             return str(getattr(value, attr))
                         return ''
-                    content = re.sub(user_pattern, replace_user_attr, content)
+                    content = _CURRENT_USER_ATTR.sub(replace_user_attr, content)
             
             # Handle SQLAlchemy objects with method calls like .strftime() and .lower() and filters
             # This pattern handles: {{ object.attribute.method() }} and {{ object.attribute|filter|filter }}
-            # Must come BEFORE object_attr_pattern to avoid matching method-less attributes
-            object_method_filter_pattern = r'\{\{\s*(\w+)\.(\w+)\.(\w+)\(\)(?:\s*\|\s*(\w+)\([^)]+\))?(?:\s*\|\s*(\w+))?\s*\}\}'
+            # Must come BEFORE _OBJECT_ATTR to avoid matching method-less attributes
             def replace_object_method_filter(match):
                 obj_name = match.group(1)
                 attr_name = match.group(2)
@@ -359,10 +670,9 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                             return str(attr)
                     return str(attr)
                 return ''
-            content = re.sub(object_method_filter_pattern, replace_object_method_filter, content)
+            content = _OBJECT_METHOD_FILTER.sub(replace_object_method_filter, content)
             
             # Also handle method calls without filters: {{ object.attribute.method() }}
-            object_method_pattern = r'\{\{\s*(\w+)\.(\w+)\.(\w+)\(\)\s*\}\}'
             def replace_object_method(match):
                 obj_name = match.group(1)
                 attr_name = match.group(2)
@@ -378,10 +688,9 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                             return str(attr)
                     return str(attr)
                 return ''
-            content = re.sub(object_method_pattern, replace_object_method, content)
+            content = _OBJECT_METHOD.sub(replace_object_method, content)
             
             # Handle object.attribute with filters: {{ object.attribute|replace(...)|safe }}
-            object_attr_filter_pattern = r'\{\{\s*(\w+)\.(\w+)(?:\s*\|\s*(\w+)\([^)]*\))?(?:\s*\|\s*(\w+))?\s*\}\}'
             def replace_object_attr_filter(match):
                 obj_name = match.group(1)
                 attr_name = match.group(2)
@@ -409,12 +718,11 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                     except:
                         pass
                 return match.group(0)
-            content = re.sub(object_attr_filter_pattern, replace_object_attr_filter, content)
+            content = _OBJECT_ATTR_FILTER.sub(replace_object_attr_filter, content)
             
             # Handle SQLAlchemy objects in loops - convert to dicts for better handling
             # Pattern: {{ object.attribute }} where object is SQLAlchemy
-            # Must come AFTER object_method_pattern
-            object_attr_pattern = r'\{\{\s*(\w+)\.(\w+)\s*\}\}'
+            # Must come AFTER _OBJECT_METHOD
             def replace_object_attr(match):
                 obj_name = match.group(1)
                 attr_name = match.group(2)
@@ -435,11 +743,10 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                     except:
                         pass
                 return match.group(0)  # Return original if nothing worked
-            content = re.sub(object_attr_pattern, replace_object_attr, content)
+            content = _OBJECT_ATTR.sub(replace_object_attr, content)
             
             # Handle {% for ... %} loops - simple implementation
             # Note: This is a basic implementation, complex loops may need adjustment
-            for_loop_pattern = r'\{%\s*for\s+(\w+)\s+in\s+(\w+)\s*%\}(.*?)\{%\s*endfor\s*%\}'
             def replace_for_loop(match):
                 var_name = match.group(1)
                 iter_name = match.group(2)
@@ -491,6 +798,11 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                             return ''
                         item_content = re.sub(if_else_pattern_simple, handle_if_simple, item_content, flags=re.DOTALL)
                         
+                        # Handle {% if variable.attr %}...{% endif %} inside loop (truthiness)
+                        if_truthy_pattern = r'\{%\s*if\s+' + var_name + r'\.(\w+)\s*%\}(.*?)\{%\s*endif\s*%\}'
+                        item_content = re.sub(if_truthy_pattern, lambda m: m.group(2) if item.get(m.group(1)) else '',
+                                              item_content, flags=re.DOTALL)
+                        
                         # Now handle variable substitutions
                         for key, value in item.items():
                             item_content = re.sub(r'\{\{\s*' + var_name + r'\.' + key + r'\s*\}\}', str(value), item_content)
@@ -537,78 +849,62 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                         result.append(item_content)
                 return ''.join(result)
             
-            content = re.sub(for_loop_pattern, replace_for_loop, content, flags=re.DOTALL)
+            content = _FOR_LOOP.sub(replace_for_loop, content)
             
             # Process remaining conditionals that might have been missed
             # Handle {% if current_user.is_admin %}...{% else %}...{% endif %}
-            if_admin_else_pattern = r'\{%\s*if\s+current_user\.is_admin\s*%\}(.*?)\{%\s*else\s*%\}(.*?)\{%\s*endif\s*%\}'
             def replace_admin_else(match):
                 true_content = match.group(1)
                 false_content = match.group(2)
                 return true_content if is_admin else false_content
-            content = re.sub(if_admin_else_pattern, replace_admin_else, content, flags=re.DOTALL)
+            content = _IF_ADMIN_ELSE.sub(replace_admin_else, content)
             
             # Remove any remaining {% ... %} tags (must be done last after all conditionals are processed)
-            content = re.sub(r'\{%[^%]*%\}', '', content)
+            content = _ANY_TAG.sub('', content)
             # Remove any remaining {{ ... }} tags
-            content = re.sub(r'\{\{[^}]*\}\}', '', content)
+            content = _ANY_VARIABLE.sub('', content)
             
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.send_header('Content-length', str(len(content.encode('utf-8'))))
-            self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
+            metrics.add_phase('render', time.perf_counter() - started)
+            self.respond(content)
         except Exception as e:
             self.send_error(500, str(e))
     
-    def serve_static(self, path):
+    def serve_static(self, filename):
         """Serve static files"""
-        file_path = path.lstrip('/')
+        file_path = 'static/' + filename
         self.serve_file(file_path, 'text/css' if file_path.endswith('.css') else 'application/javascript')
     
     def serve_index(self):
         """Serve index page"""
-        user = self.get_current_user()
-        user_dict = user if user else None
-        self.render_template('index.html', current_user=user_dict, user=user_dict)
+        self.render_template('index.html')
     
     def serve_register(self):
         """Serve registration page"""
-        user = self.get_current_user()
-        user_dict = user if user else None
         
         # Get error or success message from query parameters
-        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        query_params = self.query_params
         error_msg = urllib.parse.unquote(query_params.get('error', [''])[0]) if 'error' in query_params and query_params.get('error') else ''
         success_msg = urllib.parse.unquote(query_params.get('success', [''])[0]) if 'success' in query_params and query_params.get('success') else ''
         
-        self.render_template('register.html', 
-                           current_user=user_dict, 
-                           user=user_dict,
+        self.render_template('register.html',
                            error=error_msg,
                            success=success_msg)
     
     def serve_login(self):
         """Serve login page"""
-        user = self.get_current_user()
-        user_dict = user if user else None
         
         # Get error or success message from query parameters
-        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        query_params = self.query_params
         error_msg = query_params.get('error', [''])[0] if 'error' in query_params else ''
         success_msg = query_params.get('success', [''])[0] if 'success' in query_params else ''
         
-        self.render_template('login.html', 
-                           current_user=user_dict, 
-                           user=user_dict,
+        self.render_template('login.html',
                            error=error_msg,
                            success=success_msg)
     
     def serve_dashboard(self):
         """Serve user dashboard"""
-        user = self.require_auth()
-        if not user:
-            return
+        user = self.user
         
         db = get_db()
         try:
@@ -620,39 +916,15 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
             recent_assessments = db.query(Assessment).filter_by(user_id=user['id'])\
                 .order_by(Assessment.created_at.desc()).limit(5).all()
             
-            # Get active alerts
-            alerts = db.query(Alert).filter_by(is_active=True)\
-                .order_by(Alert.created_at.desc()).limit(10).all()
-            
-            # Get fresh user data from database to ensure all fields including location are present
-            db_user = db.query(User).filter_by(id=user['id']).first()
-            if db_user:
-                user_dict = {
-                    'id': db_user.id,
-                    'name': db_user.name or '',
-                    'email': db_user.email or '',
-                    'mobile': db_user.mobile or '',
-                    'location': db_user.location or '',
-                    'age': db_user.age,
-                    'gender': db_user.gender or '',
-                    'is_admin': db_user.is_admin or False
-                }
-            else:
-                user_dict = {
-                    'id': user['id'],
-                    'name': user.get('name', ''),
-                    'email': user.get('email', ''),
-                    'mobile': user.get('mobile', ''),
-                    'location': user.get('location', '') or '',
-                    'is_admin': user.get('is_admin', False)
-                }
+            # Active alerts for the user's state come from the in-memory index
+            alerts = [alert_view(alert) for alert in alert_index.for_location(user.get('location'), limit=5)]
             
             # Load COVID data and match user's state
-            covid_data = load_covid_data()
+            covid_data = get_covid_data()
             user_state_covid_cases = None
             covid_cases_formatted = None
-            if user_dict.get('location'):
-                user_state = user_dict['location'].strip()
+            if user.get('location'):
+                user_state = user['location'].strip()
                 # Try exact match first
                 if user_state in covid_data:
                     user_state_covid_cases = covid_data[user_state]
@@ -666,9 +938,7 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
                 if user_state_covid_cases:
                     covid_cases_formatted = f"{user_state_covid_cases:,}"
             
-            self.render_template('dashboard.html', 
-                               user=user_dict, 
-                               current_user=user_dict,
+            self.render_template('dashboard.html',
                                latest_assessment=latest_assessment,
                                recent_assessments=recent_assessments,
                                alerts=alerts,
@@ -678,60 +948,153 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
     
     def serve_assessment(self):
         """Serve assessment page"""
-        user = self.require_auth()
-        if not user:
-            return
-        # Questions for the assessment form - 12 comprehensive questions
-        questions = [
-            {'id': 'fever', 'question': 'Do you have a fever (temperature above 38°C or 100.4°F)?', 'type': 'yes_no'},
-            {'id': 'cough', 'question': 'Do you have a cough or sore throat?', 'type': 'yes_no'},
-            {'id': 'shortness_breath', 'question': 'Do you experience shortness of breath or difficulty breathing?', 'type': 'yes_no'},
-            {'id': 'fatigue', 'question': 'Do you have unusual fatigue or body aches?', 'type': 'yes_no'},
-            {'id': 'loss_taste_smell', 'question': 'Have you experienced loss of taste or smell?', 'type': 'yes_no'},
-            {'id': 'travel_history', 'question': 'Have you traveled outside your state in the past 14 days?', 'type': 'yes_no'},
-            {'id': 'contact_positive', 'question': 'Have you been in close contact with someone who tested positive for COVID-19?', 'type': 'yes_no'},
-            {'id': 'public_transport', 'question': 'Do you use public transportation regularly?', 'type': 'yes_no'},
-            {'id': 'chronic_disease', 'question': 'Do you have any chronic medical conditions (diabetes, heart disease, respiratory issues)?', 'type': 'yes_no'},
-            {'id': 'household_size', 'question': 'How many people live in your household?', 'type': 'numeric'},
-            {'id': 'mask_usage', 'question': 'Do you always wear a mask when outside?', 'type': 'yes_no'},
-            {'id': 'vaccinated', 'question': 'Are you fully vaccinated against COVID-19?', 'type': 'yes_no'},
-        ]
-        user_dict = user if isinstance(user, dict) else {
-            'id': user.id, 'name': user.name, 'email': user.email, 
-            'is_admin': user.is_admin if hasattr(user, 'is_admin') else False
-        }
-        self.render_template('assessment.html', user=user_dict, current_user=user_dict, questions=questions)
+        # One-time token so a re-posted form is recognized as the same submission
+        self.render_template('assessment.html', questions=ASSESSMENT_QUESTIONS,
+                             submission_token=secrets.token_urlsafe(16))
     
     def serve_alerts(self):
         """Serve alerts page"""
-        user = self.require_auth()
-        if not user:
-            return
-        user_dict = user if isinstance(user, dict) else {
-            'id': user.id, 'name': user.name, 'email': user.email,
-            'is_admin': user.is_admin if hasattr(user, 'is_admin') else False
-        }
-        self.render_template('alerts.html', user=user_dict, current_user=user_dict)
+        user = self.user
+        
+        # Default to the alerts for the user's own state
+        query_params = self.query_params
+        location_filter = query_params.get('location', [''])[0].strip()
+        alerts = alert_index.for_location(location_filter or user.get('location'))
+        
+        self.render_template('alerts.html',
+                             alerts=[alert_view(alert) for alert in alerts],
+                             location_filter=html.escape(location_filter))
     
     def serve_admin_dashboard(self):
         """Serve admin dashboard"""
-        user = self.require_admin()
-        if not user:
-            return
-        user_dict = user if isinstance(user, dict) else {
-            'id': user.id, 'name': user.name, 'email': user.email, 'is_admin': True
-        }
-        self.render_template('admin_dashboard.html', user=user_dict, current_user=user_dict)
+        query_params = self.query_params
+        risk_level, days, cursor, limit = self.parse_assessment_filters(query_params)
+        
+        db = get_db()
+        try:
+            # Read the materialized counters instead of grouping over assessments
+            analytics = get_risk_analytics(db, days=days)
+            try:
+                page, next_cursor = list_assessments_page(db, risk_level, days, cursor, limit)
+            except ValueError:
+                # Stale or tampered cursor - start again from the newest rows
+                page, next_cursor = list_assessments_page(db, risk_level, days, None, limit)
+        finally:
+            db.close()
+        
+        assessments = [{
+            'created_at': row['created_at'].strftime('%b %d, %Y %I:%M %p'),
+            'user_name': html.escape(row['user_name'] or ''),
+            'user_email': html.escape(row['user_email'] or ''),
+            'risk_level': row['risk_level'],
+            'risk_class': row['risk_level'].lower(),
+            'risk_score': row['risk_score'],
+        } for row in page]
+        next_page_url = ''
+        if next_cursor:
+            next_page_url = '/admin?' + urllib.parse.urlencode({
+                'risk_level': risk_level or 'all', 'days': days, 'cursor': next_cursor
+            })
+        for level in ('low', 'moderate', 'high'):
+            share = analytics[level] / analytics['total'] * 100 if analytics['total'] > 0 else 0
+            analytics[f'{level}_pct'] = round(share, 1)
+        
+        self.render_template('admin_dashboard.html',
+                             analytics=analytics,
+                             alerts=[alert_view(alert, 80) for alert in alert_index.all_active(limit=5)],
+                             assessments=assessments,
+                             risk_filter=risk_level or 'all',
+                             next_page_url=next_page_url)
+    
+    def parse_assessment_filters(self, query_params):
+        """Parse risk_level, days, cursor and limit for assessment listings"""
+        risk_level = query_params.get('risk_level', [''])[0]
+        if risk_level not in ('Low', 'Moderate', 'High'):
+            risk_level = None
+        try:
+            days = int(query_params.get('days', ['7'])[0])
+        except ValueError:
+            days = 7
+        try:
+            limit = min(max(int(query_params.get('limit', ['25'])[0]), 1), 200)
+        except ValueError:
+            limit = 25
+        cursor = query_params.get('cursor', [''])[0] or None
+        return risk_level, days, cursor, limit
     
     def serve_admin_alerts(self):
         """Serve admin alerts management"""
-        user = self.require_admin()
-        if not user:
+        query_params = self.query_params
+        error_msg = query_params.get('error', [''])[0]
+        success_msg = query_params.get('success', [''])[0]
+        
+        db = get_db()
+        try:
+            alerts = db.query(Alert).order_by(Alert.created_at.desc(), Alert.id.desc()).limit(100).all()
+            alert_views = []
+            for alert in alerts:
+                view = alert_view({
+                    'id': alert.id, 'title': alert.title, 'message': alert.message,
+                    'target_location': alert.target_location, 'created_at': alert.created_at
+                })
+                view.update({
+                    'status_class': 'success' if alert.is_active else 'secondary',
+                    'status_label': 'Active' if alert.is_active else 'Inactive',
+                    'toggle_class': 'warning' if alert.is_active else 'success',
+                    'toggle_label': 'Deactivate' if alert.is_active else 'Activate',
+                })
+                alert_views.append(view)
+        finally:
+            db.close()
+        
+        self.render_template('admin_alerts.html',
+                             alerts=alert_views,
+                             error=html.escape(error_msg),
+                             success=html.escape(success_msg))
+    
+    def serve_admin_export(self):
+        """Stream an assessments export (admin only)
+        
+        Query parameters: format (csv or ndjson), gzip=1, start, end
+        (YYYY-MM-DD, inclusive), risk_level and location.
+        """
+        # Rarely used, so only imported on the first export
+        from export_assessments import EXPORT_FORMATS, stream_export, export_filename, parse_date
+        
+        query_params = self.query_params
+        fmt = query_params.get('format', ['csv'])[0]
+        compress = query_params.get('gzip', ['0'])[0] in ('1', 'true', 'yes')
+        risk_level = query_params.get('risk_level', [''])[0]
+        try:
+            if fmt not in EXPORT_FORMATS:
+                raise ValueError(f'Unsupported export format: {fmt}')
+            if risk_level and risk_level not in ('Low', 'Moderate', 'High'):
+                raise ValueError(f'Unknown risk level: {risk_level}')
+            filters = {
+                'start': parse_date(query_params.get('start', [''])[0]),
+                'end': parse_date(query_params.get('end', [''])[0], end=True),
+                'risk_level': risk_level or None,
+                'location': query_params.get('location', [''])[0] or None,
+            }
+        except ValueError as e:
+            self.send_error(400, str(e))
             return
-        user_dict = user if isinstance(user, dict) else {
-            'id': user.id, 'name': user.name, 'email': user.email, 'is_admin': True
-        }
-        self.render_template('admin_alerts.html', user=user_dict, current_user=user_dict)
+        
+        db = get_db()
+        try:
+            chunks = stream_export(db, fmt, compress, **filters)
+            # Length is unknown up front, so the body goes out in chunks
+            self.start_stream('application/gzip' if compress else EXPORT_FORMATS[fmt], headers=[
+                ('Content-Disposition', f'attachment; filename="{export_filename(fmt, compress)}"'),
+            ])
+            for chunk in chunks:
+                self.write_chunk(chunk)
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            self.log_message("Export aborted by client")
+        finally:
+            db.close()
     
     def handle_register(self):
         """Handle user registration"""
@@ -743,10 +1106,7 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
         password = data.get('password', [''])[0] if isinstance(data.get('password'), list) else data.get('password', '')
         
         if not all([name, email, mobile, password]):
-            self.send_response(400)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(b'<h1>Error: All fields are required</h1>')
+            self.respond(b'<h1>Error: All fields are required</h1>', 400)
             return
         
         db = get_db()
@@ -755,9 +1115,7 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
             existing_user = db.query(User).filter_by(email=email).first()
             if existing_user:
                 error_msg = urllib.parse.quote('Email already exists. Please use a different email.')
-                self.send_response(302)
-                self.send_header('Location', f'/register?error={error_msg}')
-                self.end_headers()
+                self.redirect(f'/register?error={error_msg}')
                 return
             
             # Get optional fields
@@ -778,82 +1136,60 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
             
             db.add(new_user)
             db.commit()
-        except Exception as e:
+        except Exception:
             db.rollback()
-            self.send_response(500)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(f'<h1>Error: {str(e)}</h1>'.encode('utf-8'))
-            return
+            raise
         finally:
             db.close()
         
-        self.send_response(302)
-        self.send_header('Location', '/login?success=Registration successful')
-        self.end_headers()
+        self.redirect('/login?success=Registration successful')
     
     def handle_login(self):
         """Handle user login"""
+        data = self.read_post_data()
+        
+        # Handle both form data (dict of lists) and JSON
+        if isinstance(data, dict):
+            email = data.get('email', [''])[0].lower() if isinstance(data.get('email'), list) else data.get('email', '').lower()
+            password = data.get('password', [''])[0] if isinstance(data.get('password'), list) else data.get('password', '')
+        else:
+            email = ''
+            password = ''
+        
+        if not email or not password:
+            self.redirect('/login?error=Email and password are required')
+            return
+        
+        db = get_db()
         try:
-            data = self.read_post_data()
-            
-            # Handle both form data (dict of lists) and JSON
-            if isinstance(data, dict):
-                email = data.get('email', [''])[0].lower() if isinstance(data.get('email'), list) else data.get('email', '').lower()
-                password = data.get('password', [''])[0] if isinstance(data.get('password'), list) else data.get('password', '')
-            else:
-                email = ''
-                password = ''
-            
-            if not email or not password:
-                self.send_response(302)
-                self.send_header('Location', '/login?error=Email and password are required')
-                self.end_headers()
-                return
+            user = db.query(User).filter_by(email=email).first()
             
-            db = get_db()
-            try:
-                user = db.query(User).filter_by(email=email).first()
+            if user and user.check_password(password):
+                # Login successful - set session BEFORE sending response
+                session_id = secrets.token_urlsafe(32)
+                self.sessions[session_id] = user.id
                 
-                if user and user.check_password(password):
-                    # Login successful - set session BEFORE sending response
-                    session_id = secrets.token_urlsafe(32)
-                    self.sessions[session_id] = user.id
-                    
-                    if user.is_admin:
-                        redirect_url = '/admin'
-                    else:
-                        redirect_url = '/dashboard'
-                    
-                    self.send_response(302)
-                    self.send_header('Location', redirect_url)
-                    self.send_header('Set-Cookie', f'session_id={session_id}; Path=/; HttpOnly; SameSite=Lax')
-                    self.end_headers()
-                    return
+                if user.is_admin:
+                    redirect_url = '/admin'
                 else:
-                    # Login failed - invalid credentials
-                    error_msg = urllib.parse.quote('Invalid email or password. Please try again.')
-                    self.send_response(302)
-                    self.send_header('Location', f'/login?error={error_msg}')
-                    self.end_headers()
-                    return
-            except Exception as e:
-                print(f"Database error during login: {e}")
-                error_msg = urllib.parse.quote('An error occurred. Please try again.')
-                self.send_response(302)
-                self.send_header('Location', f'/login?error={error_msg}')
-                self.end_headers()
+                    redirect_url = '/dashboard'
+                
+                self.redirect(redirect_url, headers=[
+                    ('Set-Cookie', f'session_id={session_id}; Path=/; HttpOnly; SameSite=Lax')
+                ])
+                return
+            else:
+                # Login failed - invalid credentials
+                error_msg = urllib.parse.quote('Invalid email or password. Please try again.')
+                self.redirect(f'/login?error={error_msg}')
                 return
-            finally:
-                db.close()
         except Exception as e:
-            print(f"Error in handle_login: {e}")
-            import traceback
-            traceback.print_exc()
-            self.send_response(500)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(f'<h1>Server Error: {str(e)}</h1>'.encode('utf-8'))
+            log.exception(f"Database error during login: {e}", extra=self.log_context())
+            error_msg = urllib.parse.quote('An error occurred. Please try again.')
+            self.redirect(f'/login?error={error_msg}')
+            return
+        finally:
+            db.close()
     
     def handle_logout(self):
         """Handle user logout"""
@@ -861,20 +1197,34 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
         if session_id and session_id in self.sessions:
             del self.sessions[session_id]
         
-        self.send_response(302)
-        self.send_header('Location', '/')
-        self.send_header('Set-Cookie', 'session_id=; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT')
-        self.end_headers()
+        self.redirect('/', headers=[('Set-Cookie', 'session_id=; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT')])
     
     def handle_assessment(self):
         """Handle assessment submission"""
-        user = self.require_auth()
-        if not user:
-            return
+        user = self.user
         
+        db = None
+        idempotency_key = None
         try:
             data = self.read_post_data()
-            db = get_db()
+            
+            token = data.pop('submission_token', None)
+            token = token[0] if isinstance(token, list) else token
+            if token and len(token) <= 64:
+                idempotency_key = (user['id'], token)
+                first, result = submission_cache.claim(idempotency_key)
+                if not first:
+                    idempotency_key = None
+                    if result is IN_PROGRESS:
+                        # The original request is still saving it; never save it twice
+                        self.log_message(f"Assessment submission still in progress: User {user['id']}")
+                        self.respond(b'<h1>409 - Your assessment is still being saved, please check back shortly</h1>',
+                                     409, headers=[('Retry-After', '5')])
+                        return
+                    # Double-click or retry: answer like the original request did
+                    self.log_message(f"Duplicate assessment submission ignored: User {user['id']}")
+                    self.redirect(result)
+                    return
             
             # Extract answers from form data
             answers = {}
@@ -889,186 +1239,445 @@ class AdityaSetuHandler(BaseHTTPRequestHandler):
             risk_score = self.calculate_risk_score(answers)
             
             # Determine risk level
-            if risk_score <= 2:
-                risk_level = "Low"
-            elif risk_score <= 5:
-                risk_level = "Moderate"
-            else:
-                risk_level = "High"
+            risk_level = get_risk_level(risk_score)
             
             # Generate recommendations
             recommendations = self.generate_recommendations(risk_level, answers)
             
             # Create and save assessment
-            assessment = Assessment(
-                user_id=user['id'],
-                answers=answers,
-                risk_score=risk_score,
-                risk_level=risk_level,
-                recommendations=recommendations
-            )
+            values = {
+                'user_id': user['id'],
+                'answers': answers,
+                'risk_score': risk_score,
+                'risk_level': risk_level,
+                'recommendations': recommendations,
+                'created_at': datetime.utcnow(),
+            }
             
-            db.add(assessment)
-            db.commit()
+            if assessment_writer.enabled:
+                def resolved(assessment_id, error, key=idempotency_key):
+                    # Settles the form token if this request stops waiting first
+                    if key is None:
+                        return
+                    if error is None:
+                        submission_cache.complete(key, '/dashboard')
+                    else:
+                        submission_cache.release(key)
+                
+                # Group-committed by the writer thread; returns once it is durable
+                try:
+                    assessment_writer.write(values, location=user.get('location'), on_resolved=resolved)
+                except WriteTimeout:
+                    # Still queued: keep the token claimed until the writer settles it,
+                    # so the retry asked for below is not saved a second time
+                    idempotency_key = None
+                    raise
+            else:
+                db = get_db()
+                # Counters are updated in the same transaction as the insert
+                record_assessment(db, Assessment(**values), location=user.get('location'))
+                db.commit()
             
             self.log_message(f"Assessment created: User {user['id']}, Risk: {risk_level}, Score: {risk_score}")
             
-            self.send_response(302)
-            self.send_header('Location', '/dashboard')
-            self.end_headers()
+            if idempotency_key:
+                submission_cache.complete(idempotency_key, '/dashboard')
+                idempotency_key = None
+            self.redirect('/dashboard')
             
-        except Exception as e:
-            db.rollback()
-            import traceback
-            self.log_message(f"Error creating assessment: {e}")
-            traceback.print_exc()
-            self.send_response(500)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(f'<h1>Error: {str(e)}</h1><pre>{traceback.format_exc()}</pre>'.encode('utf-8'))
+        except WriterBusy as e:
+            self.log_message(f"Assessment not saved: {e}")
+            self.respond(b'<h1>503 - Server busy, please submit the assessment again</h1>', 503,
+                         headers=[('Retry-After', '1')])
+        except Exception:
+            if db is not None:
+                db.rollback()
+            raise
         finally:
-            if 'db' in locals():
+            if idempotency_key:
+                # Not saved, so a retry with the same token must run again
+                submission_cache.release(idempotency_key)
+            if db is not None:
                 db.close()
     
     def calculate_risk_score(self, answers):
         """Calculate risk score based on assessment answers"""
-        score = 0
+        return calculate_risk_score(answers)
+    
+    def generate_recommendations(self, risk_level, answers):
+        """Generate recommendations based on risk level and answers"""
+        return generate_recommendations(risk_level, answers)
+    
+    def handle_create_alert(self):
+        """Handle alert creation (admin only)"""
+        user = self.user
         
-        # High risk symptoms (2 points each)
-        if answers.get('fever') == 'yes':
-            score += 2
-        if answers.get('shortness_breath') == 'yes':
-            score += 2
-        if answers.get('loss_taste_smell') == 'yes':
-            score += 2
-        if answers.get('contact_positive') == 'yes':
-            score += 2
+        data = self.read_post_data()
+        title = data.get('title', [''])[0] if isinstance(data.get('title'), list) else data.get('title', '')
+        message = data.get('message', [''])[0] if isinstance(data.get('message'), list) else data.get('message', '')
+        target_location = data.get('target_location', [''])[0] if isinstance(data.get('target_location'), list) else data.get('target_location', '')
+        title, message, target_location = title.strip(), message.strip(), target_location.strip()
         
-        # Moderate risk symptoms (1 point each)
-        if answers.get('cough') == 'yes':
-            score += 1
-        if answers.get('fatigue') == 'yes':
-            score += 1
-        if answers.get('travel_history') == 'yes':
-            score += 1
-        if answers.get('chronic_disease') == 'yes':
-            score += 1
+        if not title or not message:
+            error_msg = urllib.parse.quote('Title and message are required.')
+            self.redirect(f'/admin/alerts?error={error_msg}')
+            return
+        
+        db = get_db()
+        try:
+            alert = Alert(
+                title=title[:200],
+                message=message,
+                # Store the statw.txt state name when the location is recognized
+                target_location=(canonical_state(target_location) or target_location[:200]) or None,
+                created_by=user['id']
+            )
+            db.add(alert)
+            db.flush()
+            alert_id = alert.id
+            # Queued in the same transaction, so the alert never exists without its fan-out
+            enqueue('alert_fanout', {'alert_id': alert_id}, priority=PRIORITY_HIGH, session=db)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.log_message(f"Error creating alert: {e}")
+            error_msg = urllib.parse.quote('Could not create the alert. Please try again.')
+            self.redirect(f'/admin/alerts?error={error_msg}')
+            return
+        finally:
+            db.close()
         
-        # Lifestyle factors
-        if answers.get('public_transport') == 'yes':
-            score += 1
+        self.log_message(f"Alert created: {alert_id} by user {user['id']}")
         
-        # Household size risk (1 point if >4 people)
+        success_msg = urllib.parse.quote('Alert created.')
+        self.redirect(f'/admin/alerts?success={success_msg}')
+    
+    def handle_alert_action(self, alert_id, action):
+        """Handle /admin/alerts/<id>/toggle and /admin/alerts/<id>/delete (admin only)"""
+        db = get_db()
         try:
-            household_size = int(answers.get('household_size', '0'))
-            if household_size > 4:
-                score += 1
-        except (ValueError, TypeError):
-            pass
+            alert = db.get(Alert, alert_id)
+            if alert is None:
+                self.send_error(404, "Alert Not Found")
+                return
+            if action == 'toggle':
+                alert.is_active = not alert.is_active
+                if alert.is_active:
+                    # Users who registered while the alert was inactive still need notifying
+                    enqueue('alert_fanout', {'alert_id': alert_id}, priority=PRIORITY_HIGH, session=db)
+            else:
+                db.query(Notification).filter_by(alert_id=alert_id).delete(synchronize_session=False)
+                db.delete(alert)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.send_error(500, str(e))
+            return
+        finally:
+            db.close()
         
-        # Protective factors (reduce score)
-        if answers.get('vaccinated') == 'yes':
-            score -= 1
-        if answers.get('mask_usage') == 'yes':
-            score -= 1
+        self.redirect('/admin/alerts')
+    
+    def serve_api_admin_assessments(self):
+        """Admin assessment list as JSON, paginated with a keyset cursor"""
+        risk_level, days, cursor, limit = self.parse_assessment_filters(self.query_params)
+        db = get_db()
+        try:
+            page, next_cursor = list_assessments_page(db, risk_level, days, cursor, limit)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        finally:
+            db.close()
         
-        # Ensure score doesn't go below 0
-        return max(0, score)
+        for row in page:
+            row['created_at'] = row['created_at'].isoformat()
+        self.send_json({'assessments': page, 'next_cursor': next_cursor})
     
-    def generate_recommendations(self, risk_level, answers):
-        """Generate recommendations based on risk level and answers"""
-        recommendations = []
+    def serve_api_jobs(self, job_id=None):
+        """Job queue status (admin only)
         
-        if risk_level == "High":
-            recommendations.append("⚠️ HIGH RISK DETECTED")
-            recommendations.append("Please seek immediate medical attention.")
-            recommendations.append("Contact your healthcare provider or visit the nearest hospital.")
-            recommendations.append("Self-isolate immediately and avoid contact with others.")
-            if answers.get('vaccinated') != 'yes':
-                recommendations.append("Consider getting vaccinated as soon as possible.")
-        elif risk_level == "Moderate":
-            recommendations.append("⚠️ MODERATE RISK")
-            recommendations.append("Monitor your symptoms closely.")
-            recommendations.append("Consider consulting with a healthcare professional.")
-            recommendations.append("Stay home and avoid unnecessary outdoor activities.")
-            recommendations.append("Continue social distancing and wear a mask.")
-            if answers.get('vaccinated') != 'yes':
-                recommendations.append("Getting vaccinated can help reduce your risk.")
-        else:
-            recommendations.append("✅ LOW RISK")
-            recommendations.append("Continue following health guidelines.")
-            recommendations.append("Maintain good hygiene practices.")
-            recommendations.append("Wear masks in public places.")
-            recommendations.append("Maintain social distancing.")
-            if answers.get('vaccinated') != 'yes':
-                recommendations.append("Consider getting vaccinated to protect yourself further.")
+        /api/admin/jobs returns queue counts, throughput and latency plus the
+        most recent jobs (filter with status, kind and limit);
+        /api/admin/jobs/<id> returns a single job.
+        """
+        query_params = self.query_params
+        status = query_params.get('status', [''])[0]
+        kind = query_params.get('kind', [''])[0]
+        limit = query_params.get('limit', ['50'])[0]
+        if status and status not in JOB_STATUSES or not limit.isdigit():
+            self.send_json({'error': 'Invalid status or limit'}, 400)
+            return
+        
+        db = get_db()
+        try:
+            if job_id is not None:
+                job = db.get(Job, job_id)
+                if job is None:
+                    self.send_json({'error': 'Job not found'}, 404)
+                    return
+                data = job_dict(job)
             else:
-                recommendations.append("Good job staying vaccinated! Continue following safety measures.")
+                data = {
+                    'queue': queue_status(db),
+                    'jobs': list_jobs(db, status or None, kind or None, min(int(limit), 500)),
+                }
+        finally:
+            db.close()
+        self.send_json(data)
+    
+    def serve_api_alerts(self):
+        """Serve active alerts as JSON from the pre-encoded alert snapshot
         
-        # Additional specific recommendations based on symptoms
-        if answers.get('fever') == 'yes' or answers.get('cough') == 'yes':
-            recommendations.append("Monitor your temperature regularly and stay hydrated.")
+        Query parameters: location (alerts targeted there plus untargeted
+        ones), since (only ids above it), cursor and limit (pagination; the
+        next cursor comes back in X-Next-Cursor and a Link header).
+        Conditional requests with a matching If-None-Match get a 304.
+        """
+        query_params = self.query_params
+        location = query_params.get('location', [''])[0]
+        try:
+            since = int(query_params['since'][0]) if query_params.get('since') else None
+            limit = min(max(int(query_params['limit'][0]), 1), 200) if query_params.get('limit') else None
+            cursor = query_params.get('cursor', [''])[0] or None
+            etag, body, next_cursor = alert_index.api_page(location, since, cursor, limit)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
         
-        if answers.get('chronic_disease') == 'yes':
-            recommendations.append("Since you have chronic conditions, be extra careful and consult your doctor regularly.")
+        if_none_match = self.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return
         
-        return '\n'.join(recommendations)
+        headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+        if next_cursor:
+            params = {key: values[0] for key, values in query_params.items() if key != 'cursor'}
+            params['cursor'] = next_cursor
+            headers.append(('X-Next-Cursor', next_cursor))
+            headers.append(('Link', f'</api/alerts?{urllib.parse.urlencode(params)}>; rel="next"'))
+        self.respond(body, content_type='application/json', headers=headers)
     
-    def handle_create_alert(self):
-        """Handle alert creation (admin only)"""
-        user = self.require_admin()
-        if not user:
+    def serve_alert_stream(self):
+        """Push alert changes as Server-Sent Events
+        
+        ?location=<state> limits the stream to alerts targeted there (plus
+        untargeted ones). Reconnecting clients send Last-Event-ID (or
+        ?last_event_id=) to receive the events they missed.
+        """
+        query_params = self.query_params
+        location = query_params.get('location', [''])[0] or None
+        last_event_id = self.headers.get('Last-Event-ID') or query_params.get('last_event_id', [''])[0]
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        
+        subscription = alert_broker.subscribe(location, last_event_id)
+        if subscription is None:
+            self.respond(b'', 503, content_type='text/plain', headers=[('Retry-After', '30')])
             return
         
-        data = self.read_post_data()
-        # Process and save alert
-        # (Implementation details)
+        try:
+            self.start_stream('text/event-stream', headers=[
+                ('Cache-Control', 'no-cache'),
+                ('X-Accel-Buffering', 'no'),
+            ])
+            self.write_chunk(b'retry: 3000\n\n')
+            self.wfile.flush()
+            while True:
+                frames = subscription.wait(HEARTBEAT_INTERVAL)
+                if subscription.overflowed:
+                    # Too far behind - the client reconnects and resumes from history
+                    break
+                self.write_chunk(b''.join(frames) if frames else b': ping\n\n')
+                self.wfile.flush()
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            self.close_connection = True
+        finally:
+            alert_broker.unsubscribe(subscription)
+    
+    def serve_metrics(self):
+        """Prometheus metrics, for the local machine or a logged-in admin"""
+        if self.client_address[0] not in LOOPBACK_ADDRESSES and not self.require_admin():
+            return
+        self.respond(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+    
+    def serve_healthz(self):
+        """Liveness probe: 200 whenever the process is answering requests"""
+        self.send_json({'status': 'ok'}, headers=[('Cache-Control', 'no-store')])
+    
+    def serve_readyz(self):
+        """Readiness probe: 200 when warmed up and every readiness check passes, 503 otherwise
         
-        self.send_response(302)
-        self.send_header('Location', '/admin/alerts')
-        self.end_headers()
+        The checks (the check_* functions) are cached for about a
+        second. The body lists each check and the startup report.
+        """
+        headers = [('Cache-Control', 'no-store')]
+        if not server_ready.is_set():
+            status = 'warming_up' if startup.ready_after is None else 'shutting_down'
+            self.send_json({'status': status, 'startup': startup.as_dict()}, 503, headers=headers)
+            return
+        ready, checks = readiness.run()
+        body = {'status': 'ready' if ready else 'not_ready', 'checks': checks, 'startup': startup.as_dict()}
+        self.send_json(body, 200 if ready else 503, headers=headers)
     
-    def handle_api_get(self, path, query_params):
-        """Handle API GET requests"""
-        if path == '/api/alerts':
-            db = get_db()
-            try:
-                alerts = db.query(Alert).filter_by(is_active=True).all()
-                
-                result = []
-                for alert in alerts:
-                    result.append({
-                        'id': alert.id,
-                        'title': alert.title,
-                        'message': alert.message,
-                        'target_location': alert.target_location,
-                        'created_at': alert.created_at.isoformat() if alert.created_at else None
-                    })
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode('utf-8'))
-            finally:
-                db.close()
+    def serve_debug_queries(self):
+        """Per-route query counts, slow queries and N+1 suspects (admin only)
+        
+        Only collected when the server runs with DB_PROFILE=1.
+        """
+        self.send_json(query_profiler.report())
+    
+    def serve_debug_profile(self):
+        """Sample every thread for ?seconds= (default 10) and return collapsed stacks (admin only)
+        
+        The result loads into flamegraph.pl or speedscope. ?interval_ms= sets
+        the sampling interval (default 10) and ?idle=1 keeps threads that
+        are only waiting.
+        """
+        query_params = self.query_params
+        try:
+            seconds = float(query_params.get('seconds', ['10'])[0])
+            interval = float(query_params.get('interval_ms', ['10'])[0]) / 1000
+            if not 0 < seconds <= MAX_SECONDS:
+                raise ValueError(f'seconds must be between 0 and {MAX_SECONDS}')
+            if not 0.001 <= interval <= 1:
+                raise ValueError('interval_ms must be between 1 and 1000')
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        include_idle = query_params.get('idle', ['0'])[0] in ('1', 'true', 'yes')
+        
+        try:
+            counts, samples = sampling_profiler.profile(seconds, interval, include_idle)
+        except ProfilerBusy as e:
+            self.send_json({'error': str(e)}, 409)
+            return
+        filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+        self.respond(collapse(counts), content_type='text/plain; charset=utf-8', headers=[
+            ('Content-Disposition', f'attachment; filename="{filename}"'),
+            ('X-Profile-Samples', str(samples)),
+        ])
     
-    def handle_api_post(self, path):
-        """Handle API POST requests"""
-        self.send_error(501, "Not Implemented")
+    def handle_create_job(self):
+        """Queue an export or rescoring job (admin only)
+        
+        Expects JSON {"kind": ..., "payload": {...}} and answers 202 with the
+        job id; poll /api/admin/jobs/<id> for the outcome.
+        """
+        user = self.user
+        
+        try:
+            data = self.read_post_data()
+            if not isinstance(data, dict):
+                raise ValueError('Expected a JSON object')
+            kind = data.get('kind')
+            payload = data.get('payload') or {}
+            if kind not in ADMIN_JOB_KINDS:
+                raise ValueError(f"kind must be one of: {', '.join(ADMIN_JOB_KINDS)}")
+            if not isinstance(payload, dict):
+                raise ValueError('payload must be an object')
+            if kind == 'export_assessments':
+                validate_export_payload(payload)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        
+        job_id = enqueue(kind, payload, priority=PRIORITY_LOW)
+        self.log_message(f"Job queued: {job_id} ({kind}) by user {user['id']}")
+        self.send_json({'id': job_id, 'status': 'queued'}, 202)
     
     def log_message(self, format, *args):
-        """Override to customize logging"""
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
+        """Log an application message, tagged with the request id"""
+        log.info(format, *args, extra=self.log_context())
+    
+    def log_context(self):
+        return {'request_id': self.request_id, 'client': self.client_address[0]}
+
+
+H = AdityaSetuHandler
+ROUTES = Router()
+# Pages
+ROUTES.add('GET', '/', H.serve_index, name='index')
+ROUTES.add('GET', '/register', H.serve_register, name='auth.register')
+ROUTES.add('POST', '/register', H.handle_register)
+ROUTES.add('GET', '/login', H.serve_login, name='auth.login')
+ROUTES.add('POST', '/login', H.handle_login)
+ROUTES.add('GET', '/logout', H.handle_logout, name='auth.logout')
+ROUTES.add('GET', '/dashboard', H.serve_dashboard, auth='user', name='dashboard')
+ROUTES.add('GET', '/assessment', H.serve_assessment, auth='user', name='assessment.show_assessment')
+ROUTES.add('POST', '/assessment', H.handle_assessment, auth='user', name='assessment.submit_assessment')
+ROUTES.add('GET', '/alerts', H.serve_alerts, auth='user', name='alerts')
+ROUTES.add('GET', '/static/<path:filename>', H.serve_static)
+# Admin
+ROUTES.add('GET', '/admin', H.serve_admin_dashboard, auth='admin', name='admin.dashboard')
+ROUTES.add('GET', '/admin/alerts', H.serve_admin_alerts, auth='admin', name='admin.manage_alerts')
+ROUTES.add('POST', '/admin/alerts', H.handle_create_alert, auth='admin')
+ROUTES.add('POST', '/admin/alerts/<int:alert_id>/toggle', H.handle_alert_action, auth='admin',
+           name='admin.toggle_alert', defaults={'action': 'toggle'})
+ROUTES.add('POST', '/admin/alerts/<int:alert_id>/delete', H.handle_alert_action, auth='admin',
+           name='admin.delete_alert', defaults={'action': 'delete'})
+ROUTES.add('GET', '/admin/export', H.serve_admin_export, auth='admin', stream=True)
+# API
+ROUTES.add('GET', '/api/alerts', H.serve_api_alerts)
+ROUTES.add('GET', '/api/alerts/stream', H.serve_alert_stream, stream=True)
+ROUTES.add('GET', '/api/admin/assessments', H.serve_api_admin_assessments, auth='admin')
+ROUTES.add('GET', '/api/admin/jobs', H.serve_api_jobs, auth='admin')
+ROUTES.add('GET', '/api/admin/jobs/<int:job_id>', H.serve_api_jobs, auth='admin', name='api.job')
+ROUTES.add('POST', '/api/admin/jobs', H.handle_create_job, auth='admin')
+
+ROUTES.add('GET', '/metrics', H.serve_metrics, name='metrics')
+ROUTES.add('GET', '/healthz', H.serve_healthz, name='healthz')
+ROUTES.add('GET', '/readyz', H.serve_readyz, name='readyz')
+ROUTES.add('GET', '/admin/debug/queries', H.serve_debug_queries, auth='admin', name='admin.debug_queries')
+ROUTES.add('GET', '/admin/debug/profile', H.serve_debug_profile, auth='admin', name='admin.debug_profile')
+
+
+def call_route(request):
+    """Innermost step of the pipeline: run the matched handler"""
+    route = request.route
+    if route is None:
+        if request.route_params:
+            # Known path, wrong method; route_params holds the allowed ones
+            request.respond(b'<h1>405 - Method Not Allowed</h1>', 405,
+                            headers=[('Allow', ', '.join(request.route_params))])
+        else:
+            request.send_error(404, "Not Found")
+        return
+    route.handler(request, **request.route_params)
+
+
+PIPELINE = build_pipeline(DEFAULT_MIDDLEWARE, call_route)
+
+instrument_engine(engine)
+query_profiler.install(engine)
+metrics.gauge('sessions_active', 'Logged-in sessions', lambda: len(AdityaSetuHandler.sessions))
+metrics.gauge('assessment_writer_pending', 'Assessments waiting for the write-behind writer',
+              lambda: assessment_writer.pending)
+metrics.gauge('alert_stream_subscribers', 'Open alert event streams', lambda: alert_broker.subscriber_count)
+metrics.gauge('startup_phase_seconds', 'Time spent in each startup phase',
+              lambda: {(('phase', name),): seconds for name, seconds in startup.as_dict()['phases'].items()})
+metrics.gauge('ready', '1 if the last readiness checks passed, else 0',
+              lambda: int(server_ready.is_set() and readiness.last_ready))
+metrics.gauge('startup_ready_seconds', 'Time from process start until the server was ready',
+              lambda: startup.ready_after or 0)
 
 
 def get_local_ip():
-    """Get the local IP address of the machine"""
+    """Get the local IP address of the machine
+    
+    Connecting a UDP socket sends no packets; it only asks the OS which
+    interface would route to the address, so this returns immediately
+    (127.0.0.1 if there is no route at all).
+    """
     try:
-        # Connect to a remote address to determine local IP
-        # This doesn't actually send data, just determines the local IP
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            # Connect to a public DNS server (doesn't actually connect)
             s.connect(('8.8.8.8', 80))
             ip = s.getsockname()[0]
         except Exception:
@@ -1081,7 +1690,11 @@ def get_local_ip():
 
 
 def get_public_ip():
-    """Get the public IP address (for external access)"""
+    """Get the public IP address (for external access)
+    
+    Makes outbound HTTPS requests that take up to 3s each to fail, so
+    never call this before the server is serving.
+    """
     try:
         import urllib.request
         # Try multiple services in case one is down
@@ -1107,6 +1720,131 @@ def get_public_ip():
         return None
 
 
+def print_external_access(port, local_ip, public_ip):
+    """Print how to reach the server from other networks"""
+    print(f"\n  [*] External Network Access:")
+    if public_ip:
+        print(f"     Public IP: {public_ip}")
+        print(f"     URL:       http://{public_ip}:{port}")
+        print(f"\n     [*] WARNING: This will only work if:")
+        print(f"        1. Port forwarding is configured on your router")
+        print(f"        2. Port {port} is forwarded to {local_ip}:{port}")
+        print(f"        3. Your firewall allows external connections")
+        print(f"\n     For easier external access, use ngrok:")
+        print(f"        python start_with_ngrok.py")
+    else:
+        print(f"     Could not determine public IP.")
+        print(f"     To access from different networks:")
+        print(f"       1. Use port forwarding on your router, OR")
+        print(f"       2. Use ngrok: python start_with_ngrok.py")
+        print(f"       3. Run: python setup_external_access.py for instructions")
+
+
+def print_access_info(port):
+    """Print the local and LAN URLs; the public IP follows later if PUBLIC_IP_LOOKUP is set"""
+    local_ip = get_local_ip()
+    print(f"\n{'='*60}")
+    print("Server Access Information")
+    print(f"{'='*60}")
+    print(f"  [OK] Local:        http://localhost:{port}")
+    print(f"  [OK] Same Network: http://{local_ip}:{port}")
+    if PUBLIC_IP_LOOKUP:
+        print(f"\n  [*] External Network Access: looking up the public IP...")
+        # Reported when the lookup finishes, without holding up startup
+        threading.Thread(target=lambda: print_external_access(port, local_ip, get_public_ip()),
+                         name='public-ip-lookup', daemon=True).start()
+    else:
+        print(f"\n  [*] External Network Access:")
+        print(f"     Set PUBLIC_IP_LOOKUP=1 to show the public IP, or")
+        print(f"     run: python setup_external_access.py for instructions")
+    print(f"\n  Note: Make sure your firewall allows connections on port {port}")
+    print(f"{'='*60}")
+
+
+def check_database():
+    """One round trip through the connection pool"""
+    with engine.connect() as connection:
+        connection.exec_driver_sql('SELECT 1')
+    details = {}
+    if hasattr(engine.pool, 'checkedout'):
+        details['pool_checked_out'] = engine.pool.checkedout()
+    return True, details
+
+
+def check_templates():
+    """Every page template is in the template cache"""
+    expected = len(list(TEMPLATE_DIR.glob('*.html')))
+    return len(_template_cache) >= expected, {'cached': len(_template_cache), 'expected': expected}
+
+
+def check_job_workers():
+    """This process's job workers are running (if it has any)
+
+    The queue is shared by every replica, so its backlog is reported but
+    never fails the check: it says nothing about this process serving HTTP.
+    """
+    db = get_db()
+    try:
+        depth = queue_depth(db)
+    finally:
+        db.close()
+    return job_workers.running or WORKER_COUNT <= 0, {'workers': WORKER_COUNT, 'queued': depth}
+
+
+def check_assessment_writer():
+    """The write-behind queue has room (always true when it is off)"""
+    pending = assessment_writer.pending
+    return pending < WRITER_MAX_QUEUED, {'pending': pending, 'max': WRITER_MAX_QUEUED}
+
+
+readiness.register('database', check_database)
+readiness.register('templates', check_templates)
+readiness.register('job_workers', check_job_workers)
+readiness.register('assessment_writer', check_assessment_writer)
+
+
+def warm_up():
+    """Do the first-request work up front: read the templates, open pool
+    connections and load the COVID data and alert index
+    
+    Run by run_server once the socket is bound; /readyz reports ready when
+    it finishes. Each step is a phase in the startup report.
+    """
+    with startup.phase('templates'):
+        preload_templates()
+    with startup.phase('db_pool'):
+        # Check several connections out at once so the pool opens that many
+        connections = []
+        try:
+            for _ in range(WARM_UP_CONNECTIONS):
+                connections.append(engine.connect())
+                connections[-1].exec_driver_sql('SELECT 1')
+        finally:
+            for connection in connections:
+                connection.close()
+        # Compiles (and caches) the user lookup most requests make
+        db = get_db()
+        try:
+            db.query(User).filter_by(id=0).first()
+        finally:
+            db.close()
+    with startup.phase('covid_data'):
+        get_covid_data()
+        canonical_state('Delhi')
+    with startup.phase('alert_index'):
+        alert_index.ensure_loaded()
+
+
+def _warm_up_then_ready():
+    try:
+        warm_up()
+    except Exception:
+        # Everything warm_up loads is loaded again on first use
+        log.exception("Warm-up failed; serving without it")
+    server_ready.set()
+    startup.mark_ready()
+
+
 def run_server(port=8000, host='0.0.0.0'):
     """Run the HTTP server
     
@@ -1114,52 +1852,54 @@ def run_server(port=8000, host='0.0.0.0'):
         port: Port number to bind to (default: 8000)
         host: Host address to bind to (default: '0.0.0.0' for all interfaces)
     """
+    setup_logging()
     server_address = (host, port)
-    httpd = HTTPServer(server_address, AdityaSetuHandler)
+    # One thread per connection, so long-lived event streams don't block other requests
+    httpd = ThreadingHTTPServer(server_address, AdityaSetuHandler)
+    httpd.daemon_threads = True
+    
+    # Alert fan-outs, exports and rescoring run on the background job workers
+    # (started first: /readyz checks they are running)
+    job_workers.start()
+    # The socket is bound and listening; requests are served while warm_up runs
+    threading.Thread(target=_warm_up_then_ready, name='warm-up', daemon=True).start()
     
     print(f"Starting Aditya Setu server on http://{host}:{port}")
     if host == '0.0.0.0':
-        local_ip = get_local_ip()
-        public_ip = get_public_ip()
-        
-        print(f"\n{'='*60}")
-        print("Server Access Information")
-        print(f"{'='*60}")
-        print(f"  [OK] Local:        http://localhost:{port}")
-        print(f"  [OK] Same Network: http://{local_ip}:{port}")
-        
-        if public_ip:
-            print(f"\n  [*] External Network Access:")
-            print(f"     Public IP: {public_ip}")
-            print(f"     URL:       http://{public_ip}:{port}")
-            print(f"\n     [*] WARNING: This will only work if:")
-            print(f"        1. Port forwarding is configured on your router")
-            print(f"        2. Port {port} is forwarded to {local_ip}:{port}")
-            print(f"        3. Your firewall allows external connections")
-            print(f"\n     For easier external access, use ngrok:")
-            print(f"        python start_with_ngrok.py")
-        else:
-            print(f"\n  [*] External Network Access:")
-            print(f"     Could not determine public IP.")
-            print(f"     To access from different networks:")
-            print(f"       1. Use port forwarding on your router, OR")
-            print(f"       2. Use ngrok: python start_with_ngrok.py")
-            print(f"       3. Run: python setup_external_access.py for instructions")
-        
-        print(f"\n  Note: Make sure your firewall allows connections on port {port}")
-        print(f"{'='*60}")
+        print_access_info(port)
+    # kill -USR2 <pid> writes a sampling profile to the log directory
+    install_signal_handler(LOG_DIR)
+    # docker stop sends SIGTERM; shut down as cleanly as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: _stop_serving(httpd))
     print("\nPress Ctrl+C to stop the server\n")
     
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
-        print("\nShutting down server...")
-        httpd.shutdown()
+        pass
+    print("\nShutting down server...")
+    server_ready.clear()
+    httpd.server_close()
+    assessment_writer.stop(timeout=5)
+    job_workers.stop(timeout=5)
+    stop_logging()
+
+
+def _stop_serving(httpd):
+    server_ready.clear()
+    # shutdown() waits for serve_forever to return, and the signal handler
+    # runs on the thread inside serve_forever, so call it from another one
+    threading.Thread(target=httpd.shutdown, name='shutdown', daemon=True).start()
+
+
+startup.record('imports', time.perf_counter() - startup.started)
 
 
 if __name__ == '__main__':
+    setup_logging()
     # Initialize database
-    init_database()
+    with startup.phase('database'):
+        init_database()
     
     # Run server - bind to 0.0.0.0 to allow access from any network interface
     port = int(os.environ.get('PORT', 8000))
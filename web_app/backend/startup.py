@@ -0,0 +1,56 @@
+"""
+Startup timing
+
+Imported first by server.py, so STARTED is close to process start. Each
+startup step runs inside startup.phase(name); once the server is warmed
+up, mark_ready() logs one line with every phase and the total time to
+ready. The same numbers are in /metrics (startup_phase_seconds and
+startup_ready_seconds) and in the /readyz response.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+STARTED = time.perf_counter()
+
+log = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Durations of the startup phases, in the order they ran"""
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.phases = {}  # name -> seconds
+        self.ready_after = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def mark_ready(self):
+        """Record the time from import to ready and log the report"""
+        self.ready_after = time.perf_counter() - self.started
+        with self._lock:
+            phases = ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in self.phases.items())
+        log.info(f"Ready {self.ready_after * 1000:.0f}ms after start ({phases})")
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'ready_seconds': round(self.ready_after, 3) if self.ready_after is not None else None,
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            }
+
+
+startup = StartupReport()
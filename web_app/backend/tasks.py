@@ -0,0 +1,140 @@
+"""
+Background job handlers
+
+Importing this module registers the handlers with the job queue (jobs.py).
+Each one takes the job's payload dict and returns a JSON-serializable result.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import bindparam, select
+
+from jobs import job_handler
+from models import get_db, move_risk_stats, Assessment, User
+from notifications import fan_out_alert
+from scoring import calculate_risk_score, generate_recommendations, get_risk_level
+
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', Path(__file__).parent / 'exports'))
+RESCORE_BATCH_SIZE = 1000
+
+# Job kinds an admin may queue through /api/admin/jobs
+ADMIN_JOB_KINDS = ('export_assessments', 'rescore_assessments')
+
+
+@job_handler('alert_fanout')
+def run_alert_fanout(payload):
+    return {'notifications': fan_out_alert(payload['alert_id'])}
+
+
+def validate_export_payload(payload):
+    """Check export job parameters up front; raises ValueError"""
+    from export_assessments import EXPORT_FORMATS, parse_date
+    
+    if payload.get('format', 'csv') not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {payload.get('format')}")
+    if payload.get('risk_level') not in (None, '', 'Low', 'Moderate', 'High'):
+        raise ValueError(f"Unknown risk level: {payload.get('risk_level')}")
+    parse_date(payload.get('start'))
+    parse_date(payload.get('end'), end=True)
+
+
+@job_handler('export_assessments')
+def run_export(payload):
+    """Write an assessment export to EXPORT_DIR and return its path"""
+    from export_assessments import stream_export, parse_date
+    
+    validate_export_payload(payload)
+    fmt = payload.get('format', 'csv')
+    compress = bool(payload.get('gzip'))
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='assessments-', suffix=f".{fmt}{'.gz' if compress else ''}",
+                                dir=EXPORT_DIR)
+    db = get_db()
+    try:
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in stream_export(
+                db, fmt, compress,
+                start=parse_date(payload.get('start')),
+                end=parse_date(payload.get('end'), end=True),
+                risk_level=payload.get('risk_level') or None,
+                location=payload.get('location') or None
+            ):
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.unlink(path)
+        raise
+    finally:
+        db.close()
+    return {'path': path, 'bytes': size}
+
+
+@job_handler('rescore_assessments')
+def run_rescore(payload):
+    """Re-run scoring over every assessment, e.g. after the weights changed
+
+    Rows are rescored in id order, one transaction per batch. Each batch
+    moves its rows between risk levels in the counters in the same
+    transaction, so the write lock is never held for more than one batch.
+    """
+    batch_size = int(payload.get('batch_size', RESCORE_BATCH_SIZE))
+    assessments = Assessment.__table__
+    # Only update a row still holding the level it was read with, so a
+    # second run over the same rows cannot move it in the counters twice
+    rescore = (
+        assessments.update()
+        .where(assessments.c.id == bindparam('row_id'),
+               assessments.c.risk_level == bindparam('old_risk_level'),
+               assessments.c.risk_score == bindparam('old_risk_score'))
+        .values(risk_score=bindparam('risk_score'), risk_level=bindparam('risk_level'),
+                recommendations=bindparam('recommendations'))
+    )
+    db = get_db()
+    try:
+        scanned = changed = 0
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(Assessment.id, Assessment.user_id, Assessment.answers, Assessment.risk_score,
+                       Assessment.risk_level, Assessment.created_at, User.location)
+                .join(User, User.id == Assessment.user_id)
+                .where(Assessment.id > last_id).order_by(Assessment.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            moved = []
+            for row in rows:
+                risk_score = calculate_risk_score(row.answers or {})
+                risk_level = get_risk_level(risk_score)
+                if risk_score == row.risk_score and risk_level == row.risk_level:
+                    continue
+                result = db.execute(rescore, {
+                    'row_id': row.id,
+                    'old_risk_level': row.risk_level,
+                    'old_risk_score': row.risk_score,
+                    'risk_score': risk_score,
+                    'risk_level': risk_level,
+                    'recommendations': generate_recommendations(risk_level, row.answers or {}),
+                })
+                if result.rowcount == 1:
+                    moved.append({
+                        'user_id': row.user_id,
+                        'location': row.location,
+                        'created_at': row.created_at,
+                        'old_risk_level': row.risk_level,
+                        'risk_level': risk_level,
+                        'risk_score': risk_score,
+                    })
+            move_risk_stats(db, moved)
+            db.commit()
+            scanned += len(rows)
+            changed += len(moved)
+            last_id = rows[-1].id
+        return {'scanned': scanned, 'changed': changed}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
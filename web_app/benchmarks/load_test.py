@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the web backend
+
+Seeds a fresh SQLite database with generate_data, starts run_server on it in a subprocess and
+drives it with concurrent clients. Each client logs in as its own user,
+keeps its connection open and then picks operations from a weighted mix:
+
+    login        POST /login
+    dashboard    GET /dashboard
+    assessment   GET /assessment, then POST it back (recorded separately)
+    alerts_poll  GET /api/alerts for the user's state, revalidated with ETag
+
+The first --warmup seconds are not recorded. Throughput and p50/p95/p99
+latency per operation are printed and written to results/ as JSON, so runs
+from different commits can be compared with --compare.
+
+Usage:
+    python load_test.py                              # 16 clients for 30s
+    python load_test.py --clients 32 --duration 60 --mix dashboard=1,alerts_poll=3
+    python load_test.py --env ASSESSMENT_WRITE_BEHIND=1 --compare results/load-....json
+"""
+import os
+import re
+import sys
+import time
+import random
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from collections import Counter
+
+from bench_utils import BACKEND_DIR, load_results, run_metadata, summarize, use_backend, write_results
+
+DEFAULT_MIX = 'login=5,dashboard=35,assessment=20,alerts_poll=40'
+PASSWORD = 'benchmark'
+ANSWERS = ['fever', 'cough', 'shortness_breath', 'fatigue', 'loss_taste_smell', 'travel_history',
+           'contact_positive', 'public_transport', 'chronic_disease', 'mask_usage', 'vaccinated']
+_TOKEN = re.compile(r'name="submission_token" value="([^"]+)"')
+
+
+def seed_database(database_url, args):
+    """Fill a new database with generate_data; returns (email, location) per user"""
+    os.environ['DATABASE_URL'] = database_url
+    use_backend()
+    from generate_data import generate, user_email
+
+    first_id, locations = generate(args.users, args.assessments, args.alerts, seed=args.seed, password=PASSWORD)
+    return [(user_email(first_id + i), location) for i, location in enumerate(locations)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, env, log_path):
+    code = 'import sys; from server import run_server; run_server(int(sys.argv[1]), "127.0.0.1")'
+    log = open(log_path, 'wb')
+    return subprocess.Popen([sys.executable, '-c', code, str(port)], cwd=BACKEND_DIR,
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not become ready')
+
+
+def stop_server(process):
+    if process.poll() is None:
+        # SIGINT runs the server's own shutdown (drains the write-behind queue)
+        process.send_signal(signal.SIGINT if os.name != 'nt' else signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class Client(threading.Thread):
+    """One simulated user with a keep-alive connection"""
+
+    def __init__(self, index, port, users, mix, start_at, record_from, stop_at, seed):
+        super().__init__(name=f'client-{index}', daemon=True)
+        self.port = port
+        self.email, self.location = users[index % len(users)]
+        self.operations, self.weights = zip(*mix.items())
+        self.start_at = start_at
+        self.record_from = record_from
+        self.stop_at = stop_at
+        self.rng = random.Random(seed * 1000 + index)
+        self.conn = None
+        self.cookie = None
+        self.etag = None
+        self.latencies = {}   # operation -> [seconds]
+        self.statuses = {}    # operation -> Counter of status codes
+        self.errors = Counter()
+
+    def request(self, name, method, path, body=None, headers=None, expect=(200,)):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if body is not None:
+            body = urllib.parse.urlencode(body)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        for attempt in (1, 2):
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self.conn.close()
+                self.conn = None
+                # A kept-alive connection the server has just closed: retry once
+                if attempt == 2 or not isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError,
+                                                      BrokenPipeError)):
+                    self.record(name, started, 'error')
+                    return None, None
+        self.record(name, started, response.status if response.status in expect else f'unexpected {response.status}')
+        return response, data
+
+    def record(self, name, started, status):
+        # Requests started during the warm-up are not recorded
+        if started < self.record_from:
+            return
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        self.statuses.setdefault(name, Counter())[str(status)] += 1
+        if not isinstance(status, int):
+            self.errors[name] += 1
+
+    def login(self):
+        response, _ = self.request('login', 'POST', '/login', {'email': self.email, 'password': PASSWORD},
+                                   expect=(302,))
+        if response is not None:
+            cookie = response.getheader('Set-Cookie', '')
+            if cookie:
+                self.cookie = cookie.split(';', 1)[0]
+
+    def dashboard(self):
+        self.request('dashboard', 'GET', '/dashboard')
+
+    def assessment(self):
+        response, data = self.request('assessment_form', 'GET', '/assessment')
+        if response is None or response.status != 200:
+            return
+        match = _TOKEN.search(data.decode('utf-8', 'replace'))
+        answers = {question: self.rng.choice(('yes', 'no')) for question in ANSWERS}
+        answers['household_size'] = str(self.rng.randint(1, 8))
+        if match:
+            answers['submission_token'] = match.group(1)
+        self.request('assessment_submit', 'POST', '/assessment', answers, expect=(302,))
+
+    def alerts_poll(self):
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        path = '/api/alerts?' + urllib.parse.urlencode({'location': self.location})
+        response, _ = self.request('alerts_poll', 'GET', path, headers=headers, expect=(200, 304))
+        if response is not None and response.getheader('ETag'):
+            self.etag = response.getheader('ETag')
+
+    def run(self):
+        while time.perf_counter() < self.start_at:
+            time.sleep(0.01)
+        self.login()
+        while time.perf_counter() < self.stop_at:
+            getattr(self, self.rng.choices(self.operations, self.weights)[0])()
+        if self.conn is not None:
+            self.conn.close()
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if not hasattr(Client, name) or name in ('run', 'request', 'record'):
+            raise argparse.ArgumentTypeError(f'unknown operation: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_load(port, users, args):
+    start_at = time.perf_counter() + 0.5
+    record_from = start_at + args.warmup
+    stop_at = record_from + args.duration
+    clients = [Client(i, port, users, args.mix, start_at, record_from, stop_at, args.seed)
+               for i in range(args.clients)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    latencies, statuses, errors = {}, {}, Counter()
+    for client in clients:
+        for name, values in client.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, counts in client.statuses.items():
+            statuses.setdefault(name, Counter()).update(counts)
+        errors.update(client.errors)
+
+    operations = {}
+    for name in sorted(latencies):
+        stats = summarize(latencies[name])
+        stats['throughput_rps'] = round(stats['count'] / args.duration, 2)
+        stats['errors'] = errors[name]
+        stats['statuses'] = dict(statuses[name])
+        operations[name] = stats
+    everything = [value for values in latencies.values() for value in values]
+    total = summarize(everything)
+    total['throughput_rps'] = round(total['count'] / args.duration, 2)
+    total['errors'] = sum(errors.values())
+    return {'total': total, 'operations': operations}
+
+
+def print_report(results, baseline=None):
+    print(f"\n{'operation':<20}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    rows = list(results['operations'].items()) + [('TOTAL', results['total'])]
+    for name, stats in rows:
+        print(f"{name:<20}{stats['count']:>8}{stats['throughput_rps']:>10.1f}{stats.get('p50_ms', 0):>10.1f}"
+              f"{stats.get('p95_ms', 0):>10.1f}{stats.get('p99_ms', 0):>10.1f}{stats['errors']:>8}")
+    if baseline is None:
+        return
+    print(f"\nCompared with {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')}):")
+    old_rows = dict(baseline['operations'], TOTAL=baseline['total'])
+    for name, stats in rows:
+        old = old_rows.get(name)
+        if not old or not old.get('count'):
+            continue
+        changes = []
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if old.get(key):
+                changes.append(f"{key} {(stats.get(key, 0) - old[key]) / old[key] * 100:+.1f}%")
+        print(f"  {name:<18}" + '  '.join(changes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the web backend on a seeded database')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients (default: 16)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds recorded (default: 30)')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds run before recording (default: 3)')
+    parser.add_argument('--users', type=int, default=200, help='users seeded (default: 200)')
+    parser.add_argument('--assessments', type=int, help='assessments seeded (default: 10 per user)')
+    parser.add_argument('--alerts', type=int, default=100, help='alerts seeded (default: 100)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'operation weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for data and operation order')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for the server, e.g. ASSESSMENT_WRITE_BEHIND=1')
+    parser.add_argument('-o', '--output', help='result file (default: results/load-<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    args = parser.parse_args(argv)
+    args.users = max(args.users, 1)
+    if args.assessments is None:
+        args.assessments = args.users * 10
+
+    workdir = tempfile.mkdtemp(prefix='aditya-setu-bench-')
+    database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    server_env = dict(item.split('=', 1) for item in args.env)
+    env = dict(os.environ, DATABASE_URL=database_url, LOG_DIR=os.path.join(workdir, 'logs'), **server_env)
+
+    print(f"Seeding the database in {workdir}")
+    users = seed_database(database_url, args)
+    port = free_port()
+    log_path = os.path.join(workdir, 'server.log')
+    process = start_server(port, env, log_path)
+    try:
+        wait_until_ready(port, process)
+        print(f"Running {args.clients} clients for {args.warmup:g}s warm-up + {args.duration:g}s")
+        results = run_load(port, users, args)
+    except RuntimeError as e:
+        print(f"error: {e}; server output is in {log_path}", file=sys.stderr)
+        return 1
+    finally:
+        stop_server(process)
+
+    results = {
+        'meta': run_metadata(clients=args.clients, duration=args.duration, warmup=args.warmup,
+                             users=args.users, assessments=args.assessments, alerts=args.alerts, mix=args.mix, seed=args.seed,
+                             server_env=server_env),
+        **results,
+    }
+    print_report(results, load_results(args.compare) if args.compare else None)
+    print(f"\nResults written to {write_results('load', results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
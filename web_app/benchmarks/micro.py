@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the backend's hot paths
+
+Times, in-process and without a socket:
+
+    render/<template>/<size>   render_template for every page template, with
+                               empty, typical and large lists in the context
+    scoring/...                calculate_risk_score and generate_recommendations
+    covid/load_covid_data      parsing statw.txt
+    auth/get_current_user      session lookup plus the user query
+
+Each benchmark is run in batches long enough to time reliably; the
+median time per call over --repeat batches is reported and written to
+results/ as JSON.
+
+With --check each benchmark's fastest batch is compared with baseline.json
+and the script exits with status 1 if any is more than --threshold percent
+slower (a benchmark over the threshold is measured again first, so a
+single noisy run does not fail the gate). The baseline only means something on the machine it was taken on:
+refresh it there with --update-baseline before relying on the gate.
+
+Usage:
+    python micro.py                        # run everything
+    python micro.py -k render/dashboard    # only benchmarks whose name contains this
+    python micro.py --check                # regression gate against baseline.json
+    python micro.py --update-baseline
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from bench_utils import BENCHMARKS_DIR, load_results, run_metadata, use_backend, write_results
+
+BASELINE = BENCHMARKS_DIR / 'baseline.json'
+DEFAULT_THRESHOLD = 25.0
+# Each timed batch runs for at least this long
+MIN_BATCH_SECONDS = 0.05
+SIZES = {'empty': 0, 'typical': 5, 'large': 100}
+
+# A throwaway database, so get_current_user has something to look up
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='aditya-setu-micro-'), 'micro.db')
+use_backend()
+
+from server import AdityaSetuHandler, ASSESSMENT_QUESTIONS, alert_view, _ResponseWriter  # noqa: E402
+from middleware import Response  # noqa: E402
+from models import init_database, get_db, User, Assessment  # noqa: E402
+from covid_data import load_covid_data  # noqa: E402
+from scoring import calculate_risk_score, generate_recommendations, get_risk_level  # noqa: E402
+
+YES_NO = [question['id'] for question in ASSESSMENT_QUESTIONS if question['type'] == 'yes_no']
+USER = {'id': 1, 'name': 'Bench User', 'email': 'bench@example.com', 'mobile': '0000000000',
+        'is_admin': False, 'age': 30, 'gender': 'Other', 'location': 'Kerala'}
+ADMIN = dict(USER, id=2, name='Bench Admin', is_admin=True)
+
+
+def make_handler(user=None, cookie=''):
+    """A request handler with no socket; its response is collected in memory"""
+    handler = AdityaSetuHandler.__new__(AdityaSetuHandler)
+    handler.headers = {'Cookie': cookie} if cookie else {}
+    handler.query_params = {}
+    handler.request_version = 'HTTP/1.1'
+    handler.command = 'GET'
+    handler.close_connection = False
+    handler.response = Response()
+    handler.wfile = _ResponseWriter(handler.response)
+    if user is not None:
+        handler._current_user = user
+    return handler
+
+
+def random_answers(rng):
+    answers = {question: rng.choice(('yes', 'no')) for question in YES_NO}
+    answers['household_size'] = str(rng.randint(1, 10))
+    return answers
+
+
+def alerts(count):
+    now = datetime.utcnow()
+    return [
+        alert_view({'id': i, 'title': f'Alert {i}', 'message': 'Stay indoors and follow local guidance. ' * 4,
+                    'target_location': 'Kerala' if i % 2 else None, 'created_at': now - timedelta(hours=i)})
+        for i in range(count)
+    ]
+
+
+def assessments(count):
+    rng = random.Random(count)
+    rows = []
+    for i in range(count):
+        answers = random_answers(rng)
+        score = calculate_risk_score(answers)
+        level = get_risk_level(score)
+        rows.append(Assessment(id=i + 1, user_id=USER['id'], answers=answers, risk_score=score, risk_level=level,
+                               recommendations=generate_recommendations(level, answers),
+                               created_at=datetime.utcnow() - timedelta(days=i)))
+    return rows
+
+
+def admin_rows(count):
+    now = datetime.utcnow()
+    levels = ('Low', 'Moderate', 'High')
+    return [{
+        'created_at': (now - timedelta(minutes=i)).strftime('%b %d, %Y %I:%M %p'),
+        'user_name': f'User {i}', 'user_email': f'user{i}@example.com',
+        'risk_level': levels[i % 3], 'risk_class': levels[i % 3].lower(), 'risk_score': float(i % 10),
+    } for i in range(count)]
+
+
+def template_contexts():
+    """(benchmark name, template, user, context) for every page template
+
+    base.html is only rendered through the templates that extend it.
+    """
+    analytics = {'low': 120, 'moderate': 45, 'high': 12, 'total': 177, 'days': 7,
+                 'low_pct': 67.8, 'moderate_pct': 25.4, 'high_pct': 6.8}
+    cases = []
+    for template, user, context in [
+        ('index.html', None, {}),
+        ('login.html', None, {'error': '', 'success': ''}),
+        ('register.html', None, {'error': 'Email already registered', 'success': ''}),
+        ('assessment.html', USER, {'questions': ASSESSMENT_QUESTIONS, 'submission_token': 'x' * 22}),
+    ]:
+        cases.append((f'render/{template[:-5]}', template, user, context))
+    for size, count in SIZES.items():
+        history = assessments(count)
+        cases += [
+            (f'render/dashboard/{size}', 'dashboard.html', USER, {
+                'latest_assessment': history[0] if history else None, 'recent_assessments': history,
+                'alerts': alerts(count), 'covid_cases': '6,512,789'}),
+            (f'render/alerts/{size}', 'alerts.html', USER, {'alerts': alerts(count), 'location_filter': ''}),
+            (f'render/admin_dashboard/{size}', 'admin_dashboard.html', ADMIN, {
+                'analytics': analytics, 'alerts': alerts(min(count, 5)), 'assessments': admin_rows(count),
+                'risk_filter': 'all', 'next_page_url': '/admin?cursor=abc' if count else ''}),
+            (f'render/admin_alerts/{size}', 'admin_alerts.html', ADMIN, {
+                'alerts': [dict(view, status_class='success', status_label='Active', toggle_class='warning',
+                                toggle_label='Deactivate') for view in alerts(count)],
+                'error': '', 'success': ''}),
+        ]
+    return cases
+
+
+def render_benchmark(template, user, context):
+    def run():
+        handler = make_handler(user)
+        handler.render_template(template, **context)
+        if handler.response.status != 200:
+            raise RuntimeError(f'{template} rendered with status {handler.response.status}')
+    return run
+
+
+def session_benchmark():
+    """Log a user in and time resolving them from the session cookie"""
+    init_database()
+    db = get_db()
+    try:
+        user = db.query(User).filter_by(email='micro@example.com').first()
+        if user is None:
+            user = User(name='Micro', email='micro@example.com', mobile='0000000000',
+                        password_hash='not-a-real-hash', location='Kerala')
+            db.add(user)
+            db.commit()
+        AdityaSetuHandler.sessions['micro-session'] = user.id
+    finally:
+        db.close()
+    cookie = 'theme=dark; session_id=micro-session'
+
+    def run():
+        if make_handler(cookie=cookie).get_current_user() is None:
+            raise RuntimeError('session did not resolve to a user')
+    return run
+
+
+def benchmarks():
+    """Name -> zero-argument callable"""
+    cases = {name: render_benchmark(template, user, context)
+             for name, template, user, context in template_contexts()}
+
+    rng = random.Random(1)
+    answer_sets = [random_answers(rng) for _ in range(100)]
+    scored = [(get_risk_level(calculate_risk_score(answers)), answers) for answers in answer_sets]
+
+    def score_all():
+        for answers in answer_sets:
+            calculate_risk_score(answers)
+
+    def recommend_all():
+        for level, answers in scored:
+            generate_recommendations(level, answers)
+
+    cases['scoring/calculate_risk_score x100'] = score_all
+    cases['scoring/generate_recommendations x100'] = recommend_all
+    cases['covid/load_covid_data'] = load_covid_data
+    cases['auth/get_current_user'] = session_benchmark()
+    return cases
+
+
+def measure(func, repeat):
+    """Median and minimum seconds per call over repeat batches"""
+    func()  # warm caches and imports
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_BATCH_SECONDS:
+            break
+        loops *= 2 if elapsed < MIN_BATCH_SECONDS / 4 else 1 + int(MIN_BATCH_SECONDS / max(elapsed, 1e-9))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+    return {
+        'median_us': round(statistics.median(timings) * 1e6, 3),
+        'min_us': round(min(timings) * 1e6, 3),
+        'loops': loops,
+        'repeat': repeat,
+    }
+
+
+def slowdown(stats, baseline_stats):
+    """Percent change of the fastest batch; the minimum is least disturbed by other load"""
+    return (stats['min_us'] - baseline_stats['min_us']) / baseline_stats['min_us'] * 100
+
+
+def check(results, selected, baseline, threshold, retries):
+    """Compare with the baseline; returns the names that are still slower after retries
+
+    A benchmark over the threshold is measured again up to retries times,
+    keeping its fastest result, so one noisy run does not fail the gate.
+    """
+    regressions = []
+    print(f"\nAgainst baseline from {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')}), "
+          f"threshold {threshold:g}%:")
+    for name, stats in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            print(f"  {name:<44} new")
+            continue
+        for _ in range(retries):
+            if slowdown(stats, old) <= threshold:
+                break
+            again = measure(selected[name], stats['repeat'])
+            if again['min_us'] < stats['min_us']:
+                stats = results['benchmarks'][name] = again
+        change = slowdown(stats, old)
+        slower = change > threshold
+        if slower:
+            regressions.append(name)
+        print(f"  {name:<44} {change:+7.1f}%{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmark backend hot paths')
+    parser.add_argument('-k', dest='pattern', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=7, help='timed batches per benchmark (default: 7)')
+    parser.add_argument('--check', action='store_true', help='fail if slower than the baseline by --threshold')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'allowed slowdown in percent (default: {DEFAULT_THRESHOLD:g})')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='times a benchmark over the threshold is measured again (default: 2)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default: benchmarks/baseline.json)')
+    parser.add_argument('--update-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('-o', '--output', help='result file (default: results/micro-<time>-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    selected = {name: func for name, func in benchmarks().items() if args.pattern in name}
+    if not selected:
+        parser.error(f'no benchmark matches {args.pattern!r}')
+
+    results = {'meta': run_metadata(repeat=args.repeat, pattern=args.pattern), 'benchmarks': {}}
+    print(f"{'benchmark':<44}{'median us':>12}{'min us':>12}{'loops':>8}")
+    for name, func in selected.items():
+        stats = results['benchmarks'][name] = measure(func, args.repeat)
+        print(f"{name:<44}{stats['median_us']:>12.1f}{stats['min_us']:>12.1f}{stats['loops']:>8}")
+
+    regressions = []
+    if args.check and not args.update_baseline:
+        regressions = check(results, selected, load_results(args.baseline), args.threshold, args.retries)
+    print(f"\nResults written to {write_results('micro', results, args.output)}")
+    if args.update_baseline:
+        if args.pattern:
+            # Keep the baseline entries of benchmarks that were not run
+            previous = load_results(args.baseline) if os.path.exists(args.baseline) else {'benchmarks': {}}
+            results = dict(results, benchmarks={**previous['benchmarks'], **results['benchmarks']})
+        print(f"Baseline updated: {write_results('baseline', results, args.baseline)}")
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:g}%")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
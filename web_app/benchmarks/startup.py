@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the web backend
+
+Starts run_server in a fresh process --runs times on the same database and
+measures, from the moment the process is spawned:
+
+    first_byte   until GET /login has been answered
+    ready        until /readyz answers 200 (warm-up finished)
+
+The startup report from /readyz (seconds per phase: imports, templates,
+db_pool, ...) is averaged over the runs. Results are printed and written
+to results/ as JSON.
+
+Usage:
+    python startup.py                 # 5 runs
+    python startup.py --runs 20 --env WARM_UP_CONNECTIONS=5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import http.client
+
+from bench_utils import load_results, run_metadata, summarize, use_backend, write_results
+from load_test import free_port, start_server, stop_server
+
+POLL_INTERVAL = 0.005
+
+
+def first_response(port, path, process, timeout=30):
+    """Poll path until the server answers; returns (status, body)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except OSError:
+            time.sleep(POLL_INTERVAL)
+        finally:
+            conn.close()
+    raise RuntimeError(f'server did not answer {path}')
+
+
+def measure_start(env, log_path):
+    """Seconds to first byte and to ready, and the server's own startup report"""
+    port = free_port()
+    started = time.perf_counter()
+    process = start_server(port, env, log_path)
+    try:
+        first_response(port, '/login', process)
+        first_byte = time.perf_counter() - started
+        while True:
+            status, body = first_response(port, '/readyz', process)
+            if status == 200:
+                break
+            time.sleep(POLL_INTERVAL)
+        ready = time.perf_counter() - started
+    finally:
+        stop_server(process)
+    return first_byte, ready, json.loads(body)['startup']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the backend from process start to first byte and to ready')
+    parser.add_argument('--runs', type=int, default=5, help='server starts measured (default: 5)')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra environment for the server, e.g. WARM_UP_CONNECTIONS=5')
+    parser.add_argument('-o', '--output', help='result file (default: results/startup-<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='aditya-setu-startup-')
+    database_url = f"sqlite:///{os.path.join(workdir, 'startup.db')}"
+    server_env = dict(item.split('=', 1) for item in args.env)
+    env = dict(os.environ, DATABASE_URL=database_url, LOG_DIR=os.path.join(workdir, 'logs'), **server_env)
+
+    os.environ['DATABASE_URL'] = database_url
+    use_backend()
+    from models import init_database
+    init_database()
+
+    first_bytes, readies, phases = [], [], {}
+    log_path = os.path.join(workdir, 'server.log')
+    for run in range(args.runs):
+        try:
+            first_byte, ready, report = measure_start(env, log_path)
+        except RuntimeError as e:
+            print(f"error: {e}; server output is in {log_path}", file=sys.stderr)
+            return 1
+        first_bytes.append(first_byte)
+        readies.append(ready)
+        for name, seconds in report['phases'].items():
+            phases.setdefault(name, []).append(seconds)
+        print(f"run {run + 1}: first byte {first_byte * 1000:.0f}ms, ready {ready * 1000:.0f}ms")
+
+    results = {
+        'meta': run_metadata(runs=args.runs, server_env=server_env),
+        'first_byte': summarize(first_bytes),
+        'ready': summarize(readies),
+        'phases_ms': {name: round(sum(values) / len(values) * 1000, 3) for name, values in phases.items()},
+    }
+    print(f"\n{'':<12}{'p50 ms':>10}{'max ms':>10}")
+    for name in ('first_byte', 'ready'):
+        print(f"{name:<12}{results[name]['p50_ms']:>10.1f}{results[name]['max_ms']:>10.1f}")
+    print('\nMean per phase: ' + ', '.join(f"{name} {ms:.0f}ms" for name, ms in results['phases_ms'].items()))
+    if args.compare:
+        baseline = load_results(args.compare)
+        print(f"\nCompared with {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')}):")
+        for name in ('first_byte', 'ready'):
+            old = baseline[name]['p50_ms']
+            print(f"  {name:<10} p50 {(results[name]['p50_ms'] - old) / old * 100:+.1f}%")
+    print(f"\nResults written to {write_results('startup', results, args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
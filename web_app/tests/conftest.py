@@ -0,0 +1,32 @@
+"""
+Shared test setup
+
+The backend modules read DATABASE_URL and LOG_DIR when they are imported,
+so both point into a temporary directory before any test imports them.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+TEST_DIR = tempfile.mkdtemp(prefix='aditya-setu-tests-')
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEST_DIR, 'test.db')
+os.environ['LOG_DIR'] = os.path.join(TEST_DIR, 'logs')
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def db():
+    """A session on the test database, with the tables created"""
+    from models import init_database, get_db
+    init_database()
+    session = get_db()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from alert_stream import AlertBroker, MAX_PENDING
+
+
+def publish(broker, count, location=None):
+    for i in range(count):
+        broker.publish('created', {'id': i + 1, 'title': f'Alert {i + 1}', 'message': '',
+                                   'target_location': location, 'is_active': True,
+                                   'created_at': datetime(2024, 1, 1)})
+
+
+def event_ids(frames):
+    return [int(frame.split(b'\n', 1)[0][4:]) for frame in frames]
+
+
+def test_resume_replays_missed_events():
+    broker = AlertBroker()
+    publish(broker, 5)
+    subscription = broker.subscribe(last_event_id=2)
+    assert event_ids(subscription.wait(0)) == [3, 4, 5]
+
+
+def test_resume_at_latest_event_gets_nothing():
+    broker = AlertBroker()
+    publish(broker, 5)
+    subscription = broker.subscribe(last_event_id=5)
+    assert subscription.wait(0) == []
+    assert not subscription.overflowed
+
+
+def test_resume_more_than_max_pending_behind_resets():
+    broker = AlertBroker()
+    publish(broker, MAX_PENDING + 50)
+    subscription = broker.subscribe(last_event_id=10)
+    frames = subscription.wait(0)
+    assert not subscription.overflowed
+    assert len(frames) == 1
+    assert b'event: reset' in frames[0]
+
+
+def test_resume_from_before_history_resets():
+    broker = AlertBroker()
+    publish(broker, 5)
+    broker._history.popleft()
+    broker._history.popleft()
+    frames = broker.subscribe(last_event_id=0).wait(0)
+    assert len(frames) == 1 and b'event: reset' in frames[0]
+
+
+def test_replay_skips_other_locations():
+    broker = AlertBroker()
+    publish(broker, 3, location='Kerala')
+    publish(broker, 2, location='Goa')
+    frames = broker.subscribe('kerala', last_event_id=0).wait(0)
+    assert event_ids(frames) == [1, 2, 3]
+
+
+def test_slow_subscriber_overflows():
+    broker = AlertBroker()
+    subscription = broker.subscribe()
+    publish(broker, MAX_PENDING + 1)
+    assert subscription.overflowed
+    assert subscription.wait(0) == []
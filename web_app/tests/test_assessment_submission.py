@@ -0,0 +1,100 @@
+import functools
+import http.client
+import secrets
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import server as server_module
+from assessment_writer import AssessmentWriter
+from idempotency import IdempotencyCache
+from models import Assessment, User
+
+
+@pytest.fixture
+def user_id(db):
+    user = db.query(User).filter_by(email='submit@example.com').first()
+    if user is None:
+        user = User(name='Submit', email='submit@example.com', mobile='0000000000',
+                    password_hash='not-a-real-hash', location='Kerala')
+        db.add(user)
+        db.commit()
+    return user.id
+
+
+@pytest.fixture
+def client(user_id):
+    """Post to a running server as user_id; returns post(body) -> (status, headers)"""
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), server_module.AdityaSetuHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    session_id = secrets.token_urlsafe(32)
+    server_module.AdityaSetuHandler.sessions[session_id] = user_id
+
+    def post(fields):
+        conn = http.client.HTTPConnection('127.0.0.1', httpd.server_port, timeout=10)
+        try:
+            conn.request('POST', '/assessment', urllib.parse.urlencode(fields), {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Cookie': f'session_id={session_id}',
+            })
+            response = conn.getresponse()
+            response.read()
+            return response.status, dict(response.getheaders())
+        finally:
+            conn.close()
+
+    yield post
+    del server_module.AdityaSetuHandler.sessions[session_id]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def slow_writer(monkeypatch):
+    """A write-behind writer that commits only once release is set, acking within 50ms"""
+    writer = AssessmentWriter(enabled=True)
+    release = threading.Event()
+    insert = writer._insert
+
+    def held_insert(batch):
+        release.wait(10)
+        return insert(batch)
+
+    writer._insert = held_insert
+    writer.write = functools.partial(writer.write, timeout=0.05)
+    monkeypatch.setattr(server_module, 'assessment_writer', writer)
+    cache = IdempotencyCache()
+    monkeypatch.setattr(server_module, 'submission_cache', cache)
+    monkeypatch.setattr(cache, 'claim', functools.partial(cache.claim, timeout=0.05))
+    yield writer, release
+    release.set()
+    writer.stop(timeout=5)
+
+
+def count(db, user_id):
+    db.expire_all()
+    return db.query(Assessment).filter_by(user_id=user_id).count()
+
+
+def test_retry_after_write_timeout_is_not_saved_twice(db, user_id, client, slow_writer):
+    writer, release = slow_writer
+    fields = {'submission_token': secrets.token_urlsafe(16), 'fever': 'yes', 'cough': 'no'}
+    before = count(db, user_id)
+
+    status, headers = client(fields)
+    assert status == 503
+    assert 'Retry-After' in headers
+
+    # The first write is still queued: the retry must not save it again
+    status, headers = client(fields)
+    assert status == 409
+    assert 'Retry-After' in headers
+
+    release.set()
+    writer.stop(timeout=5)
+    status, headers = client(fields)
+    assert (status, headers['Location']) == (302, '/dashboard')
+    assert count(db, user_id) == before + 1
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+import assessment_writer as writer_module
+from assessment_writer import AssessmentWriter, WriterBusy, WriteTimeout
+from models import Assessment, User
+
+
+@pytest.fixture
+def user_id(db):
+    user = db.query(User).filter_by(email='writer@example.com').first()
+    if user is None:
+        user = User(name='Writer', email='writer@example.com', mobile='0000000000',
+                    password_hash='not-a-real-hash', location='Kerala')
+        db.add(user)
+        db.commit()
+    return user.id
+
+
+def values(user_id):
+    return {'user_id': user_id, 'answers': {'fever': 'no'}, 'risk_score': 1.0,
+            'risk_level': 'Low', 'recommendations': 'Stay safe'}
+
+
+def count(db, user_id):
+    db.expire_all()
+    return db.query(Assessment).filter_by(user_id=user_id).count()
+
+
+def test_write_returns_committed_id(db, user_id):
+    writer = AssessmentWriter(enabled=True)
+    try:
+        assessment_id = writer.write(values(user_id), location='Kerala')
+        assert db.get(Assessment, assessment_id).user_id == user_id
+    finally:
+        writer.stop(timeout=5)
+
+
+def test_timed_out_write_still_commits_and_reports(db, user_id):
+    writer = AssessmentWriter(enabled=True)
+    resolved = threading.Event()
+    outcome = {}
+
+    def on_resolved(assessment_id, error):
+        outcome.update(id=assessment_id, error=error)
+        resolved.set()
+
+    before = count(db, user_id)
+    # Start the writer only after the request gave up waiting
+    start = writer._ensure_started
+    writer._ensure_started = lambda: None
+    with pytest.raises(WriteTimeout):
+        writer.write(values(user_id), on_resolved=on_resolved, timeout=0.05)
+    start()
+    try:
+        assert resolved.wait(5)
+        assert outcome['error'] is None
+        assert count(db, user_id) == before + 1
+    finally:
+        writer.stop(timeout=5)
+
+
+def test_full_queue_is_busy_not_timeout(monkeypatch, user_id):
+    monkeypatch.setattr(writer_module, 'MAX_QUEUED', 1)
+    writer = AssessmentWriter(enabled=True)
+    writer._ensure_started = lambda: None
+    writer._queue.put(object())
+    with pytest.raises(WriterBusy) as raised:
+        writer.write(values(user_id), timeout=0.01)
+    assert not isinstance(raised.value, WriteTimeout)
+
+
+def test_timeout_covers_queueing_and_commit(monkeypatch, user_id):
+    monkeypatch.setattr(writer_module, 'MAX_QUEUED', 1)
+    writer = AssessmentWriter(enabled=True)
+    writer._ensure_started = lambda: None
+    writer._queue.put(object())
+    # Room in the queue appears part way through the timeout
+    threading.Timer(0.3, writer._queue.get).start()
+    started = time.monotonic()
+    with pytest.raises(WriteTimeout):
+        writer.write(values(user_id), timeout=0.5)
+    assert time.monotonic() - started < 0.7
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from idempotency import IN_PROGRESS, IdempotencyCache
+
+
+def test_first_claim_does_the_work():
+    cache = IdempotencyCache()
+    assert cache.claim((1, 'token')) == (True, None)
+    assert cache.claim((2, 'token'), timeout=0) == (True, None)
+
+
+def test_repeat_gets_the_completed_result():
+    cache = IdempotencyCache()
+    cache.claim((1, 'token'))
+    cache.complete((1, 'token'), 'result')
+    assert cache.claim((1, 'token')) == (False, 'result')
+    assert cache.hits == 1
+
+
+def test_repeat_waits_for_the_request_in_flight():
+    cache = IdempotencyCache()
+    cache.claim((1, 'token'))
+    outcome = []
+    repeat = threading.Thread(target=lambda: outcome.append(cache.claim((1, 'token'), timeout=5)))
+    repeat.start()
+    time.sleep(0.05)
+    assert repeat.is_alive()
+    cache.complete((1, 'token'), 'result')
+    repeat.join(5)
+    assert outcome == [(False, 'result')]
+
+
+def test_release_lets_a_waiting_repeat_do_the_work():
+    cache = IdempotencyCache()
+    cache.claim((1, 'token'))
+    outcome = []
+    repeat = threading.Thread(target=lambda: outcome.append(cache.claim((1, 'token'), timeout=5)))
+    repeat.start()
+    time.sleep(0.05)
+    cache.release((1, 'token'))
+    repeat.join(5)
+    assert outcome == [(True, None)]
+    # The repeat now holds the key itself
+    cache.complete((1, 'token'), 'retried')
+    assert cache.claim((1, 'token')) == (False, 'retried')
+
+
+def test_repeat_is_told_to_retry_while_first_request_runs():
+    cache = IdempotencyCache()
+    cache.claim((1, 'token'))
+    started = time.monotonic()
+    assert cache.claim((1, 'token'), timeout=0.05) == (False, IN_PROGRESS)
+    assert time.monotonic() - started < 1
+    # However many repeats give up, the key stays with the first request
+    assert cache.claim((1, 'token'), timeout=0) == (False, IN_PROGRESS)
+    cache.complete((1, 'token'), 'result')
+    assert cache.claim((1, 'token'), timeout=0) == (False, 'result')
+
+
+def test_keys_expire_after_ttl():
+    cache = IdempotencyCache(ttl=0.01)
+    cache.claim((1, 'token'))
+    cache.complete((1, 'token'), 'result')
+    time.sleep(0.02)
+    assert cache.claim((1, 'token')) == (True, None)
+
+
+def test_oldest_key_is_evicted_past_max_keys():
+    cache = IdempotencyCache(max_keys=2)
+    for n in range(3):
+        cache.claim((n, 'token'))
+        cache.complete((n, 'token'), n)
+    assert cache.claim((0, 'token')) == (True, None)
+    assert cache.claim((2, 'token')) == (False, 2)
+
+
+def test_keys_in_flight_are_never_evicted():
+    cache = IdempotencyCache(max_keys=2)
+    cache.claim((0, 'token'))
+    for n in range(1, 4):
+        cache.claim((n, 'token'))
+        cache.complete((n, 'token'), n)
+    assert cache.claim((0, 'token'), timeout=0) == (False, IN_PROGRESS)
+    assert cache.claim((1, 'token'), timeout=0) == (True, None)
+
+
+def test_keys_in_flight_outlive_ttl():
+    cache = IdempotencyCache(ttl=0.01)
+    cache.claim((1, 'token'))
+    time.sleep(0.02)
+    assert cache.claim((1, 'token'), timeout=0) == (False, IN_PROGRESS)
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from jobs import claim_job, extend_lease, finish_job, requeue_expired
+from models import Job
+
+
+@pytest.fixture
+def queue(db):
+    """An empty jobs table"""
+    db.query(Job).delete()
+    db.commit()
+    return db
+
+
+def add_job(db, kind='test', **fields):
+    job = Job(kind=kind, payload={}, **fields)
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def expire_lease(db, job_id):
+    db.query(Job).filter_by(id=job_id).update({'locked_until': datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+
+def test_claim_takes_highest_priority_due_job(queue):
+    add_job(queue, priority=0)
+    high = add_job(queue, priority=10)
+    add_job(queue, priority=20, run_after=datetime.utcnow() + timedelta(hours=1))
+    job = claim_job(queue, 'worker-a')
+    assert job['id'] == high
+    assert job['status'] == 'running'
+    assert job['locked_by'] == 'worker-a'
+    assert job['attempts'] == 1
+
+
+def test_claimed_job_is_not_claimed_again(queue):
+    add_job(queue)
+    assert claim_job(queue, 'worker-a') is not None
+    assert claim_job(queue, 'worker-b') is None
+
+
+def test_finish_records_result(queue):
+    add_job(queue)
+    job = claim_job(queue, 'worker-a')
+    assert finish_job(queue, job, 'worker-a', result={'rows': 3}) == 'done'
+    row = queue.get(Job, job['id'], populate_existing=True)
+    assert row.status == 'done' and row.result == {'rows': 3} and row.locked_by is None
+
+
+def test_failure_is_retried_then_fails(queue):
+    add_job(queue, max_attempts=2)
+    job = claim_job(queue, 'worker-a')
+    assert finish_job(queue, job, 'worker-a', error='boom') == 'queued'
+    queue.query(Job).filter_by(id=job['id']).update({'run_after': datetime.utcnow()})
+    queue.commit()
+    job = claim_job(queue, 'worker-a')
+    assert job['attempts'] == 2
+    assert finish_job(queue, job, 'worker-a', error='boom again') == 'failed'
+
+
+def test_finish_after_lost_lease_changes_nothing(queue):
+    add_job(queue)
+    job = claim_job(queue, 'worker-a')
+    expire_lease(queue, job['id'])
+    assert requeue_expired(queue) == (1, 0)
+    again = claim_job(queue, 'worker-b')
+    assert again['id'] == job['id']
+    assert finish_job(queue, job, 'worker-a', result='stale') is None
+    assert not extend_lease(queue, job, 'worker-a')
+    row = queue.get(Job, job['id'], populate_existing=True)
+    assert row.status == 'running' and row.locked_by == 'worker-b'
+
+
+def test_same_worker_cannot_finish_an_earlier_attempt(queue):
+    add_job(queue)
+    first = claim_job(queue, 'worker-a')
+    expire_lease(queue, first['id'])
+    requeue_expired(queue)
+    second = claim_job(queue, 'worker-a')
+    assert finish_job(queue, first, 'worker-a', result='stale') is None
+    assert finish_job(queue, second, 'worker-a', result='ok') == 'done'
+
+
+def test_extend_lease_keeps_job_from_being_requeued(queue):
+    add_job(queue)
+    job = claim_job(queue, 'worker-a')
+    expire_lease(queue, job['id'])
+    assert extend_lease(queue, job, 'worker-a')
+    assert requeue_expired(queue) == (0, 0)
+
+
+def test_worker_renews_lease_while_handler_runs(queue, monkeypatch):
+    monkeypatch.setattr(jobs, 'HEARTBEAT_INTERVAL', 0.05)
+    seen = {}
+
+    @jobs.job_handler('test_slow')
+    def slow(payload):
+        row_id = seen['id']
+        expire_lease(queue, row_id)
+        # Long enough for a heartbeat to renew the expired lease
+        deadline = datetime.utcnow() + timedelta(seconds=2)
+        while datetime.utcnow() < deadline:
+            queue.expire_all()
+            if queue.get(Job, row_id).locked_until > datetime.utcnow():
+                break
+        seen['requeued'] = requeue_expired(queue)
+        return 'ok'
+
+    seen['id'] = add_job(queue, kind='test_slow')
+    workers = jobs.JobWorkers()
+    job = claim_job(queue, 'worker-a')
+    workers._execute(queue, job, 'worker-a')
+    assert seen['requeued'] == (0, 0)
+    assert queue.get(Job, job['id'], populate_existing=True).status == 'done'
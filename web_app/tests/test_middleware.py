@@ -0,0 +1,112 @@
+import gzip
+from email.message import Message
+
+from middleware import Response, authentication, compression, GZIP_ETAG_SUFFIX
+
+BODY = b'[' + b', '.join(b'{"id": %d}' % i for i in range(200)) + b']'
+ETAG = '"boot-7"'
+
+
+class FakeRequest:
+    def __init__(self, **headers):
+        self.headers = Message()
+        for name, value in headers.items():
+            self.headers[name.replace('_', '-')] = value
+        self.response = None
+        self.seen_if_none_match = None
+
+
+def alerts_handler(request):
+    """Answers like serve_api_alerts: 304 for a matching identity ETag"""
+    request.seen_if_none_match = request.headers.get('If-None-Match')
+    response = request.response = Response()
+    if request.seen_if_none_match == ETAG:
+        response.status = 304
+        response.headers.append(('ETag', ETAG))
+        return
+    response.status = 200
+    response.headers += [('Content-Type', 'application/json'), ('ETag', ETAG)]
+    response.body = bytearray(BODY)
+
+
+def test_gzipped_body_gets_its_own_etag():
+    request = FakeRequest(Accept_Encoding='gzip')
+    compression(request, alerts_handler)
+    response = request.response
+    assert response.get_header('Content-Encoding') == 'gzip'
+    assert response.get_header('ETag') == '"boot-7' + GZIP_ETAG_SUFFIX + '"'
+    assert gzip.decompress(bytes(response.body)) == BODY
+
+
+def test_identity_body_keeps_etag():
+    request = FakeRequest()
+    compression(request, alerts_handler)
+    assert request.response.get_header('Content-Encoding') is None
+    assert request.response.get_header('ETag') == ETAG
+
+
+def test_gzip_etag_revalidates_against_identity_etag():
+    request = FakeRequest(Accept_Encoding='gzip', If_None_Match='"boot-7' + GZIP_ETAG_SUFFIX + '"')
+    compression(request, alerts_handler)
+    assert request.seen_if_none_match == ETAG
+    assert request.response.status == 304
+    assert request.response.get_header('ETag') == '"boot-7' + GZIP_ETAG_SUFFIX + '"'
+
+
+def test_identity_etag_revalidates_unchanged():
+    request = FakeRequest(Accept_Encoding='gzip', If_None_Match=ETAG)
+    compression(request, alerts_handler)
+    assert request.response.status == 304
+    assert request.response.get_header('ETag') == ETAG
+
+
+class FakeRoute:
+    def __init__(self, auth):
+        self.auth = auth
+
+
+class SessionRequest(FakeRequest):
+    def __init__(self, auth, user=None):
+        super().__init__()
+        self.route = FakeRoute(auth)
+        self.user = None
+        self._user = user
+        self.lookups = 0
+        self.handled = False
+
+    def get_current_user(self):
+        self.lookups += 1
+        return self._user
+
+    def require_auth(self):
+        return self.get_current_user()
+
+    def require_admin(self):
+        user = self.get_current_user()
+        return user if user and user['is_admin'] else None
+
+
+def handled(request):
+    request.handled = True
+
+
+def test_public_route_does_not_look_up_the_user():
+    request = SessionRequest('public', user={'id': 1, 'is_admin': False})
+    authentication(request, handled)
+    assert request.handled
+    assert request.lookups == 0
+    assert request.user is None
+
+
+def test_user_route_resolves_the_user_once():
+    request = SessionRequest('user', user={'id': 1, 'is_admin': False})
+    authentication(request, handled)
+    assert request.handled
+    assert request.lookups == 1
+    assert request.user == {'id': 1, 'is_admin': False}
+
+
+def test_admin_route_stops_non_admins():
+    request = SessionRequest('admin', user={'id': 1, 'is_admin': False})
+    authentication(request, handled)
+    assert not request.handled
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Assessment, User, decode_cursor, encode_cursor, list_assessments_page
+
+
+@pytest.fixture
+def assessments(db):
+    """Seven assessments by one user; two share a timestamp to exercise the id tie-break"""
+    db.query(Assessment).delete()
+    user = db.query(User).filter_by(email='pages@example.com').first()
+    if user is None:
+        user = User(name='Pages', email='pages@example.com', mobile='0000000000',
+                    password_hash='not-a-real-hash')
+        db.add(user)
+        db.flush()
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    for offset in (0, 1, 2, 2, 3, 4, 5):
+        db.add(Assessment(user_id=user.id, answers={}, risk_score=1.0, risk_level='Low',
+                          created_at=start + timedelta(minutes=offset)))
+    db.commit()
+    return db
+
+
+@pytest.mark.parametrize('created_at', [
+    datetime(2024, 3, 5, 9, 30),
+    datetime(2024, 3, 5, 9, 30, 15, 123456),
+])
+def test_cursor_round_trip(created_at):
+    cursor = encode_cursor(created_at, 1234)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (created_at, 1234)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', encode_cursor(datetime(2024, 1, 1), 1)[:-3] + '!!!'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_row_once_newest_first(assessments):
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = list_assessments_page(assessments, cursor=cursor, limit=3)
+        seen.extend(row['id'] for row in page)
+        if cursor is None:
+            break
+    expected = [row.id for row in assessments.query(Assessment)
+                .order_by(Assessment.created_at.desc(), Assessment.id.desc())]
+    assert seen == expected
+    assert len(seen) == 7
+
+
+def test_last_page_has_no_cursor(assessments):
+    page, cursor = list_assessments_page(assessments, limit=7)
+    assert len(page) == 7
+    assert cursor is None
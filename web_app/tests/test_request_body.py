@@ -0,0 +1,106 @@
+import io
+
+import pytest
+
+from request_body import BodyReader, RequestBodyError, parse_form, parse_json
+
+
+def read(body, headers, max_size=1024):
+    return b''.join(BodyReader(io.BufferedReader(io.BytesIO(body)), headers, max_size=max_size))
+
+
+def chunked(*chunks, trailer=b''):
+    framed = b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks)
+    return framed + b'0\r\n' + trailer + b'\r\n'
+
+
+def test_reads_content_length_body():
+    assert read(b'name=a&x=1extra', {'Content-Length': '10'}) == b'name=a&x=1'
+
+
+def test_missing_content_length_is_empty_body():
+    assert read(b'ignored', {}) == b''
+
+
+@pytest.mark.parametrize('length', ['abc', '-1'])
+def test_invalid_content_length_is_rejected(length):
+    with pytest.raises(RequestBodyError) as error:
+        read(b'', {'Content-Length': length})
+    assert error.value.status == 400
+
+
+def test_oversized_content_length_is_refused_before_reading():
+    rfile = io.BufferedReader(io.BytesIO(b'x' * 2048))
+    with pytest.raises(RequestBodyError) as error:
+        BodyReader(rfile, {'Content-Length': '2048'}, max_size=1024)
+    assert error.value.status == 413
+    assert rfile.tell() == 0
+
+
+def test_short_body_is_rejected():
+    with pytest.raises(RequestBodyError) as error:
+        read(b'abc', {'Content-Length': '10'})
+    assert error.value.status == 400
+
+
+def test_reads_chunked_body():
+    body = chunked(b'name=', b'a&x=', b'1')
+    assert read(body, {'Transfer-Encoding': 'chunked'}) == b'name=a&x=1'
+
+
+def test_chunked_body_skips_extensions_and_trailers():
+    body = b'3;ext=1\r\nabc\r\n0\r\nX-Trailer: yes\r\n\r\n'
+    assert read(body, {'Transfer-Encoding': 'chunked'}) == b'abc'
+
+
+def test_chunked_body_over_the_limit_is_rejected():
+    body = chunked(b'x' * 600, b'x' * 600)
+    with pytest.raises(RequestBodyError) as error:
+        read(body, {'Transfer-Encoding': 'chunked'})
+    assert error.value.status == 413
+
+
+@pytest.mark.parametrize('body', [
+    b'zz\r\nabc\r\n0\r\n\r\n',       # chunk size is not hex
+    b'3\r\nabcdef\r\n0\r\n\r\n',     # chunk longer than its size
+    b'3\r\nabc\r\n0\r\n',            # no blank line after the last chunk
+    b'3\r\nab',                      # body ends inside a chunk
+])
+def test_malformed_chunked_body_is_rejected(body):
+    with pytest.raises(RequestBodyError) as error:
+        read(body, {'Transfer-Encoding': 'chunked'})
+    assert error.value.status == 400
+
+
+def test_chunked_takes_precedence_over_content_length():
+    body = chunked(b'abc')
+    headers = {'Transfer-Encoding': 'chunked', 'Content-Length': '99999'}
+    assert read(body, headers) == b'abc'
+
+
+def test_expired_deadline_times_out():
+    reader = BodyReader(io.BufferedReader(io.BytesIO(b'abc')), {'Content-Length': '3'}, timeout=0)
+    with pytest.raises(RequestBodyError) as error:
+        list(reader)
+    assert error.value.status == 408
+
+
+def test_parse_form_joins_pairs_split_across_chunks():
+    fields = parse_form([b'name=Ad', b'itya&city=Pu', b'ne&blank=&name=B'])
+    assert fields == {'name': ['Aditya', 'B'], 'city': ['Pune']}
+
+
+def test_parse_form_limits_field_count():
+    with pytest.raises(RequestBodyError) as error:
+        parse_form([b'a=1&' * 5], max_fields=3)
+    assert error.value.status == 413
+
+
+def test_parse_json_decodes_across_chunks():
+    data = '{"city": "Pune – West"}'.encode('utf-8')
+    split = data.index(b'\xe2') + 1  # inside the multi-byte dash
+    assert parse_json([data[:split], data[split:]]) == {'city': 'Pune – West'}
+
+
+def test_parse_json_empty_body_is_empty_dict():
+    assert parse_json([]) == {}
@@ -0,0 +1,79 @@
+import pytest
+
+from routing import Router
+
+
+def handler(request_handler, **params):
+    return params
+
+
+@pytest.fixture
+def router():
+    router = Router()
+    router.add('GET', '/', handler, name='home')
+    router.add('GET', '/admin/alerts/<int:alert_id>/toggle', handler, auth='admin', name='toggle_alert')
+    router.add('POST', '/admin/alerts/<int:alert_id>/toggle', handler, auth='admin', name='toggle_alert_post')
+    router.add('GET', '/static/<path:filename>', handler, name='static')
+    router.add('GET', '/export', handler, name='export_csv', defaults={'fmt': 'csv'})
+    return router
+
+
+def test_static_path_is_matched_exactly(router):
+    route, params = router.match('GET', '/')
+    assert route.name == 'home'
+    assert params == {}
+
+
+def test_int_parameter_is_converted(router):
+    route, params = router.match('GET', '/admin/alerts/42/toggle')
+    assert route.name == 'toggle_alert'
+    assert params == {'alert_id': 42}
+
+
+def test_int_parameter_rejects_non_digits(router):
+    assert router.match('GET', '/admin/alerts/abc/toggle') == (None, ())
+
+
+def test_path_parameter_takes_the_rest_of_the_path(router):
+    route, params = router.match('GET', '/static/css/site.css')
+    assert route.name == 'static'
+    assert params == {'filename': 'css/site.css'}
+
+
+@pytest.mark.parametrize('path', [
+    '/static/../models.py',
+    '/static/css/../../models.py',
+    '/static/css/..',
+    '/static/css//site.css',
+])
+def test_path_parameter_rejects_parent_and_empty_segments(router, path):
+    assert router.match('GET', path) == (None, ())
+
+
+def test_wrong_method_lists_allowed_methods(router):
+    assert router.match('DELETE', '/admin/alerts/1/toggle') == (None, ('GET', 'POST'))
+    assert router.match('POST', '/') == (None, ('GET',))
+
+
+def test_unknown_path_has_no_allowed_methods(router):
+    assert router.match('GET', '/nowhere') == (None, ())
+
+
+def test_defaults_are_passed_as_params(router):
+    route, params = router.match('GET', '/export')
+    assert params == {'fmt': 'csv'}
+
+
+def test_duplicate_route_is_rejected(router):
+    with pytest.raises(ValueError):
+        router.add('GET', '/static/<path:other>', handler)
+
+
+def test_path_parameter_must_be_last(router):
+    with pytest.raises(ValueError):
+        router.add('GET', '/files/<path:name>/raw', handler)
+
+
+def test_url_for_fills_parameters(router):
+    assert router.url_for('toggle_alert', alert_id=7) == '/admin/alerts/7/toggle'
+    assert router.url_for('missing') is None
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import (Assessment, RiskCounter, User, UserRiskSummary, get_location_risk_distribution,
+                    get_risk_analytics, rebuild_risk_counters, update_risk_stats)
+from tasks import run_rescore
+
+HIGH = {'fever': 'yes', 'shortness_breath': 'yes', 'contact_positive': 'yes'}
+LOW = {'fever': 'no'}
+
+
+@pytest.fixture
+def scored(db):
+    """Assessments stored with stale scores, counted under their stale levels"""
+    db.query(Assessment).delete()
+    db.query(RiskCounter).delete()
+    db.query(UserRiskSummary).delete()
+    users = []
+    for n, location in enumerate(('Kerala', 'Goa')):
+        user = db.query(User).filter_by(email=f'rescore{n}@example.com').first()
+        if user is None:
+            user = User(name='Rescore', email=f'rescore{n}@example.com', mobile='0000000000',
+                        password_hash='not-a-real-hash', location=location)
+            db.add(user)
+            db.flush()
+        users.append(user)
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    entries = []
+    for n, (answers, stale_level) in enumerate([(HIGH, 'Low'), (LOW, 'Low'), (LOW, 'High'),
+                                                (HIGH, 'Moderate'), (HIGH, 'High')]):
+        user = users[n % 2]
+        assessment = Assessment(user_id=user.id, answers=answers, risk_score=0.0, risk_level=stale_level,
+                                created_at=start + timedelta(days=n % 3, minutes=n))
+        db.add(assessment)
+        entries.append({'user_id': user.id, 'location': user.location, 'risk_level': stale_level,
+                        'risk_score': 0.0, 'created_at': assessment.created_at})
+    update_risk_stats(db, entries)
+    db.commit()
+    return db
+
+
+def snapshot(db):
+    db.expire_all()
+    summaries = {(row.user_id, row.risk_level, row.risk_score, row.assessed_at, row.assessment_count)
+                 for row in db.query(UserRiskSummary)}
+    days = {row.key: (row.low, row.moderate, row.high)
+            for row in db.query(RiskCounter).filter_by(scope='day')}
+    return get_risk_analytics(db), get_location_risk_distribution(db), days, summaries
+
+
+def test_rescore_keeps_counters_in_step(scored):
+    result = run_rescore({'batch_size': 2})
+    assert result == {'scanned': 5, 'changed': 4}
+    rescored = snapshot(scored)
+    assert rescored[0]['high'] == 3
+    assert rescored[0]['low'] == 2
+    rebuild_risk_counters(scored)
+    scored.commit()
+    assert snapshot(scored) == rescored
+
+
+def test_second_rescore_changes_nothing(scored):
+    run_rescore({})
+    rescored = snapshot(scored)
+    assert run_rescore({}) == {'scanned': 5, 'changed': 0}
+    assert snapshot(scored) == rescored